@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: benchmarkForcing
+# Purpose: Times and memory-profiles every forcing generator on synthetic
+#          inputs: DEMs of the given sizes, station networks of the given
+#          sizes and an hourly observation table of the given number of days.
+#          Measured are the station store and station means, detrended
+#          kriging of each variable (and of all of them in one batch), thermal
+#          radiation, precipitation properties, initial snow properties, the
+#          clear-sky terrain terms, an hour of clear-sky radiation, the solar
+#          correction and WindNinja velocity grids (with a stub solver that
+#          copies a prepared grid, so only our side of the run is timed).
+#          Generators whose modules need arcpy are skipped where it cannot be
+#          imported.
+# Input: optional --sizes, --stations, --days, --repeats, --output and
+#        --compare (an earlier output file), e.g.
+#        python benchmarkForcing.py --sizes 256 1024 8192 --stations 10 100 500
+#            --output results.json --compare baseline.json
+# Output: one line per measurement, and a JSON file with the machine, the code
+#         version and every measurement; with --compare, the measurements that
+#         got slower than the earlier file by more than --threshold
+#-------------------------------------------------------------------------------
+
+'''======Define internal functions======'''
+#synthetic n x n elevation grid (m): smooth ridges and valleys between 500 and
+#3500 m, built from row and column profiles so that large grids stay cheap
+def syntheticDem(n, cell_size=30.0):
+    random = numpy.random.RandomState(n)
+    grid = gridTools.GridSpec(500000.0, 4700000.0, cell_size, n, n)
+    position = numpy.linspace(0.0, 1.0, n)
+    elevation = numpy.full((n, n), 2000.0)
+    for k in range(1, 5):
+        rows = numpy.sin(2 * numpy.pi * (k * position + random.uniform()))
+        cols = numpy.cos(2 * numpy.pi * (k * position + random.uniform()))
+        elevation += 700.0 / k * rows[:, None] * cols[None, :]
+    return elevation, grid
+
+#synthetic station network of "n_sites" stations spread over the grid, with the
+#elevation of the cell under each station
+def syntheticStations(n_sites, elevation, grid):
+    random = numpy.random.RandomState(n_sites)
+    x = random.uniform(grid.x_min, grid.x_min + grid.n_cols * grid.cell_size, n_sites)
+    y = random.uniform(grid.y_min, gridTools.gridYMax(grid), n_sites)
+    return numpy.arange(n_sites), x, y, gridTools.sampleGrid(elevation, grid, x, y)
+
+#synthetic hourly observation table of "days" days: (site key column, time
+#column, {field: column}) with 2% of the values missing
+def syntheticObservations(site_keys, station_elevation, days):
+    random = numpy.random.RandomState(days)
+    n_hours = 24 * days
+    times = numpy.datetime64("2014-01-01T00:00:00") + numpy.arange(n_hours).astype("timedelta64[h]")
+    hour = (numpy.arange(n_hours) % 24)[:, None]
+    shape = (n_hours, len(site_keys))
+    air_temperature = 15.0 - 0.0065 * station_elevation[None, :] + 5.0 * numpy.sin(2 * numpy.pi * (hour - 9) / 24.0) + \
+        random.normal(0.0, 1.0, shape)
+    dewpoint_temperature = air_temperature - random.uniform(2.0, 8.0, shape)
+    vapor_pressure = 6.11 * 10**((7.5 * dewpoint_temperature) / (237.3 + dewpoint_temperature)) * 100
+    ppts = numpy.where(random.uniform(size=shape) < 0.1, random.exponential(1.0, shape), 0.0)
+    snow_depth = numpy.maximum(0.0, 0.001 * (station_elevation[None, :] - 1800.0) + random.normal(0.0, 0.1, shape))
+    in_solar_radiation = numpy.maximum(0.0, 900.0 * numpy.sin(2 * numpy.pi * (hour - 6) / 24.0)) * \
+        random.uniform(0.4, 1.0, shape)
+    columns = {"air_temperature": air_temperature, "dewpoint_temperature": dewpoint_temperature,
+               "vapor_pressure": vapor_pressure, "ppts": ppts, "snow_depth": snow_depth,
+               "in_solar_radiation": in_solar_radiation}
+    for field in columns:
+        columns[field] = numpy.where(random.uniform(size=shape) < 0.02, numpy.nan, columns[field]).ravel()
+    return numpy.tile(site_keys, n_hours), numpy.repeat(times, len(site_keys)), columns
+
+#best wall time of "repeats" calls and peak traced memory (MB) of one more call
+def measure(function, args, repeats):
+    times = []
+    for i in range(repeats):
+        start = time.time()
+        result = function(*args)
+        times.append(time.time() - start)
+    del result
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        del result
+    return min(times), peak
+
+#measure one generator, print it and add it to "results"
+def record(results, generator, size, stations, days, function, args, repeats):
+    seconds, peak = measure(function, args, repeats)
+    results.append({"generator": generator, "size": size, "stations": stations, "days": days,
+                    "seconds": seconds, "peak_mb": peak})
+    print("%-28s %5s %5s %4s %10.4f s  peak %s MB" % (generator, size or "-", stations or "-", days or "-",
+          seconds, "n/a" if peak is None else "%.1f" % peak))
+
+#write a stub WindNinja solver into "directory" that copies the velocity grid
+#named by the BENCHMARK_VELOCITY_GRID environment variable next to the
+#elevation file it is given. Returns the command to run it.
+def stubSolver(directory):
+    script = os.path.join(directory, "stub_ninja.py")
+    with open(script, "w") as stub:
+        stub.write("#!" + sys.executable + "\n"
+                   "import os, shutil, sys\n"
+                   "elevation_file = sys.argv[sys.argv.index('--elevation_file') + 1]\n"
+                   "shutil.copy(os.environ['BENCHMARK_VELOCITY_GRID'],\n"
+                   "            os.path.splitext(elevation_file)[0] + '_stub_vel.asc')\n")
+    if os.name == "nt":
+        command = os.path.join(directory, "stub_ninja.bat")
+        with open(command, "w") as batch:
+            batch.write('@"%s" "%s" %%*\n' % (sys.executable, script))
+        return command
+    os.chmod(script, 0o755)
+    return script
+
+#write the velocity grid the stub solver copies for "grid" (an ESRI ASCII grid)
+def velocityGrid(directory, grid):
+    path = os.path.join(directory, "velocity_%d.asc" % grid.n_rows)
+    header = "ncols %d\nnrows %d\nxllcorner %r\nyllcorner %r\ncellsize %r\nNODATA_value -9999" % \
+        (grid.n_cols, grid.n_rows, grid.x_min, grid.y_min, grid.cell_size)
+    velocity = 2.0 + numpy.random.RandomState(0).uniform(0.0, 6.0, (grid.n_rows, grid.n_cols))
+    numpy.savetxt(path, velocity, fmt="%.2f", header=header, comments="")
+    return path
+
+#version of the scripts being measured (the git commit if there is one)
+def codeVersion():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=SCRIPTS_DIR,
+                                       stderr=subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#print the measurements that are slower than in "baseline" by more than
+#"threshold" (a fraction)
+def compare(results, baseline, threshold):
+    previous = dict(((r["generator"], r["size"], r["stations"], r["days"]), r["seconds"])
+                    for r in baseline["results"])
+    slower = 0
+    for r in results:
+        before = previous.get((r["generator"], r["size"], r["stations"], r["days"]))
+        if before and r["seconds"] > before * (1 + threshold):
+            slower += 1
+            print("SLOWER %-28s %5s %5s %4s %10.4f s (was %.4f s, %+.0f%%)" %
+                  (r["generator"], r["size"] or "-", r["stations"] or "-", r["days"] or "-", r["seconds"], before,
+                   100.0 * (r["seconds"] / before - 1)))
+    print("%d of %d measurements slower than %s by more than %.0f%%" %
+          (slower, len(results), baseline.get("version") or "the baseline", 100 * threshold))
+
+
+
+'''==== start script ======'''
+#Import necessary modules
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SCRIPTS_DIR)
+import clearSky
+import detrendedKriging
+import gridTools
+import precipitationProperties
+import snowProperties
+import stationData
+import thermalRadiation
+
+#generators that need arcpy (imported by their modules)
+try:
+    import solarRadiation
+    import windNinja
+except ImportError as error:
+    print("solar correction and wind skipped: " + str(error))
+    solarRadiation = None
+    windNinja = None
+
+parser = argparse.ArgumentParser(description="Benchmark the forcing generators on synthetic inputs")
+parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024], help="DEM cells per side")
+parser.add_argument("--stations", type=int, nargs="+", default=[10, 100, 500], help="stations per network")
+parser.add_argument("--days", type=int, default=7, help="days of hourly observations")
+parser.add_argument("--repeats", type=int, default=3, help="timed calls per measurement (the best is kept)")
+parser.add_argument("--output", default="benchmark_forcing.json", help="JSON file the results are written to")
+parser.add_argument("--compare", help="earlier JSON results to compare with")
+parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported by --compare (fraction)")
+options = parser.parse_args()
+
+results = []
+work_dir = tempfile.mkdtemp(prefix="benchmark_")
+try:
+    date_time = datetime.datetime(2014, 6, 1, 12)
+    for size in options.sizes:
+        elevation, grid = syntheticDem(size)
+
+        #generators of the grid alone
+        inputs = (elevation, numpy.full(elevation.shape, 0.8), 15.0 - 0.0065 * (elevation - 1000.0),
+                  numpy.full(elevation.shape, 8.0), 1013.0, 10.0, 1000.0, -2.0)
+        record(results, "thermal_radiation", size, None, None, thermalRadiation.thermalRadiation, inputs,
+               options.repeats)
+        record(results, "precipitation_properties", size, None, None, precipitationProperties.classifyDewpoint,
+               (inputs[2] - 5.0,), options.repeats)
+        record(results, "snow_properties", size, None, None, snowProperties.snowProperties, (elevation,),
+               options.repeats)
+        del inputs
+        record(results, "clear_sky_terrain", size, None, None, clearSky.terrainIndex,
+               (elevation, grid, 43.5, -116.0), 1)
+        terrain = clearSky.terrainIndex(elevation, grid, 43.5, -116.0)
+        record(results, "clear_sky_hour", size, None, None, clearSky.clearSkyRadiation,
+               (terrain, elevation, date_time), options.repeats)
+
+        if windNinja is not None:
+            os.environ[windNinja.NINJA_ENVIRONMENT_VARIABLE] = stubSolver(work_dir)
+            os.environ["BENCHMARK_VELOCITY_GRID"] = velocityGrid(work_dir, grid)
+            ninja_dir = tempfile.mkdtemp(dir=work_dir)
+            ninja_elevation = os.path.join(ninja_dir, "elevation.tif")
+            open(ninja_elevation, "w").close()
+            record(results, "wind_velocity", size, None, None, windNinja.solveVelocity,
+                   (windNinja.findNinja(), ninja_elevation, date_time, ninja_elevation, grid, 1,
+                    lambda line: None), options.repeats)
+            os.remove(os.environ["BENCHMARK_VELOCITY_GRID"])
+
+        #generators of the grid and a station network
+        simulated = clearSky.clearSkyRadiation(terrain, elevation, date_time)
+        del terrain
+        for n_sites in options.stations:
+            site_keys, x, y, station_elevation = syntheticStations(n_sites, elevation, grid)
+            site_column, time_column, columns = syntheticObservations(site_keys, station_elevation, options.days)
+            if size == options.sizes[0]:
+                record(results, "station_store", None, n_sites, options.days, stationData.buildStore,
+                       (site_column, time_column, columns), options.repeats)
+            store = stationData.buildStore(site_column, time_column, columns)
+            if size == options.sizes[0]:
+                record(results, "station_means", None, n_sites, options.days, stationData.stationMeans,
+                       (store, site_keys), options.repeats)
+            means = stationData.stationMeans(store, site_keys)
+            del site_column, time_column, columns, store
+
+            for field, output_name in detrendedKriging.KRIGED_VARIABLES.items():
+                record(results, "kriging_" + output_name, size, n_sites, options.days,
+                       detrendedKriging.detrendedKriging, (x, y, means[field], elevation, grid), options.repeats)
+            record(results, "kriging_batch", size, n_sites, options.days, detrendedKriging.krigeForcingVariables,
+                   (x, y, dict((field, means[field]) for field in detrendedKriging.KRIGED_VARIABLES), elevation,
+                    grid), options.repeats)
+            if solarRadiation is not None:
+                for method in solarRadiation.CORRECTION_METHODS:
+                    record(results, "solar_correction_" + method, size, n_sites, options.days,
+                           solarRadiation.correctedRadiation,
+                           (simulated, grid, x, y, means["in_solar_radiation"], method), options.repeats)
+                    detrendedKriging.clearWeightCache()
+        del elevation, simulated
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+#save the results with what they were measured on
+output = {"version": codeVersion(), "date": datetime.datetime.now().isoformat(),
+          "python": platform.python_version(), "numpy": numpy.__version__, "platform": platform.platform(),
+          "cpu_count": multiprocessing.cpu_count(),
+          "numexpr": thermalRadiation.numexpr is not None, "results": results}
+with open(options.output, "w") as output_file:
+    json.dump(output, output_file, indent=1)
+print("Results written to " + options.output)
+
+if options.compare:
+    with open(options.compare) as baseline_file:
+        compare(results, json.load(baseline_file), options.threshold)
+'''==== end script ======'''
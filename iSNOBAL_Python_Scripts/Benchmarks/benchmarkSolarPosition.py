@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: benchmarkSolarPosition
+# Purpose: Compares the wall time of one vectorized solarPosition.sunPosition
+#          call for every station at every hour with computing the points one
+#          at a time, and checks the hour angle against the ephem-based
+#          hour_angle() of temp2.py (ported below, since temp2.py only runs
+#          under Python 2; needs ephem, skipped if it cannot be imported) for
+#          a sample of points.
+# Input: optional number of stations and hours, e.g.
+#        python benchmarkSolarPosition.py 50 8760
+# Output: timings and the largest hour angle difference
+#-------------------------------------------------------------------------------
+
+'''======Define internal functions======'''
+#synthetic station network (southern Idaho) and hourly timestamps of a year
+def syntheticPoints(n_stations, n_hours):
+    random = numpy.random.RandomState(0)
+    longitude = random.uniform(-117.0, -111.0, n_stations)
+    latitude = random.uniform(42.0, 45.0, n_stations)
+    elevation = random.uniform(1000.0, 3000.0, n_stations)
+    start = datetime.datetime(2014, 1, 1)
+    date_times = [start + datetime.timedelta(hours=h) for h in range(n_hours)]
+    return longitude, latitude, elevation, date_times
+
+#hour angle difference (degrees, wrapped to [-180, 180))
+def angleDifference(a, b):
+    return (a - b + 180.0) % 360.0 - 180.0
+
+#hour angle (degrees) of the sun at a UTC datetime, as computed by hour_angle()
+#of temp2.py: the right ascension of the sun from ephem subtracted from the
+#local sidereal time (Meeus, Astronomical Algorithms, ch. 12 and 13)
+def referenceHourAngle(dt, longit, latit, elev):
+    obs = ephem.Observer()
+    obs.date = dt.strftime('%Y/%m/%d %H:%M:%S')
+    obs.lon = longit
+    obs.lat = latit
+    obs.elevation = elev
+    sun = ephem.Sun()
+    sun.compute(obs)
+    ra = ephem.degrees(sun.g_ra)
+    jd = ephem.julian_date(dt)
+    t = (jd - 2451545.0) / 36525
+    theta = 280.46061837 + 360.98564736629 * (jd - 2451545) \
+            + .000387933 * t**2 - t**3 / 38710000
+    return (theta + longit - ra * 180 / ephem.pi) % 360
+
+
+
+'''==== start script ======'''
+#Import necessary modules
+import datetime
+import os
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import solarPosition
+
+n_stations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+n_hours = int(sys.argv[2]) if len(sys.argv) > 2 else 8760
+longitude, latitude, elevation, date_times = syntheticPoints(n_stations, n_hours)
+
+#every station at every hour in one call
+start = time.time()
+sun = solarPosition.sunPosition(numpy.array(date_times, dtype="datetime64[s]")[:, None], longitude, latitude)
+vectorized_time = time.time() - start
+
+#one point at a time (timed on a sample and scaled to every point)
+sample = [(h, s) for h in range(0, n_hours, max(1, n_hours // 200)) for s in range(n_stations)][:2000]
+start = time.time()
+for h, s in sample:
+    point = solarPosition.sunPosition(date_times[h], longitude[s], latitude[s])
+    assert abs(point.zenith - sun.zenith[h, s]) < 1e-9
+loop_time = (time.time() - start) / len(sample) * n_hours * n_stations
+
+print("%d stations x %d hours" % (n_stations, n_hours))
+print("vectorized        %8.3f s" % vectorized_time)
+print("point by point    %8.3f s (estimated from %d points)" % (loop_time, len(sample)))
+
+#accuracy check against temp2.hour_angle (UTC timestamps, angle 0 at solar noon)
+try:
+    import ephem
+except ImportError as error:
+    print("hour_angle() check skipped: " + str(error))
+    ephem = None
+
+if ephem is not None:
+    check = sample[::10]
+    utc_offset = datetime.timedelta(hours=-solarPosition.UTC_OFFSET)
+    start = time.time()
+    reference = numpy.array([referenceHourAngle(date_times[h] + utc_offset, longitude[s], latitude[s], elevation[s])
+                             for h, s in check])
+    ephem_time = (time.time() - start) / len(check) * n_hours * n_stations
+    ours = numpy.array([numpy.degrees(sun.hour_angle[h, s]) for h, s in check]) % 360.0
+    difference = numpy.abs(angleDifference(ours, reference))
+    print("hour_angle()      %8.3f s (estimated from %d points)" % (ephem_time, len(check)))
+    print("hour angle difference: max %.3f deg (%.1f min of time), mean %.3f deg" %
+          (difference.max(), difference.max() * 4, difference.mean()))
+'''==== end script ======'''
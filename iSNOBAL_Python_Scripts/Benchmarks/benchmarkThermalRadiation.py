@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: benchmarkThermalRadiation
+# Purpose: Compares wall time and peak memory of the fused thermal radiation
+#          kernel (thermalRadiation) with the step-by-step chain
+#          (thermalRadiationChain) on synthetic grids, and checks that both
+#          give the same radiation.
+# Input: optional grid sizes (cells per side), e.g.
+#        python benchmarkThermalRadiation.py 512 2048
+# Output: one line per grid size and implementation
+#-------------------------------------------------------------------------------
+
+'''======Define internal functions======'''
+#synthetic inputs of an n x n grid
+def syntheticInputs(n):
+    random = numpy.random.RandomState(0)
+    z = random.uniform(1000.0, 3500.0, (n, n))
+    vf = random.uniform(0.5, 1.0, (n, n))
+    T_a = 15.0 - 0.0065 * (z - 1000.0) + random.normal(0.0, 1.0, (n, n))
+    vp = random.uniform(1.0, 15.0, (n, n))
+    return z, vf, T_a, vp
+
+#best wall time of "repeats" calls and peak traced memory (MB) of one call
+def measure(function, args, repeats=3):
+    times = []
+    for i in range(repeats):
+        start = time.time()
+        result = function(*args)
+        times.append(time.time() - start)
+    del result
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return min(times), peak
+
+
+
+'''==== start script ======'''
+#Import necessary modules
+import os
+import sys
+import time
+import numpy
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import thermalRadiation
+
+sizes = [int(arg) for arg in sys.argv[1:]] or [512, 1024, 2048]
+scalars = (1013.0, 10.0, 1000.0, -2.0)
+fused_kernel = "fused (numexpr)" if thermalRadiation.numexpr is not None else "fused (numpy)"
+
+for n in sizes:
+    inputs = syntheticInputs(n)
+    args = inputs + scalars
+
+    chain = thermalRadiation.thermalRadiationChain(*args)
+    fused = thermalRadiation.thermalRadiation(*args)
+    error = numpy.max(numpy.abs(fused - chain) / numpy.abs(chain))
+    del chain, fused
+
+    for name, function in [("chain", thermalRadiation.thermalRadiationChain),
+                           (fused_kernel, thermalRadiation.thermalRadiation)]:
+        wall_time, peak = measure(function, args)
+        print("%5d x %-5d %-16s %8.3f s  peak %s MB" % (n, n, name, wall_time,
+              "n/a" if peak is None else "%.1f" % peak))
+    print("%5d x %-5d max relative difference %.2e" % (n, n, error))
+'''==== end script ======'''
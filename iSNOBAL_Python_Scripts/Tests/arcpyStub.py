@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: arcpyStub
+# Purpose: Stand-in for the arcpy messages of the modules under test, so the
+#          tests run without ArcGIS. Importing it puts the scripts folder on
+#          the path and, if arcpy cannot be imported, installs a module named
+#          arcpy whose message functions do nothing.
+# Input: none (imported by the tests)
+# Output: none
+# Used in: 1- testWindCache
+#          2- testDetrendedKriging
+#          3- testStationData
+#          4- testIpwImage
+#          5- testPrecipitationProperties
+#          6- testBuildManifest
+#          7- testRobustRegression
+#          8- testTrendSeries
+#          9- testPipeline
+#
+# Note: recordWarnings replaces arcpy.AddWarning for one test (with ArcGIS as
+#       well as with the stub), so a test can check what it was warned about.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+try:
+    import arcpy
+except ImportError:
+    arcpy = sys.modules["arcpy"] = types.ModuleType("arcpy")
+    arcpy.AddMessage = lambda message: None
+    arcpy.AddWarning = lambda message: None
+
+'''======Define internal functions======'''
+#list the messages of arcpy.AddWarning until the end of a test
+def recordWarnings(test_case):
+    warnings = []
+    add_warning = arcpy.AddWarning
+    arcpy.AddWarning = warnings.append
+    test_case.addCleanup(setattr, arcpy, "AddWarning", add_warning)
+    return warnings
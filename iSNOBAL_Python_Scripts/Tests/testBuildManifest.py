@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testBuildManifest
+# Purpose: Checks the build manifest: an output is fresh only while it is
+#          recorded with the key of its current inputs, the entries survive a
+#          save and reopen, input keys change with the values, dtype or code
+#          they are made from (and not with the NaN payload or the order of a
+#          dict), and the manifest of a geodatabase sits beside it.
+# Input: none, e.g.
+#        python testBuildManifest.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+#arcpyStub puts the scripts folder on the path
+import arcpyStub
+import buildManifest
+
+'''======Define internal functions======'''
+class BuildManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="build_manifest_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def testManifestPath(self):
+        self.assertEqual(buildManifest.manifestPath(self.directory),
+                         os.path.join(self.directory, buildManifest.MANIFEST_NAME))
+        geodatabase = os.path.join(self.directory, "outputs.gdb")
+        self.assertEqual(buildManifest.manifestPath(geodatabase + os.sep),
+                         os.path.join(self.directory, "outputs_" + buildManifest.MANIFEST_NAME))
+        self.assertEqual(buildManifest.manifestPath(geodatabase, "trend_fits.jsonl"),
+                         os.path.join(self.directory, "outputs_trend_fits.jsonl"))
+
+    def testFreshness(self):
+        path = buildManifest.manifestPath(self.directory)
+        manifest = buildManifest.openManifest(path)
+        self.assertEqual(manifest.entries, {})
+        key = buildManifest.inputKey(numpy.arange(4.0), "ols", datetime.datetime(2014, 1, 10, 12))
+        self.assertFalse(buildManifest.isFresh(manifest, "air_temperature", key))
+        buildManifest.record(manifest, "air_temperature", key)
+        self.assertTrue(buildManifest.isFresh(manifest, "air_temperature", key))
+
+        buildManifest.saveManifest(manifest)
+        self.assertEqual(os.listdir(self.directory), [buildManifest.MANIFEST_NAME])
+        reopened = buildManifest.openManifest(path)
+        self.assertTrue(buildManifest.isFresh(reopened, "air_temperature", key))
+        self.assertFalse(buildManifest.isFresh(reopened, "dewpoint_temperature", key))
+        changed = buildManifest.inputKey(numpy.arange(4.0), "huber", datetime.datetime(2014, 1, 10, 12))
+        self.assertFalse(buildManifest.isFresh(reopened, "air_temperature", changed))
+
+    def testInputKey(self):
+        values = numpy.array([1.0, numpy.nan, 3.0])
+        key = buildManifest.inputKey(values, {"a": 1, "b": [2, 3]})
+        self.assertEqual(key, buildManifest.inputKey(values.copy(), collections.OrderedDict([("b", [2, 3]),
+                                                                                            ("a", 1)])))
+        other_nan = values.copy()
+        other_nan[1] = -numpy.nan
+        self.assertEqual(key, buildManifest.inputKey(other_nan, {"a": 1, "b": [2, 3]}))
+        self.assertNotEqual(key, buildManifest.inputKey(numpy.array([1.0, numpy.nan, 4.0]), {"a": 1, "b": [2, 3]}))
+        self.assertNotEqual(key, buildManifest.inputKey(values.astype(numpy.float32), {"a": 1, "b": [2, 3]}))
+        self.assertNotEqual(key, buildManifest.inputKey(values, {"a": 1, "b": (2, 3)}))
+
+    def testCodeVersion(self):
+        source = os.path.join(self.directory, "stage.py")
+        with open(source, "w") as source_file:
+            source_file.write("x = 1\n")
+        version = buildManifest.codeVersion([source])
+        self.assertEqual(version, buildManifest.codeVersion([source + "c"]))
+        with open(source, "w") as source_file:
+            source_file.write("x = 2\n")
+        self.assertNotEqual(version, buildManifest.codeVersion([source]))
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
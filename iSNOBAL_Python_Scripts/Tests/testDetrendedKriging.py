@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testDetrendedKriging
+# Purpose: Checks the in-memory detrended kriging engine: the kriged surface
+#          passes through the stations, a pure elevation trend is reproduced,
+#          the cached weights and small kriging blocks give the same grid as
+#          the dual-form solve, and hours with too few reporting stations give
+#          no-data grids (or the trend alone) with a warning instead of an
+#          error.
+# Input: none, e.g.
+#        python testDetrendedKriging.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import unittest
+import warnings
+import numpy
+
+#detrendedKriging only uses arcpy for its warnings, so the test runs without ArcGIS
+import arcpyStub
+import detrendedKriging
+import gridTools
+import robustRegression
+
+'''======Define internal functions======'''
+#6 x 8 grid of 100 m cells with elevations rising to the north east
+GRID = gridTools.GridSpec(0.0, 0.0, 100.0, 6, 8)
+ELEVATION = 1500.0 + 20.0 * numpy.arange(GRID.n_cols)[None, :] + 30.0 * numpy.arange(GRID.n_rows)[::-1, None]
+
+#stations at the centers of five cells (row, column)
+STATION_CELLS = [(0, 0), (1, 5), (3, 2), (4, 7), (5, 3)]
+
+class DetrendedKrigingTest(unittest.TestCase):
+    def setUp(self):
+        self.row = numpy.array([cell[0] for cell in STATION_CELLS])
+        self.col = numpy.array([cell[1] for cell in STATION_CELLS])
+        self.x = gridTools.columnCenters(GRID)[self.col]
+        self.y = gridTools.rowCenters(GRID)[self.row]
+        self.station_elevation = ELEVATION[self.row, self.col]
+        self.values = numpy.array([4.0, -1.0, 2.5, 0.5, 3.0])
+        self.warnings = arcpyStub.recordWarnings(self)
+        detrendedKriging.clearWeightCache()
+
+    def testSurfacePassesThroughStations(self):
+        result = detrendedKriging.detrendedKriging(self.x, self.y, self.values, ELEVATION, GRID)
+        numpy.testing.assert_allclose(result.surface[self.row, self.col], self.values, atol=1e-9)
+        numpy.testing.assert_allclose(result.station_elevation, self.station_elevation)
+
+    def testElevationTrendReproduced(self):
+        values = 20.0 - 0.0065 * self.station_elevation
+        result = detrendedKriging.detrendedKriging(self.x, self.y, values, ELEVATION, GRID)
+        self.assertAlmostEqual(result.slope, -0.0065)
+        self.assertAlmostEqual(result.r_value, -1.0)
+        numpy.testing.assert_allclose(result.surface, 20.0 - 0.0065 * ELEVATION, atol=1e-9)
+
+    def testCachedWeightsAndBlocksMatch(self):
+        residual = numpy.column_stack([self.values, self.values[::-1]])
+        expected = detrendedKriging.krigeResiduals(self.x, self.y, residual, GRID)
+        cached = detrendedKriging.krigeResiduals(self.x, self.y, residual, GRID, use_cache=True)
+        numpy.testing.assert_allclose(cached, expected, atol=1e-5)
+
+        block_bytes = detrendedKriging.BLOCK_BYTES
+        detrendedKriging.BLOCK_BYTES = 8 * GRID.n_cols * len(self.x)
+        try:
+            blocked = detrendedKriging.krigeResiduals(self.x, self.y, residual, GRID)
+        finally:
+            detrendedKriging.BLOCK_BYTES = block_bytes
+        numpy.testing.assert_allclose(blocked, expected, atol=1e-12)
+
+    def testNoStationsGivesNoData(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            result = detrendedKriging.detrendedKriging(self.x, self.y, numpy.full(5, numpy.nan), ELEVATION, GRID)
+        self.assertTrue(numpy.all(numpy.isnan(result.surface)))
+        self.assertEqual(len(self.warnings), 1)
+
+    def testOneStationGivesNoData(self):
+        values = numpy.array([numpy.nan, numpy.nan, 2.5, numpy.nan, numpy.nan])
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            result = detrendedKriging.detrendedKriging(self.x, self.y, values, ELEVATION, GRID)
+        self.assertTrue(numpy.all(numpy.isnan(result.surface)))
+        self.assertTrue(numpy.all(numpy.isnan(result.model.coefficients)))
+        self.assertEqual(len(self.warnings), 1)
+
+    def testGivenTrendWithoutStationsIsTrendAlone(self):
+        model = robustRegression.TrendModel("ols", numpy.array([20.0, -0.0065]), [])
+        fits = detrendedKriging.fitTrends({"value": numpy.full(5, numpy.nan)}, self.station_elevation,
+                                          models={"value": model})
+        result = detrendedKriging.detrendedKrigingBatch(self.x, self.y, {"value": numpy.full(5, numpy.nan)},
+                                                        ELEVATION, GRID, fits=fits)["value"]
+        numpy.testing.assert_allclose(result.surface, 20.0 - 0.0065 * ELEVATION)
+        self.assertEqual(len(self.warnings), 1)
+
+    def testOtherVariablesUnaffected(self):
+        results = detrendedKriging.detrendedKrigingBatch(self.x, self.y,
+                                                         {"reported": self.values,
+                                                          "missing": numpy.full(5, numpy.nan)},
+                                                         ELEVATION, GRID)
+        numpy.testing.assert_allclose(results["reported"].surface[self.row, self.col], self.values, atol=1e-9)
+        self.assertTrue(numpy.all(numpy.isnan(results["missing"].surface)))
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
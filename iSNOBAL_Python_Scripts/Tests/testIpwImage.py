@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testIpwImage
+# Purpose: Checks the IPW images written for iSNOBAL: the header's image size,
+#          band storage, geo and lq sections, the linear quantization of each
+#          band over its range, and the pixel bytes after the header
+#          (little-endian, band-interleaved by pixel, "no-data" at the band
+#          minimum).
+# Input: none, e.g.
+#        python testIpwImage.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+#arcpyStub puts the scripts folder on the path
+import arcpyStub
+import gridTools
+import ipwImage
+
+'''======Define internal functions======'''
+#2 x 3 grid of 30 m cells
+GRID = gridTools.GridSpec(500000.0, 4800000.0, 30.0, 2, 3)
+
+class IpwImageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ipw_image_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    #header lines of an image file and the bytes after the header
+    def readImage(self, path):
+        with open(path, "rb") as image:
+            contents = image.read()
+        end = contents.index(b"\f\n") + 2
+        return contents[:end].decode("ascii").split("\n"), contents[end:]
+
+    def testHeader(self):
+        lines = ipwImage.ipwHeader(GRID, [(0.0, 1.0), (-2.0, 3.5)], 16).decode("ascii").split("\n")
+        self.assertEqual(lines[:5], ["!<header> basic_image_i -1 $Revision: 1.11 $", "byteorder = 0123 ",
+                                     "nlines = 2 ", "nsamps = 3 ", "nbands = 2 "])
+        self.assertEqual(lines.count("bytes = 2 "), 2)
+        self.assertEqual(lines.count("bits = 16 "), 2)
+        self.assertEqual(lines.count("bline = %r " % (4800000.0 + 45.0)), 2)
+        self.assertEqual(lines.count("bsamp = %r " % 500015.0), 2)
+        self.assertEqual(lines.count("dline = %r " % -30.0), 2)
+        self.assertIn("map = 0 -2.0 ", lines)
+        self.assertIn("map = 65535 3.5 ", lines)
+        self.assertEqual(lines[-3:], ["!<header> image -1 $Revision: 1.5 $", "\f", ""])
+
+    def testBandBytes(self):
+        self.assertEqual(ipwImage.bandBytes(8), 1)
+        self.assertEqual(ipwImage.bandBytes(12), 2)
+        self.assertRaises(ValueError, ipwImage.bandBytes, 0)
+        self.assertRaises(ValueError, ipwImage.bandBytes, 17)
+
+    def testQuantize(self):
+        values, band_range = ipwImage.quantize([[1.0, 2.0, numpy.nan], [3.0, 4.0, 5.0]], 8)
+        self.assertEqual(band_range, (1.0, 5.0))
+        self.assertEqual(values.dtype, numpy.dtype("<u1"))
+        numpy.testing.assert_array_equal(values, [[0, 64, 0], [128, 191, 255]])
+        values, band_range = ipwImage.quantize(numpy.full((2, 2), 7.0), 16)
+        self.assertEqual(band_range, (7.0, 8.0))
+        numpy.testing.assert_array_equal(values, 0)
+
+    def testPixelLayout(self):
+        first = numpy.array([[0.0, 1.0, 2.0], [3.0, numpy.nan, 6.0]])
+        second = numpy.array([[10.0, 20.0, 30.0], [40.0, 50.0, 60.0]])
+        path = ipwImage.writeImage(os.path.join(self.directory, "in.0000"), [first, second], GRID, 16)
+        lines, pixels = self.readImage(path)
+        self.assertIn("nbands = 2 ", lines)
+        self.assertEqual(len(pixels), GRID.n_rows * GRID.n_cols * 2 * 2)
+        pixels = numpy.frombuffer(pixels, dtype="<u2").reshape(GRID.n_rows, GRID.n_cols, 2)
+        numpy.testing.assert_array_equal(pixels[:, :, 0], ipwImage.quantize(first, 16)[0])
+        numpy.testing.assert_array_equal(pixels[:, :, 1], ipwImage.quantize(second, 16)[0])
+        self.assertEqual(pixels[0, 0].tolist(), [0, 0])
+        self.assertEqual(pixels[1, 1].tolist(), [0, 52428])
+        self.assertEqual(pixels[1, 2].tolist(), [65535, 65535])
+
+    def testInputAndPrecipitationImages(self):
+        band = numpy.arange(6.0).reshape(2, 3)
+        path = ipwImage.writeInputImage(self.directory, 7, GRID, band, band, band, band, band, bits=8)
+        self.assertEqual(os.path.basename(path), "in.0007")
+        lines, pixels = self.readImage(path)
+        self.assertIn("nbands = 5 ", lines)
+        self.assertEqual(len(pixels), GRID.n_rows * GRID.n_cols * 5)
+        path = ipwImage.writePrecipitationImage(self.directory, 7, GRID, band, band, band, band)
+        self.assertEqual(os.path.basename(path), "ppt.4b_0007")
+        self.assertIn("nbands = 4 ", self.readImage(path)[0])
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testPipeline
+# Purpose: Checks the stage runner: stages run after the stages they depend
+#          on, only the stages needed for the wanted outputs run, every output
+#          is passed to on_output, and missing inputs, outputs produced twice,
+#          cycles and failing stages are reported.
+# Input: none, e.g.
+#        python testPipeline.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import unittest
+
+#arcpyStub puts the scripts folder on the path
+import arcpyStub
+import pipeline
+
+'''======Define internal functions======'''
+#stages of a small chain: a -> b -> d and a -> c -> d, with e apart
+def stages(calls):
+    def stage(name, inputs, outputs, function):
+        def run(**arguments):
+            calls.append(name)
+            return function(**arguments)
+        return pipeline.Stage(name, run, inputs, outputs)
+    return [stage("d", ["b", "c"], ["d"], lambda b, c: {"d": b + c}),
+            stage("b", ["a"], ["b"], lambda a: {"b": 2 * a}),
+            stage("c", ["a"], ["c"], lambda a: {"c": a + 1}),
+            stage("e", ["x"], ["e"], lambda x: {"e": -x})]
+
+class PipelineTest(unittest.TestCase):
+    def testStageOrder(self):
+        order = [stage.name for stage in pipeline.stageOrder(stages([]), {"a": 1, "x": 2})]
+        self.assertEqual(sorted(order), ["b", "c", "d", "e"])
+        self.assertGreater(order.index("d"), max(order.index("b"), order.index("c")))
+
+    def testRequiredStages(self):
+        self.assertEqual([stage.name for stage in pipeline.requiredStages(stages([]), ["c"])], ["c"])
+        self.assertEqual([stage.name for stage in pipeline.requiredStages(stages([]), ["d"])], ["d", "b", "c"])
+        self.assertEqual(len(pipeline.requiredStages(stages([]))), 4)
+
+    def testRunPipeline(self):
+        calls = []
+        outputs = []
+        values = pipeline.runPipeline(stages(calls), {"a": 3, "x": 1}, jobs=2,
+                                      on_output=lambda name, value: outputs.append((name, value)))
+        self.assertEqual((values["b"], values["c"], values["d"], values["e"]), (6, 4, 10, -1))
+        self.assertEqual(sorted(outputs), [("b", 6), ("c", 4), ("d", 10), ("e", -1)])
+        self.assertGreater(calls.index("d"), max(calls.index("b"), calls.index("c")))
+
+    def testWantedOnly(self):
+        calls = []
+        values = pipeline.runPipeline(stages(calls), {"a": 3}, jobs=2, wanted=["c"])
+        self.assertEqual(calls, ["c"])
+        self.assertEqual(values, {"a": 3, "c": 4})
+
+    def testInvalidStages(self):
+        self.assertRaises(ValueError, pipeline.stageOrder, stages([]), {"a": 1})
+        self.assertRaises(ValueError, pipeline.stageOrder, stages([]), {"a": 1, "x": 2, "b": 0})
+        cycle = [pipeline.Stage("p", None, ["q"], ["p"]), pipeline.Stage("q", None, ["p"], ["q"])]
+        self.assertRaises(ValueError, pipeline.stageOrder, cycle, {})
+
+    def testFailingStage(self):
+        failing = stages([]) + [pipeline.Stage("f", lambda d: {}, ["d"], ["f"])]
+        self.assertRaises(RuntimeError, pipeline.runPipeline, failing, {"a": 3, "x": 1}, 2)
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
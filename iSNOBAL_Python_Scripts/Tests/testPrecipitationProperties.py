@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testPrecipitationProperties
+# Purpose: Checks the dew-point lookup table of precipitationProperties
+#          against the nested Con bins of the original
+#          createPrecipitationPropertiesRasters, at every breakpoint, between
+#          the breakpoints and for "no-data" cells, and that a table is built
+#          from rows in any order.
+# Input: none, e.g.
+#        python testPrecipitationProperties.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import unittest
+import numpy
+
+#arcpyStub puts the scripts folder on the path
+import arcpyStub
+import precipitationProperties
+
+'''======Define internal functions======'''
+#bins of the original tool: (lower bound, upper bound, percent snow, snow
+#density), each holding lower <= dew point < upper
+CON_BINS = [(-numpy.inf, -5.0, 1.0, 75.0),
+            (-5.0, -3.0, 1.0, 100.0),
+            (-3.0, -1.5, 1.0, 150.0),
+            (-1.5, -0.5, 1.0, 175.0),
+            (-0.5, 0.0, 0.75, 200.0),
+            (0.0, 0.5, 0.25, 250.0),
+            (0.5, numpy.inf, 0.0, 0.0)]
+
+#percent snow and snow density of the original tool's nested Con statements
+#(cells in no bin, i.e. "no-data", stay numpy.nan)
+def conBins(dewpoint):
+    percent_snow = numpy.full(dewpoint.shape, numpy.nan)
+    snow_density = numpy.full(dewpoint.shape, numpy.nan)
+    for lower, upper, bin_percent_snow, bin_snow_density in CON_BINS:
+        with numpy.errstate(invalid="ignore"):
+            in_bin = (dewpoint >= lower) & (dewpoint < upper)
+        percent_snow[in_bin] = bin_percent_snow
+        snow_density[in_bin] = bin_snow_density
+    return percent_snow, snow_density
+
+class PrecipitationPropertiesTest(unittest.TestCase):
+    def testMatchesConBins(self):
+        breakpoints = numpy.array([-5.0, -3.0, -1.5, -0.5, 0.0, 0.5])
+        dewpoint = numpy.concatenate([breakpoints, numpy.nextafter(breakpoints, -numpy.inf),
+                                      numpy.linspace(-8.0, 3.0, 45), [numpy.nan, -40.0, 25.0]]).reshape(3, -1)
+        percent_snow, snow_density = precipitationProperties.classifyDewpoint(dewpoint)
+        expected_percent_snow, expected_snow_density = conBins(dewpoint)
+        numpy.testing.assert_array_equal(percent_snow, expected_percent_snow)
+        numpy.testing.assert_array_equal(snow_density, expected_snow_density)
+        self.assertEqual(percent_snow.shape, dewpoint.shape)
+
+    def testTableRowOrder(self):
+        table = precipitationProperties.makeTable([None, 0.0, -2.0], [0.0, 0.5, 1.0], [0.0, 150.0, 100.0])
+        numpy.testing.assert_array_equal(table.breakpoints, [-2.0, 0.0])
+        percent_snow, snow_density = precipitationProperties.classifyDewpoint(numpy.array([-3.0, -2.0, 0.0]), table)
+        numpy.testing.assert_array_equal(percent_snow, [1.0, 0.5, 0.0])
+        numpy.testing.assert_array_equal(snow_density, [100.0, 150.0, 0.0])
+
+    def testTableNeedsOneOpenRow(self):
+        self.assertRaises(ValueError, precipitationProperties.makeTable, [0.0, 1.0], [1.0, 0.0], [100.0, 0.0])
+        self.assertRaises(ValueError, precipitationProperties.makeTable, [None, None], [1.0, 0.0], [100.0, 0.0])
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
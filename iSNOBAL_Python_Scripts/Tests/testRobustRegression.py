@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testRobustRegression
+# Purpose: Checks the elevation trend fits on known data: every method
+#          recovers an exact line, Theil-Sen and Huber stay near the line with
+#          one bad station where least squares does not, the bad station is
+#          flagged, the Theil-Sen leave-one-out residuals match refitting
+#          without each station, and too few stations give a no-data trend.
+# Input: none, e.g.
+#        python testRobustRegression.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import unittest
+import numpy
+
+#arcpyStub puts the scripts folder on the path
+import arcpyStub
+import robustRegression
+
+'''======Define internal functions======'''
+#station elevations (m) and a lapse rate of -6.5 C/km from 15 C at sea level
+ELEVATION = numpy.array([1210.0, 1480.0, 1650.0, 1795.0, 1930.0, 2105.0, 2240.0, 2390.0, 2615.0, 2800.0])
+INTERCEPT = 15.0
+SLOPE = -0.0065
+
+class RobustRegressionTest(unittest.TestCase):
+    def setUp(self):
+        self.values = INTERCEPT + SLOPE * ELEVATION
+
+    #the values with a small deterministic scatter and station 4 off by +8 C
+    def outlierValues(self):
+        values = self.values + 0.1 * numpy.sin(numpy.arange(len(ELEVATION)))
+        values[4] += 8.0
+        return values
+
+    def testExactLine(self):
+        for method in robustRegression.TREND_METHODS:
+            result = robustRegression.fitTrend(ELEVATION, self.values, method)
+            self.assertEqual(result.model.method, method)
+            numpy.testing.assert_allclose(robustRegression.evaluateTrend(result.model, ELEVATION), self.values,
+                                          atol=1e-9)
+            numpy.testing.assert_allclose(result.model.coefficients[:2], [INTERCEPT, SLOPE], atol=1e-9)
+            numpy.testing.assert_allclose(result.residual, 0.0, atol=1e-9)
+            self.assertAlmostEqual(result.r_squared, 1.0)
+
+    def testRobustToOutlier(self):
+        values = self.outlierValues()
+        ols = robustRegression.fitTrend(ELEVATION, values, "ols")
+        self.assertGreater(abs(ols.model.coefficients[0] - INTERCEPT), 1.0)
+        for method in ["theil_sen", "huber"]:
+            result = robustRegression.fitTrend(ELEVATION, values, method)
+            self.assertAlmostEqual(result.model.coefficients[1], SLOPE, delta=2e-4)
+            self.assertAlmostEqual(result.model.coefficients[0], INTERCEPT, delta=0.5)
+            self.assertEqual(numpy.flatnonzero(result.outlier).tolist(), [4])
+
+    def testTheilSenLeaveOneOut(self):
+        values = self.outlierValues()
+        result = robustRegression.fitTrend(ELEVATION, values, "theil_sen")
+        for station in range(len(ELEVATION)):
+            others = numpy.arange(len(ELEVATION)) != station
+            model = robustRegression.fitTrend(ELEVATION[others], values[others], "theil_sen").model
+            self.assertAlmostEqual(result.loo_residual[station],
+                                   values[station] - robustRegression.evaluateTrend(model, ELEVATION[station]))
+
+    def testHuberDownweightsOutlier(self):
+        basis = robustRegression.trendBasis(ELEVATION)
+        weights = robustRegression._huber(basis, self.outlierValues())[1]
+        self.assertEqual(int(numpy.argmin(weights)), 4)
+        self.assertLess(weights[4], 0.1)
+        self.assertTrue(numpy.all(weights[numpy.arange(len(ELEVATION)) != 4] > 0.5))
+
+    def testTooFewStations(self):
+        result = robustRegression.fitTrend(ELEVATION[:1], self.values[:1], "huber")
+        self.assertTrue(numpy.isnan(result.model.coefficients).all())
+        self.assertTrue(numpy.isnan(result.residual).all())
+        self.assertFalse(result.outlier.any())
+        self.assertRaises(ValueError, robustRegression.fitTrend, ELEVATION, self.values, "median")
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
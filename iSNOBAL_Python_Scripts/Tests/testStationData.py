@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testStationData
+# Purpose: Checks the columnar station store: rows for the same station and
+#          timestep are averaged, a store saved and loaded again holds the
+#          same values, a timestep's values are aligned with the site keys
+#          asked for, and the station means over the whole table or a time
+#          window (from the running sums) match the means of the hourly values.
+# Input: none, e.g.
+#        python testStationData.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+#arcpyStub puts the scripts folder on the path (stationData only imports arcpy
+#to read tables)
+import arcpyStub
+import stationData
+
+'''======Define internal functions======'''
+#first hour of the table
+START = datetime.datetime(2014, 1, 10, 0)
+
+#rows (site key, hour after START, air temperature, relative humidity), out of
+#order, with two rows for site 2 at hour 1 and missing values
+ROWS = [(3, 2, 1.0, 60.0),
+        (1, 0, -2.0, 80.0),
+        (2, 1, 4.0, None),
+        (1, 1, -1.0, 70.0),
+        (2, 1, 6.0, 50.0),
+        (3, 0, None, 65.0),
+        (2, 0, 3.0, 55.0),
+        (1, 2, 0.5, None),
+        (3, 1, 2.0, 62.0)]
+
+class StationDataTest(unittest.TestCase):
+    def setUp(self):
+        self.store = stationData.buildStore(
+            [row[0] for row in ROWS],
+            [numpy.datetime64(START + datetime.timedelta(hours=row[1]), "s") for row in ROWS],
+            {"air_temperature": [row[2] for row in ROWS], "relative_humidity": [row[3] for row in ROWS]})
+
+    #mean of a field over the hours of a site from hour "first" to hour "last",
+    #each hour the mean of its rows (NaN without observed rows)
+    def rowMean(self, site_key, column, first=0, last=2):
+        hours = {}
+        for row in ROWS:
+            if row[0] == site_key and first <= row[1] <= last and row[column] is not None:
+                hours.setdefault(row[1], []).append(row[column])
+        return numpy.mean([numpy.mean(values) for values in hours.values()]) if hours else numpy.nan
+
+    def testStoreLayout(self):
+        self.assertEqual(self.store.site_keys.tolist(), [1, 2, 3])
+        self.assertEqual(len(self.store.times), 3)
+        self.assertEqual(self.store.time_index[START + datetime.timedelta(hours=2)], 2)
+        self.assertEqual(self.store.values["air_temperature"].dtype, numpy.float32)
+        self.assertEqual(self.store.values["air_temperature"][1, 1], 5.0)
+        self.assertEqual(self.store.values["relative_humidity"][1, 1], 50.0)
+        self.assertTrue(numpy.isnan(self.store.values["air_temperature"][0, 2]))
+
+    def testSaveAndLoad(self):
+        directory = tempfile.mkdtemp(prefix="station_store_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "store.npz")
+        stationData.saveStore(self.store, path)
+        loaded = stationData.loadStore(path)
+        self.assertEqual(loaded.site_keys.tolist(), self.store.site_keys.tolist())
+        self.assertEqual(loaded.times.tolist(), self.store.times.tolist())
+        self.assertEqual(loaded.time_index, self.store.time_index)
+        self.assertEqual(loaded.site_index, self.store.site_index)
+        for field in self.store.values:
+            numpy.testing.assert_array_equal(loaded.values[field], self.store.values[field])
+            numpy.testing.assert_array_equal(loaded.cumulative_sums[field], self.store.cumulative_sums[field])
+            numpy.testing.assert_array_equal(loaded.cumulative_counts[field], self.store.cumulative_counts[field])
+
+    def testTimestepValues(self):
+        values = stationData.timestepValues(self.store, START + datetime.timedelta(hours=1), [3, 9, 2])
+        numpy.testing.assert_array_equal(values["air_temperature"], [2.0, numpy.nan, 5.0])
+        numpy.testing.assert_array_equal(values["relative_humidity"], [62.0, numpy.nan, 50.0])
+        values = stationData.timestepValues(self.store, START, [1], ["relative_humidity"])
+        self.assertEqual(list(values), ["relative_humidity"])
+        self.assertIsNone(stationData.timestepValues(self.store, START + datetime.timedelta(hours=3), [1]))
+
+    def testStationMeans(self):
+        site_keys = [1, 2, 3, 9]
+        means = stationData.stationMeans(self.store, site_keys)
+        for column, field in [(2, "air_temperature"), (3, "relative_humidity")]:
+            numpy.testing.assert_allclose(means[field], [self.rowMean(key, column) for key in site_keys])
+
+    def testWindowMeans(self):
+        site_keys = [1, 2, 3]
+        means = stationData.stationMeans(self.store, site_keys, ["air_temperature"],
+                                         START + datetime.timedelta(hours=1), START + datetime.timedelta(hours=2))
+        self.assertEqual(list(means), ["air_temperature"])
+        numpy.testing.assert_allclose(means["air_temperature"], [self.rowMean(key, 2, 1, 2) for key in site_keys])
+        means = stationData.stationMeans(self.store, site_keys, ["relative_humidity"], end=START)
+        numpy.testing.assert_allclose(means["relative_humidity"], [self.rowMean(key, 3, 0, 0) for key in site_keys])
+
+    def testStoreWithoutTimes(self):
+        store = stationData.buildStore([2, 1, 2], None, {"snow_depth": [1.0, 3.0, 2.0]})
+        self.assertEqual(len(store.times), 1)
+        numpy.testing.assert_array_equal(stationData.stationMeans(store, [1, 2])["snow_depth"], [3.0, 1.5])
+
+    def testParseDateTime(self):
+        self.assertEqual(stationData.parseDateTime("1/10/2014 12:30:00 AM"), datetime.datetime(2014, 1, 10, 0, 30))
+        self.assertEqual(stationData.parseDateTime("1/10/2014 12:00:00 PM"), datetime.datetime(2014, 1, 10, 12))
+        self.assertEqual(stationData.parseDateTime("12/1/2014 3:15:00 PM"), datetime.datetime(2014, 12, 1, 15, 15))
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testTrendSeries
+# Purpose: Checks the trend coefficient series: updateSeries sorts new fits
+#          by hour, replaces the rows of refitted hours and keeps the others,
+#          cached models are only reused for the same station values, and a
+#          series saved and opened again holds the same rows.
+# Input: none, e.g.
+#        python testTrendSeries.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import datetime
+import shutil
+import tempfile
+import unittest
+import numpy
+
+#arcpyStub puts the scripts folder on the path
+import arcpyStub
+import robustRegression
+import trendSeries
+
+'''======Define internal functions======'''
+#first hour of the fits
+START = datetime.datetime(2014, 1, 10, 0)
+
+#fit of hour "hour" after START with station value key "key" and lapse rate
+#"slope" (a piecewise fit with one break if "piecewise")
+def fit(hour, key, slope, piecewise=False):
+    if piecewise:
+        model = robustRegression.TrendModel("piecewise", numpy.array([15.0, slope, 0.001]), [2000.0])
+    else:
+        model = robustRegression.TrendModel("ols", numpy.array([15.0, slope]), [])
+    return (START + datetime.timedelta(hours=hour), key, model, numpy.full(len(model.coefficients), 1e-6), 0.9)
+
+class TrendSeriesTest(unittest.TestCase):
+    def testUpdateSortsFits(self):
+        series = trendSeries.updateSeries(None, [fit(2, "c", -0.002), fit(0, "a", -0.006), fit(1, "b", -0.004)])
+        self.assertEqual(series.hours.tolist(),
+                         [trendSeries.seriesHour(START + datetime.timedelta(hours=hour)) for hour in range(3)])
+        self.assertEqual(series.keys.tolist(), [b"a", b"b", b"c"])
+        numpy.testing.assert_array_equal(series.coefficients[:, 1], [-0.006, -0.004, -0.002])
+        self.assertEqual(series.coefficients.shape, (3, trendSeries.MAX_COEFFICIENTS))
+        self.assertTrue(numpy.isnan(series.coefficients[:, 2:]).all())
+        self.assertTrue(numpy.isnan(series.breaks).all())
+        self.assertIs(trendSeries.updateSeries(series, []), series)
+
+    def testUpdateReplacesHours(self):
+        series = trendSeries.updateSeries(None, [fit(hour, "old", -0.006) for hour in range(4)])
+        series = trendSeries.updateSeries(series, [fit(5, "new", -0.003), fit(2, "new", -0.005, True)])
+        self.assertEqual(len(series.hours), 5)
+        self.assertTrue(numpy.all(numpy.diff(series.hours) > 0))
+        self.assertEqual(series.keys.tolist(), [b"old", b"old", b"new", b"old", b"new"])
+        self.assertEqual(series.methods.tolist(), [b"ols", b"ols", b"piecewise", b"ols", b"ols"])
+        numpy.testing.assert_array_equal(series.coefficients[2, :3], [15.0, -0.005, 0.001])
+        self.assertEqual(series.breaks[2, 0], 2000.0)
+
+        model = trendSeries.rowModel(series, 2)
+        self.assertEqual(model.method, "piecewise")
+        self.assertEqual(model.breaks, [2000.0])
+        numpy.testing.assert_array_equal(model.coefficients, [15.0, -0.005, 0.001])
+
+    def testCachedModel(self):
+        series = trendSeries.updateSeries(None, [fit(0, "a", -0.006), fit(1, "b", -0.004)])
+        model = trendSeries.cachedModel(series, START + datetime.timedelta(hours=1), "b")
+        numpy.testing.assert_array_equal(model.coefficients, [15.0, -0.004])
+        self.assertIsNone(trendSeries.cachedModel(series, START + datetime.timedelta(hours=1), "a"))
+        self.assertIsNone(trendSeries.cachedModel(series, START + datetime.timedelta(hours=2), "b"))
+        self.assertIsNone(trendSeries.cachedModel(None, START, "a"))
+
+    def testSaveAndOpen(self):
+        folder = tempfile.mkdtemp(prefix="trend_series_")
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        self.assertEqual(trendSeries.openSeries(folder), {})
+        series = trendSeries.updateSeries(None, [fit(0, "a", -0.006), fit(1, "b", -0.005, True)])
+        trendSeries.saveSeries(folder, {"air_temperature": series})
+        opened = trendSeries.openSeries(folder)
+        self.assertEqual(list(opened), ["air_temperature"])
+        for saved, loaded in zip(series, opened["air_temperature"]):
+            numpy.testing.assert_array_equal(loaded, saved)
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: testWindCache
+# Purpose: Checks that the wind field cache of windNinja.solveVelocitySeries
+#          is keyed on each hour's own station winds: two hours in the same
+#          time-of-day and season bins are solved separately when their
+#          winds differ and share one grid when they match. The solver is
+#          replaced by a function returning the summed station speeds, so
+#          WindNinja is not needed.
+# Input: none, e.g.
+#        python testWindCache.py (or, from the scripts folder,
+#        python -m unittest discover -s Tests -p "test*.py")
+# Output: unittest results
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+#windNinja only uses arcpy for its messages, so the test runs without ArcGIS
+import arcpyStub
+import gridTools
+import windCache
+import windNinja
+
+'''======Define internal functions======'''
+#point initialization template with two stations
+STATION_FILE = ("Station_Name,Coord_Sys(PROJCS,GEOGCS),Datum(WGS84,NAD83,NAD27),Lat/YCoord,Lon/XCoord,"
+                "Height,Height_Units(meters,feet),Speed,Speed_Units(mph,kph,mps,kts),Direction(degrees),"
+                "Temperature,Temperature_Units(F,C),Cloud_Cover(%),Radius_of_Influence,"
+                "Radius_of_Influence_Units(miles,feet,meters,km)\n"
+                "a,GEOGCS,WGS84,43.5,-114.5,10,meters,1.0,mps,180,10,C,0,-1,km\n"
+                "b,GEOGCS,WGS84,43.6,-114.6,10,meters,1.0,mps,180,10,C,0,-1,km\n")
+
+class WindCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="wind_cache_")
+        self.station_file = os.path.join(self.directory, "stations.csv")
+        with open(self.station_file, "w") as station_csv:
+            station_csv.write(STATION_FILE)
+        self.grid = gridTools.GridSpec(0.0, 0.0, 10.0, 2, 2)
+        self.cache = windCache.openCache(os.path.join(self.directory, "cache"))
+        self.solved = []
+        self.solveVelocity = windNinja.solveVelocity
+        windNinja.solveVelocity = self.fakeSolve
+
+    def tearDown(self):
+        windNinja.solveVelocity = self.solveVelocity
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    #stand-in for windNinja.solveVelocity: a grid of the summed station speeds
+    def fakeSolve(self, ninja_path, elevation_file, date_time, station_file, grid, num_threads=8, log=None,
+                  timeout=None, winds=None):
+        self.solved.append(date_time)
+        return numpy.full((grid.n_rows, grid.n_cols), float(numpy.nansum(winds.speed)))
+
+    #velocity grids of two hours one day apart at the same clock time (same
+    #time-of-day and season bins) with the given speeds of stations a and b
+    def solveTwoHours(self, first_speed, second_speed):
+        first = datetime.datetime(2014, 1, 10, 12)
+        second = first + datetime.timedelta(days=1)
+        winds = {first: windNinja.StationWinds(["a", "b"], numpy.array(first_speed), numpy.array([180.0, 180.0])),
+                 second: windNinja.StationWinds(["a", "b"], numpy.array(second_speed), numpy.array([180.0, 180.0]))}
+        return [velocity for date_time, velocity, error in
+                windNinja.solveVelocitySeries("WindNinja_cli", os.path.join(self.directory, "elevation.tif"),
+                                              [first, second], self.station_file, self.grid, jobs=1, threads=1,
+                                              retries=0, log_path=os.path.join(self.directory, "ninja.log"),
+                                              cache=self.cache, elevation_hash="elevation", winds=winds)]
+
+    def testDifferentWindsMiss(self):
+        velocities = self.solveTwoHours([2.0, 3.0], [6.0, 8.0])
+        self.assertEqual(len(self.solved), 2)
+        self.assertEqual(velocities[0][0, 0], 5.0)
+        self.assertEqual(velocities[1][0, 0], 14.0)
+
+    def testSameWindsHit(self):
+        velocities = self.solveTwoHours([2.0, 3.0], [2.0, 3.0])
+        self.assertEqual(len(self.solved), 1)
+        self.assertEqual(velocities[1][0, 0], 5.0)
+
+    def testMissingStationMisses(self):
+        self.solveTwoHours([2.0, 3.0], [2.0, numpy.nan])
+        self.assertEqual(len(self.solved), 2)
+
+
+'''==== start script ======'''
+if __name__ == "__main__":
+    unittest.main()
+'''==== end script ======'''
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: buildManifest
+# Purpose: Content-addressed record of the outputs in a workspace. Every output
+#          is stored with a key hashed from everything it was computed from
+#          (input grids, the station values used, parameters and the source of
+#          the code that made it). A tool or timestep whose outputs all exist
+#          with the key of its current inputs is up to date and is skipped, so
+#          after fixing one station's data only the outputs that depend on it
+#          are computed again.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createAirTemperatureRaster
+#          2- createDewpointTemperatureRaster
+#          3- createThermalRadiationRaster
+#          4- createVaporPressureRasterFromDewpoint
+#          5- createPrecipitationPropertiesRasters
+#          6- forcingSeries
+#
+# Note: The manifest is a JSON file {output name: key} in the workspace folder,
+#       or next to the workspace for geodatabases. Input rasters go into a key
+#       by their signature (gridIO.rasterSignature: path, grid and file times
+#       and sizes) rather than their cells, so checking a key does not read
+#       the rasters; station values and small tables go in by content.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import datetime
+import hashlib
+import json
+import os
+import numpy
+
+'''======Define internal functions======'''
+#name of the manifest file of a workspace
+MANIFEST_NAME = "build_manifest.json"
+
+#Manifest file and its {output name: key} entries
+Manifest = collections.namedtuple("Manifest", ["path", "entries"])
+
+#path of the file "name" (the manifest by default) of a workspace: in the
+#workspace if it is a folder, or "<geodatabase name>_<name>" beside a geodatabase
+def manifestPath(workspace, name=MANIFEST_NAME):
+    root, extension = os.path.splitext(workspace.rstrip("/\\"))
+    if extension.lower() in (".gdb", ".mdb", ".sde"):
+        return root + "_" + name
+    return os.path.join(workspace, name)
+
+#open the manifest at "path" (empty if it does not exist yet)
+def openManifest(path):
+    entries = {}
+    if os.path.exists(path):
+        with open(path) as manifest_file:
+            entries = json.load(manifest_file)
+    return Manifest(path, entries)
+
+#move the file "source" over "destination" in one step (os.replace). Python 2
+#has no os.replace; there os.rename replaces the file in one step too, except on
+#Windows where the old file has to be removed first.
+def replaceFile(source, destination):
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+        return
+    if os.name == "nt" and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+#save a manifest, writing a temporary file first and then replacing the old
+#manifest with it, so an interrupted save leaves either manifest whole
+def saveManifest(manifest):
+    temporary_path = manifest.path + "." + str(os.getpid()) + ".tmp"
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest.entries, manifest_file, sort_keys=True, indent=0)
+    replaceFile(temporary_path, manifest.path)
+
+#True if "output_name" was recorded with "key" (callers also check that the
+#output still exists)
+def isFresh(manifest, output_name, key):
+    return manifest.entries.get(output_name) == key
+
+#record that "output_name" was computed from the inputs hashed into "key"
+def record(manifest, output_name, key):
+    manifest.entries[output_name] = key
+
+#feed one input into a hash: arrays by dtype, shape and bytes (every NaN hashes
+#the same), containers item by item and anything else by its repr
+def _update(digest, part):
+    if isinstance(part, numpy.ndarray):
+        if part.dtype.kind == "f":
+            part = numpy.where(numpy.isnan(part), numpy.nan, part)
+        digest.update(repr((str(part.dtype), part.shape)).encode("utf-8"))
+        digest.update(numpy.ascontiguousarray(part).tobytes())
+    elif isinstance(part, dict):
+        for name in sorted(part):
+            _update(digest, name)
+            _update(digest, part[name])
+    elif isinstance(part, (list, tuple)):
+        digest.update(("%s:%d" % (type(part).__name__, len(part))).encode("utf-8"))
+        for item in part:
+            _update(digest, item)
+    elif isinstance(part, datetime.datetime):
+        digest.update(part.isoformat().encode("utf-8"))
+    else:
+        digest.update(repr(part).encode("utf-8"))
+
+#key of a set of inputs (arrays, numbers, strings, datetimes and lists or dicts
+#of them)
+def inputKey(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        _update(digest, part)
+    return digest.hexdigest()
+
+#hash of the source files that compute an output (module __file__ paths; .pyc
+#paths are read from the .py beside them), so outputs go stale when the code does
+def codeVersion(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        if path.endswith(".pyc"):
+            path = path[:-1]
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+'''=======References======='''
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: clearSky
+# Purpose: NumPy clear-sky solar radiation model. The terrain terms that do not
+#          change between hours (slope, aspect, horizon angles in a set of
+#          directions and the sky-view factor) are computed once per elevation
+#          grid and can be saved and reloaded, so every hourly grid only costs
+#          the sun position and a few array operations.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createSolarRadiationRaster
+#          2- forcingSeries
+#          3- forcingPipeline
+#
+# Note: The radiation terms follow the ArcGIS area solar radiation tool as it
+#       was run by createSolarRadiationRaster (uniform diffuse sky, diffuse
+#       proportion 0.3, transmittivity 0.5, 32 horizon directions). Grids are in
+#       W/m^2 at the middle of the hour, i.e. Wh/m^2 over the hour.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import datetime
+import math
+import os
+import numpy
+
+import gridTools
+import solarPosition
+import staticLayers
+
+'''======Define internal functions======'''
+#number of horizon directions (azimuths 0, 360/n, ... degrees clockwise from north)
+HORIZON_DIRECTIONS = 32
+
+#distance (m) searched for the horizon; search steps grow by HORIZON_STEP_RATIO
+MAX_HORIZON_DISTANCE = 20000.0
+HORIZON_STEP_RATIO = 1.1
+
+#solar constant (W/m^2), atmospheric transmittivity and diffuse proportion
+SOLAR_CONSTANT = 1367.0
+TRANSMITTIVITY = 0.5
+DIFFUSE_PROPORTION = 0.3
+
+#Terrain terms of an elevation grid
+#   slope, aspect: radians (aspect clockwise from north, the downslope direction)
+#   horizon: (HORIZON_DIRECTIONS, rows, cols) float16 horizon elevation angles
+#            (radians, not below 0)
+#   sky_view: fraction of the sky hemisphere seen by each cell
+#   latitude, longitude: grid center (degrees), used for the sun position
+TerrainIndex = collections.namedtuple("TerrainIndex", ["slope", "aspect", "horizon", "sky_view",
+                                                       "latitude", "longitude"])
+
+#slope and aspect (radians) of an elevation grid (row 0 is the northern-most row)
+def slopeAspect(elevation, cell_size):
+    dz_south, dz_east = numpy.gradient(elevation, cell_size)
+    slope = numpy.arctan(numpy.hypot(dz_east, dz_south))
+    aspect = numpy.arctan2(-dz_east, dz_south) % (2 * numpy.pi)
+    return slope, aspect
+
+#horizon search distances in cells (1, 2, ... growing geometrically)
+def _searchDistances(max_cells):
+    distances = []
+    distance = 1.0
+    while distance <= max_cells:
+        if not distances or int(distance) > distances[-1]:
+            distances.append(int(distance))
+        distance = distance * HORIZON_STEP_RATIO
+    return distances
+
+#horizon elevation angle (radians, not below 0) of every cell looking towards
+#"azimuth" (radians clockwise from north), searched up to MAX_HORIZON_DISTANCE
+def horizonAngle(elevation, cell_size, azimuth):
+    n_rows, n_cols = elevation.shape
+    max_cells = min(max(n_rows, n_cols), MAX_HORIZON_DISTANCE / cell_size)
+    horizon_tan = numpy.zeros(elevation.shape)
+    for distance in _searchDistances(max_cells):
+        d_row = -int(round(distance * math.cos(azimuth)))
+        d_col = int(round(distance * math.sin(azimuth)))
+        if abs(d_row) >= n_rows or abs(d_col) >= n_cols:
+            break
+        #cells [r0, r1) x [c0, c1) look at cells shifted by (d_row, d_col)
+        r0, r1 = max(0, -d_row), n_rows - max(0, d_row)
+        c0, c1 = max(0, -d_col), n_cols - max(0, d_col)
+        rise = elevation[r0 + d_row:r1 + d_row, c0 + d_col:c1 + d_col] - elevation[r0:r1, c0:c1]
+        run = cell_size * math.hypot(d_row, d_col)
+        numpy.fmax(horizon_tan[r0:r1, c0:c1], rise / run, out=horizon_tan[r0:r1, c0:c1])
+    return numpy.arctan(horizon_tan)
+
+#sky-view factor of tilted cells with horizons in evenly spaced directions
+#(Dozier and Frew, 1990)
+def skyViewFactor(slope, aspect, horizon):
+    n_directions = horizon.shape[0]
+    total = numpy.zeros(slope.shape)
+    for k in range(n_directions):
+        azimuth = 2 * numpy.pi * k / n_directions
+        #zenith angle of the horizon
+        H = numpy.pi / 2 - horizon[k].astype(numpy.float64)
+        total += numpy.cos(slope) * numpy.sin(H)**2 + \
+                 numpy.sin(slope) * numpy.cos(azimuth - aspect) * (H - numpy.sin(H) * numpy.cos(H))
+    return numpy.clip(total / n_directions, 0.0, 1.0)
+
+#compute the terrain terms of an elevation grid centered at "latitude"/"longitude"
+def terrainIndex(elevation, grid, latitude, longitude, directions=HORIZON_DIRECTIONS):
+    slope, aspect = slopeAspect(elevation, grid.cell_size)
+    horizon = numpy.empty((directions,) + elevation.shape, dtype=numpy.float16)
+    for k in range(directions):
+        horizon[k] = horizonAngle(elevation, grid.cell_size, 2 * numpy.pi * k / directions)
+    return TerrainIndex(slope, aspect, horizon, skyViewFactor(slope, aspect, horizon), latitude, longitude)
+
+#save terrain terms as a folder of memory-mappable layers (see staticLayers)
+def saveTerrainIndex(terrain, path):
+    staticLayers.saveLayers({"slope": terrain.slope, "aspect": terrain.aspect, "horizon": terrain.horizon,
+                             "sky_view": terrain.sky_view,
+                             "location": numpy.array([terrain.latitude, terrain.longitude])}, path)
+
+#memory-map terrain terms saved by saveTerrainIndex
+def loadTerrainIndex(path):
+    arrays = staticLayers.loadLayers(path)
+    return TerrainIndex(arrays["slope"], arrays["aspect"], arrays["horizon"], arrays["sky_view"],
+                        float(arrays["location"][0]), float(arrays["location"][1]))
+
+#terrain terms of an elevation grid, loaded from "directory" if they were
+#computed for the same grid before and computed and saved there otherwise. The
+#grid is identified by "elevation_key" if given (e.g. its raster's signature)
+#and by the hash of its cells otherwise.
+def cachedTerrainIndex(elevation, grid, latitude, longitude, directory, directions=HORIZON_DIRECTIONS,
+                       elevation_key=None):
+    if elevation_key is None:
+        elevation_key = gridTools.gridHash(elevation, grid)
+    path = os.path.join(directory, "terrain_" + elevation_key[:16] + "_" + str(directions))
+    if not os.path.isdir(path):
+        saveTerrainIndex(terrainIndex(elevation, grid, latitude, longitude, directions), path)
+    return loadTerrainIndex(path)
+
+#horizon angle of every cell towards "azimuth", interpolated between the two
+#nearest horizon directions
+def _horizonTowards(horizon, azimuth):
+    n_directions = horizon.shape[0]
+    position = azimuth / (2 * numpy.pi) * n_directions
+    k = int(math.floor(position)) % n_directions
+    w = position - math.floor(position)
+    return (1 - w) * horizon[k].astype(numpy.float64) + w * horizon[(k + 1) % n_directions].astype(numpy.float64)
+
+#relative optical air mass at "zenith" (Kasten and Young, 1989), scaled to the
+#pressure at "elevation" (m) as in the area solar radiation tool
+def airMass(zenith, elevation):
+    zenith_degrees = math.degrees(zenith)
+    relative = 1.0 / (math.cos(zenith) + 0.50572 * (96.07995 - zenith_degrees)**-1.6364)
+    return relative * numpy.exp(-0.000118 * elevation - 1.638e-9 * elevation**2)
+
+#clear-sky global radiation (W/m^2: direct + diffuse) of every cell for the hour
+#starting at "date_time", with the sun position taken at the middle of the hour
+def clearSkyRadiation(terrain, elevation, date_time, hour_fraction=0.5):
+    sun = solarPosition.sunPosition(date_time + datetime.timedelta(hours=hour_fraction),
+                                    terrain.longitude, terrain.latitude)
+    zenith = float(sun.zenith)
+    azimuth = float(sun.azimuth)
+    if zenith >= numpy.pi / 2:
+        return numpy.where(numpy.isfinite(elevation), 0.0, numpy.nan)
+
+    #beam irradiance normal to the sun, and the global radiation it implies
+    beam = SOLAR_CONSTANT * TRANSMITTIVITY**airMass(zenith, elevation)
+    global_normal = beam / (1 - DIFFUSE_PROPORTION)
+
+    #direct radiation on the cell, zero where the sun is behind the horizon
+    cos_incidence = numpy.cos(zenith) * numpy.cos(terrain.slope) + \
+                    numpy.sin(zenith) * numpy.sin(terrain.slope) * numpy.cos(azimuth - terrain.aspect)
+    sunlit = (numpy.pi / 2 - zenith) > _horizonTowards(terrain.horizon, azimuth)
+    direct = numpy.where(sunlit, beam * numpy.maximum(cos_incidence, 0.0), 0.0)
+
+    #uniform sky diffuse radiation over the visible part of the sky
+    diffuse = 0.5 * DIFFUSE_PROPORTION * global_normal * terrain.sky_view
+    return direct + diffuse
+
+'''=======References======='''
+#Fu, P., & Rich, P. M. (2002). A geometric solar radiation model with
+#   applications in agriculture and forestry. Computers and Electronics in
+#   Agriculture, 37, 25–35.
+#Dozier, J., & Frew, J. (1990). Rapid calculation of terrain parameters for
+#   radiation modeling from digital elevation model data. IEEE Transactions on
+#   Geoscience and Remote Sensing, 28, 963–969.
+#Kasten, F., & Young, A. T. (1989). Revised optical air mass tables and
+#   approximation formula. Applied Optics, 28, 4735–4738.
+#NOAA Global Monitoring Division. General solar position calculations.
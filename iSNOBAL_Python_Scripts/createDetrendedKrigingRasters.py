@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: createDetrendedKrigingRasters
+# Purpose: This script follows the detrended kriging methods outlined by
+#          Susong, Marks, and Garen (1999) to estimate the air temperature,
+#          dew-point temperature, vapor pressure, precipitation mass and snow
+#          depth grids together. Station elevations are extracted once and
+#          kept in the station index of the elevation raster (stationIndex),
+#          the data table is scanned once for all variables, and variables
+#          reported by the same stations share one kriging system.
+# Input: 0- Elevation raster
+#        1- Station location feature class
+#        2- Stand-alone data table
+#        8- Trend fit: "ols" (default), "theil_sen", "huber" or "piecewise"
+#            (see robustRegression)
+# Output: 3- air temperature raster
+#         4- dew-point temperature raster
+#         5- vapor pressure raster
+#         6- precipitation mass raster
+#         7- snow depth raster
+# Output used in: 1- createThermalRadiationRaster
+#                 2- createVaporPressureFromDewpoint
+#                 3- createPrecipitationPropertiesRasters
+#-------------------------------------------------------------------------------
+
+'''======Define internal functions======'''
+#detrended kriging surfaces of one tile of the elevation raster, keyed by output
+#raster name
+def krigingTile(tile_grid, elevation):
+    surfaces = detrendedKriging.trendSurfaces(fits, station_x, station_y, elevation, tile_grid)
+    return dict((output_name, detrendedKriging.clampForcingSurface(field, surfaces[field]))
+                for field, output_name in detrendedKriging.KRIGED_VARIABLES.items())
+
+
+
+'''==== start script ======'''
+#Import necessary modules
+import arcpy
+
+import detrendedKriging
+import gridIO
+import instrumentation
+import stationData
+import stationIndex
+import tiledRasters
+
+#Set input parameters
+elevation_raster = arcpy.GetParameterAsText(0)
+station_locations = arcpy.GetParameterAsText(1)
+data_table = arcpy.GetParameterAsText(2)
+trend_method = arcpy.GetParameterAsText(8) or "ols"
+
+#Setup workspace
+arcpy.env.overwriteOutput = True
+
+#Start process
+
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createDetrendedKrigingRasters", arcpy.env.scratchFolder)
+
+#read station locations and extract elevations to stations
+arcpy.AddMessage("Extracting elevations")
+instrumentation.startStage("extraction")
+grid, spatial_reference = gridIO.describeRaster(elevation_raster)
+stations = stationIndex.readStationIndex(station_locations, elevation_raster, arcpy.env.scratchFolder)
+site_keys, station_x, station_y, station_elevation = stations.site_keys, stations.x, stations.y, stations.elevation
+
+#calculate the mean of every variable for each station over the n-hour time period
+arcpy.AddMessage("Calculating station averages")
+instrumentation.startStage("statistics")
+station_means = stationData.readStationMeans(data_table, site_keys, list(detrendedKriging.KRIGED_VARIABLES))
+
+#regress on elevation
+arcpy.AddMessage("Running linear regressions on elevation")
+instrumentation.startStage("regression")
+fits = detrendedKriging.fitTrends(detrendedKriging.forcingStationValues(station_means), station_elevation, trend_method)
+for field, output_name in detrendedKriging.KRIGED_VARIABLES.items():
+    arcpy.AddMessage(output_name + " r-squared: " + str(fits[field].r_value**2))
+    outliers = detrendedKriging.outlierStations(fits[field], site_keys)
+    if outliers:
+        arcpy.AddWarning(output_name + ": stations far from the elevation trend: " + ", ".join(outliers))
+
+#krige the residuals and add back the elevation trends, tile by tile
+arcpy.AddMessage("Performing kriging on residuals and creating final rasters")
+instrumentation.startStage("kriging")
+output_rasters = tiledRasters.evaluateTiled(krigingTile, {"elevation": elevation_raster},
+                                            list(detrendedKriging.KRIGED_VARIABLES.values()), grid, spatial_reference)
+
+instrumentation.closeRun(arcpy.AddMessage)
+
+# Set output parameters
+for i, output_raster in enumerate(output_rasters):
+    arcpy.SetParameterAsText(3 + i, output_raster)
+'''==== end script ======'''
+
+
+
+'''=======References======='''
+#Susong, D., Marks, D., & Garen, D. (1999). Methods for developing time-series
+#   climate surfaces to drive topographically distributed energy- and
+#   water-balance models. Hydrological Processes, 13, 2003–2021. Retrieved from
+#   ftp://ftp.nwrc.ars.usda.gov/publications/1999/Marks-Methods for developing
+#   time-series climate surfaces to drive topographically distributed energy-
+#   and water-balance models.pdf
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: createForcingRasters
+# Purpose: This script runs the forcing toolchain (detrended kriging of the
+#          station means, thermal radiation, vapor pressure from dew point,
+#          precipitation properties, initial snow properties, solar radiation
+#          and WindNinja wind velocity) in one run, in place of running the
+#          single-variable tools one after another. The dependencies between
+#          the grids are declared in forcingPipeline; independent branches run
+#          at the same time and grids are handed between steps in memory. Only
+#          the requested grids and the steps they need are computed.
+# Input: 0- Elevation raster
+#        1- Station location feature class
+#        2- Stand-alone data table
+#        3- View factor raster
+#        4- Weather Station CSV File (WindNinja point initialization file
+#           whose Station_Name values are the site keys). If the data table
+#           has "wind_speed", "wind_direction" and "date_time" fields, the
+#           stations' winds at the date and time of the simulation replace
+#           the file's; otherwise the file's winds are used as they are.
+#        5- Date and time of simulation (solar radiation and wind)
+#        6- Reference air pressure value
+#        7- Reference air temperature value
+#        8- Reference elevation value
+#        9- Surface temperature (estimated from mean daily air temperature)
+#        10- Solar correction: "mean" (default), "idw" or "kriged"
+#        11- Dew-point lookup table (optional, see
+#            createPrecipitationPropertiesRasters)
+#        12- Output grids (optional; every grid in
+#            forcingPipeline.OUTPUT_GRIDS by default)
+#        13- Number of steps run at the same time (optional, defaults to one
+#            per core)
+#        14- Trend fit: "ols" (default), "theil_sen", "huber" or "piecewise"
+#            (see robustRegression)
+# Output: 15- forcing rasters, named after their grids
+#
+# Output used in:
+#
+#-------------------------------------------------------------------------------
+
+'''======Define internal functions======'''
+#save a grid produced by the pipeline if it was requested
+def saveOutput(name, value):
+    if name in output_grids:
+        arcpy.AddMessage("Creating " + name + " raster")
+        with instrumentation.stage("save"):
+            output_rasters.append(gridIO.saveArray(value, grid, spatial_reference, name))
+    elif name == "trend_fits":
+        for output_name, fit in value.items():
+            arcpy.AddMessage(output_name + " r-squared: " + str(fit["r_squared"]))
+            if fit["outliers"]:
+                arcpy.AddWarning(output_name + ": stations far from the elevation trend: " +
+                                 ", ".join(fit["outliers"]))
+
+
+
+'''==== start script ======'''
+#Import necessary modules
+import arcpy
+import os
+import tempfile
+
+import forcingPipeline
+import gridIO
+import instrumentation
+import pipeline
+import precipitationProperties
+import solarRadiation
+import staticLayers
+import stationData
+import stationIndex
+import windNinja
+
+#Set input parameters
+elevation_raster = arcpy.GetParameterAsText(0)
+station_locations = arcpy.GetParameterAsText(1)
+data_table = arcpy.GetParameterAsText(2)
+view_factor_raster = arcpy.GetParameterAsText(3)
+station_file = arcpy.GetParameterAsText(4)
+date_time = arcpy.GetParameterAsText(5)
+reference_air_pressure = arcpy.GetParameter(6)
+reference_air_temperature = arcpy.GetParameter(7)
+reference_elevation = arcpy.GetParameter(8)
+surface_air_temperature = arcpy.GetParameter(9)
+solar_correction = arcpy.GetParameterAsText(10) or "mean"
+lookup_table_path = arcpy.GetParameterAsText(11)
+output_grids = arcpy.GetParameterAsText(12).split(";") if arcpy.GetParameterAsText(12) else \
+    forcingPipeline.OUTPUT_GRIDS
+jobs = arcpy.GetParameter(13)
+trend_method = arcpy.GetParameterAsText(14) or "ols"
+
+#Setup workspace
+arcpy.env.overwriteOutput = True
+
+#Start process
+
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createForcingRasters", arcpy.env.scratchFolder)
+
+#read the inputs of the steps needed for the requested grids
+arcpy.AddMessage("Reading elevation raster and station data")
+instrumentation.startStage("extraction")
+required = forcingPipeline.requiredInputs(output_grids)
+elevation, grid, spatial_reference = staticLayers.readStaticRaster(elevation_raster, arcpy.env.scratchFolder)
+values = {"elevation": elevation, "grid": grid}
+if "station_means" in required:
+    stations = stationIndex.readStationIndex(station_locations, elevation_raster, arcpy.env.scratchFolder, elevation)
+    values.update(station_x=stations.x, station_y=stations.y, station_elevation=stations.elevation,
+                  site_keys=stations.site_keys, trend_method=trend_method,
+                  station_means=stationData.readStationMeans(data_table, stations.site_keys,
+                                                             forcingPipeline.STATION_FIELDS))
+if "view_factor" in required:
+    values.update(view_factor=staticLayers.readStaticRaster(view_factor_raster, arcpy.env.scratchFolder)[0],
+                  reference_air_pressure=reference_air_pressure, reference_air_temperature=reference_air_temperature,
+                  reference_elevation=reference_elevation, surface_air_temperature=surface_air_temperature)
+if "lookup_table" in required:
+    if lookup_table_path:
+        values["lookup_table"] = precipitationProperties.makeTable(
+            *gridIO.readTable(lookup_table_path, ["dewpoint_upper", "percent_snow", "snow_density"]))
+    else:
+        values["lookup_table"] = precipitationProperties.DEFAULT_TABLE
+if "date_time" in required:
+    values["date_time"] = stationData.parseDateTime(date_time)
+if "terrain_folder" in required:
+    latitude, longitude = solarRadiation.gridCenterLatLon(grid, spatial_reference)
+    values.update(latitude=latitude, longitude=longitude, terrain_folder=arcpy.env.scratchFolder,
+                  solar_correction=solar_correction)
+if "ninja_path" in required:
+    #initialize WindNinja with the station winds of the simulation hour if the
+    #data table has them
+    station_winds = None
+    if windNinja.hasStationWinds(data_table):
+        site_keys = stationIndex.readStationIndex(station_locations, elevation_raster, arcpy.env.scratchFolder,
+                                                  elevation).site_keys
+        winds = stationData.timestepValues(stationData.ingestTable(data_table, windNinja.WIND_FIELDS),
+                                           values["date_time"], site_keys)
+        if winds is not None:
+            station_winds = windNinja.StationWinds(site_keys, *[winds[field] for field in windNinja.WIND_FIELDS])
+    if station_winds is None:
+        arcpy.AddWarning("No station winds in the data table for " + str(values["date_time"]) +
+                         "; WindNinja uses the winds of " + station_file)
+    values.update(ninja_path=windNinja.findNinja(), station_file=station_file, station_winds=station_winds,
+                  ninja_elevation=windNinja.ninjaElevation(elevation_raster,
+                      tempfile.mkdtemp(prefix="ninja_", dir=arcpy.env.scratchFolder)),
+                  ninja_log=os.path.join(arcpy.env.scratchFolder, "windninja.log"))
+    arcpy.AddMessage("Logging WindNinja output to " + values["ninja_log"])
+
+#run the steps, saving every requested grid as soon as it is finished
+instrumentation.startStage("pipeline")
+output_rasters = []
+pipeline.runPipeline(forcingPipeline.FORCING_STAGES, values, jobs, output_grids, saveOutput, arcpy.AddMessage)
+
+instrumentation.closeRun(arcpy.AddMessage)
+
+# Set output parameter
+arcpy.SetParameterAsText(15, ";".join(str(output_raster) for output_raster in output_rasters))
+'''==== end script ======'''
+
+
+
+'''=======References======='''
+#Susong, D., Marks, D., & Garen, D. (1999). Methods for developing time-series
+#   climate surfaces to drive topographically distributed energy- and
+#   water-balance models. Hydrological Processes, 13, 2003–2021.
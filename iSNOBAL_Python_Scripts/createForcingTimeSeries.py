@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: createForcingTimeSeries
+# Purpose: This script generates the air temperature, dew-point temperature,
+#          vapor pressure, thermal radiation, solar radiation, precipitation
+#          mass, percent snow, snow density and wind velocity grids for every
+#          timestep between a start and end date/time in a single run. Rasters
+#          are named <variable>_<YYYYMMDD_HHMM>. Outputs already in the output
+#          workspace that were computed from the same inputs are kept, so a
+#          rerun after fixing station data only recomputes the grids that
+#          depend on the changed values (delete the workspace's
+#          build_manifest.json to recompute everything).
+# Input: 0- Elevation raster
+#        1- Station location feature class
+#        2- Stand-alone data table (with a "date_time" field, and optionally
+#           "wind_speed" and "wind_direction" fields with each station's winds)
+#        3- View factor raster
+#        4- Weather Station CSV File (WindNinja point initialization file
+#           whose Station_Name values are the site keys). WindNinja is run
+#           for every timestep with a copy holding that timestep's
+#           wind_speed and wind_direction values from the data table. If
+#           the data table has no wind fields the file's winds are used for
+#           every timestep, and the wind grids then only differ by
+#           WindNinja's diurnal terms.
+#        5- Start date/time
+#        6- End date/time
+#        7- Time step (hours)
+#        8- Reference air pressure value
+#        9- Reference air temperature value
+#        10- Reference elevation value
+#        11- Surface temperature (estimated from mean daily air temperature)
+#        12- Output workspace
+#        13- Number of processes (optional, defaults to one per core; 1 runs
+#            every timestep in this process)
+#        14- Output format: "ESRI raster" (default), "IPW" (iSNOBAL input
+#            images in.NNNN, precipitation images ppt.4b_NNNN and ppt_desc,
+#            written to the output workspace folder and numbered from the first
+#            timestep of the series there, kept in series_origin.json, so a
+#            later run must start on one of its timesteps; the S_n band holds
+#            the incoming global solar radiation, not net solar), "GeoTIFF" (tiled,
+#            compressed .tif rasters with pyramids in the output workspace
+#            folder) or "NetCDF" (every timestep in one forcing.nc cube in the
+#            output workspace folder, see forcingCube; like the IPW images its
+#            timesteps are slots of the series in series_origin.json)
+#        15- Soil temperature value (T_g band of the IPW input images)
+#        16- Wind field cache folder (optional; WindNinja velocity grids are
+#            reused from and added to it, see windCache)
+#        17- Solar correction: "mean" (default), "idw" or "kriged" (how the
+#            station observed/simulated ratios are spread over the grid)
+#        18- Trend fit: "ols" (default), "theil_sen", "huber" or "piecewise"
+#            (see robustRegression); the fits of every timestep are recorded
+#            in trend_fits.jsonl beside the outputs
+#        19- Trend smoothing: "none" (default), "rolling" or "kalman" (the
+#            lapse rates and intercepts of every hour, kept in the
+#            trend_coefficients folder beside the outputs, are smoothed over
+#            the neighboring hours; see trendSeries)
+#        20- Cache kriging weights (optional, off by default; keeps the kriging
+#            weights of every station set in memory, up to
+#            detrendedKriging.WEIGHT_CACHE_BYTES per process, so hours
+#            reported by the same stations are kriged faster)
+#        21- WindNinja timeout in seconds (optional, defaults to
+#            windNinja.TIMEOUT; a run taking longer is killed and retried up to
+#            windNinja.RETRIES times)
+# Output: 22- forcing grids for every timestep (the output workspace)
+#
+# Output used in:
+#
+#-------------------------------------------------------------------------------
+
+'''======Define internal functions======'''
+#The per-timestep work is done by the shared "forcingSeries" module
+
+
+
+'''==== start script ======'''
+#Import necessary modules
+import arcpy
+import os
+
+import buildManifest
+import forcingSeries
+import instrumentation
+import ipwImage
+import solarRadiation
+import staticLayers
+import stationData
+import stationIndex
+import windCache
+import windNinja
+
+#the guard keeps worker processes from re-running the tool when they import it
+if __name__ == '__main__':
+    #Check-out necessary extensions
+    arcpy.CheckOutExtension('Spatial')
+
+    #Set input parameters
+    elevation_raster = arcpy.GetParameterAsText(0)
+    station_locations = arcpy.GetParameterAsText(1)
+    data_table = arcpy.GetParameterAsText(2)
+    view_factor_raster = arcpy.GetParameterAsText(3)
+    station_file = arcpy.GetParameterAsText(4)
+    start_date_time = arcpy.GetParameter(5)
+    end_date_time = arcpy.GetParameter(6)
+    time_step = arcpy.GetParameter(7)
+    reference_air_pressure = arcpy.GetParameter(8)
+    reference_air_temperature = arcpy.GetParameter(9)
+    reference_elevation = arcpy.GetParameter(10)
+    surface_air_temperature = arcpy.GetParameter(11)
+    output_workspace = arcpy.GetParameterAsText(12)
+    processes = arcpy.GetParameter(13)
+    output_format = arcpy.GetParameterAsText(14) or "ESRI raster"
+    soil_temperature = arcpy.GetParameter(15) or 0.0
+    wind_cache_folder = arcpy.GetParameterAsText(16)
+    solar_correction = arcpy.GetParameterAsText(17) or "mean"
+    trend_method = arcpy.GetParameterAsText(18) or "ols"
+    smoothing = arcpy.GetParameterAsText(19) or "none"
+    weight_cache = bool(arcpy.GetParameter(20))
+    ninja_timeout = arcpy.GetParameter(21) or windNinja.TIMEOUT
+    write = forcingSeries.WRITERS[output_format]
+
+    #Setup workspace
+    #output cell size should be the same as elevation raster cell size
+    arcpy.env.cellSize = elevation_raster
+    arcpy.env.workspace = output_workspace
+    scratchGDB = arcpy.env.scratchGDB
+    arcpy.env.overwriteOutput = True
+
+    #Start process
+
+    #time the stages of the run (see instrumentation)
+    instrumentation.openRun("createForcingTimeSeries", arcpy.env.scratchFolder)
+
+    #load the data table once into a store indexed by timestep and station
+    arcpy.AddMessage("Reading station data")
+    instrumentation.startStage("statistics")
+    station_fields = list(forcingSeries.STATION_FIELDS)
+    if windNinja.hasStationWinds(data_table):
+        station_fields += windNinja.WIND_FIELDS
+    else:
+        arcpy.AddWarning("The data table has no " + " and ".join(windNinja.WIND_FIELDS) + " fields; WindNinja uses "
+                         "the winds of " + station_file + " for every timestep")
+    station_store = stationData.ingestTable(data_table, station_fields)
+    time_steps = forcingSeries.timeSteps(start_date_time, end_date_time, time_step)
+    #IPW images and cube slots are numbered from the first timestep of the series
+    #in the output workspace (kept beside the outputs), whatever timestep this run
+    #starts at
+    series_origin = forcingSeries.seriesOrigin(output_workspace, start_date_time, time_step) \
+        if output_format in ("IPW", "NetCDF") else None
+    wind_cache = windCache.openCache(wind_cache_folder) if wind_cache_folder else None
+    manifest = buildManifest.openManifest(buildManifest.manifestPath(output_workspace))
+    trend_record = buildManifest.manifestPath(output_workspace, forcingSeries.TREND_RECORD_NAME)
+    trend_series = buildManifest.manifestPath(output_workspace, forcingSeries.TREND_SERIES_NAME)
+
+    if processes == 1:
+        #read the elevation, view factor and station locations once for the whole run
+        arcpy.AddMessage("Reading static inputs")
+        instrumentation.startStage("extraction")
+        setup = forcingSeries.readSetup(elevation_raster, station_locations, view_factor_raster, station_file,
+                                        reference_air_pressure, reference_air_temperature, reference_elevation,
+                                        surface_air_temperature, soil_temperature, solar_correction, trend_method,
+                                        weight_cache, series_origin, arcpy.env.scratchFolder, scratchGDB)
+
+        #create and save the forcing grids for every timestep (WindNinja output is
+        #logged to the scratch folder)
+        ninja_log = os.path.join(arcpy.env.scratchFolder, "windninja.log")
+        arcpy.AddMessage("Logging WindNinja output to " + ninja_log)
+        instrumentation.startStage("forcing_series")
+        written, failed = forcingSeries.runSeries(setup, station_store, time_steps, write, ninja_log, wind_cache,
+                                                  manifest, trend_record, trend_series, smoothing, ninja_timeout)
+    else:
+        #store the elevation and view factor grids, and compute the clear-sky
+        #terrain terms and the station index, once for all of the workers (the
+        #workers map the stored grids, see staticLayers)
+        arcpy.AddMessage("Computing terrain horizons")
+        instrumentation.startStage("extraction")
+        elevation, grid, spatial_reference = staticLayers.readStaticRaster(elevation_raster, arcpy.env.scratchFolder)
+        staticLayers.readStaticRaster(view_factor_raster, arcpy.env.scratchFolder)
+        solarRadiation.readTerrain(elevation, grid, spatial_reference, arcpy.env.scratchFolder)
+        stations = stationIndex.readStationIndex(station_locations, elevation_raster, arcpy.env.scratchFolder,
+                                                 elevation)
+        del elevation
+
+        #spread the timesteps over a process pool (one worker per core if the number
+        #of processes is not set); every worker has its own scratch workspace, and
+        #rasters bound for a geodatabase are saved by every worker in its own
+        #geodatabase and copied into the output workspace by this process
+        arcpy.AddMessage("Starting worker processes")
+        instrumentation.startStage("forcing_series")
+        setup_args = (elevation_raster, station_locations, view_factor_raster, station_file,
+                      reference_air_pressure, reference_air_temperature, reference_elevation,
+                      surface_air_temperature, soil_temperature, solar_correction, trend_method,
+                      weight_cache, series_origin, arcpy.env.scratchFolder)
+        written, failed = forcingSeries.runSeriesParallel(setup_args, output_workspace, stations, station_store,
+                                                          time_steps, processes, write, wind_cache, manifest,
+                                                          trend_record, trend_method, trend_series, smoothing,
+                                                          ninja_timeout, series_origin)
+
+    #list the precipitation images for iSNOBAL
+    if output_format == "IPW":
+        instrumentation.startStage("save")
+        ipwImage.writePrecipitationDescription(output_workspace)
+
+    arcpy.AddMessage("Created forcing grids for " + str(len(written)) + " timesteps")
+    if failed:
+        arcpy.AddError(str(len(failed)) + " timesteps failed: " + ", ".join(str(date_time) for date_time, error in failed))
+
+    # Set output parameter
+    arcpy.SetParameterAsText(22, output_workspace)
+
+    #Clear scratch workspace
+    arcpy.AddMessage("Deleting scratch workspace")
+    instrumentation.startStage("cleanup")
+    arcpy.Delete_management(scratchGDB)
+    instrumentation.closeRun(arcpy.AddMessage)
+'''==== end script ======'''
+
+
+
+'''=======References======='''
+#Susong, D., Marks, D., & Garen, D. (1999). Methods for developing time-series
+#   climate surfaces to drive topographically distributed energy- and
+#   water-balance models. Hydrological Processes, 13, 2003–2021.
+#Marks, D., and Dozier, J., 1979, A clear-sky longwave radiation model for
+#   remote alpine areas: Archiv für Meteorologie, Geophysik und Bioklimatologie
+#   Serie B, v. 27, p. 159–187, doi: 10.1007/BF02243741.
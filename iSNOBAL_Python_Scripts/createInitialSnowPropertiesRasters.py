@@ -13,48 +13,41 @@
 #-------------------------------------------------------------------------------
 
 '''======Define internal functions======'''
-
+#snow properties of one tile of the elevation raster (see snowProperties)
+def snowPropertiesTile(tile_grid, elevation):
+    return snowProperties.snowProperties(elevation)
 
 
 
 '''==== start script ======'''
 #Import necessary modules
 import arcpy
-from arcpy.sa import *
 
-#Check-out necessary extensions
-arcpy.CheckOutExtension('Spatial')
+import gridIO
+import instrumentation
+import snowProperties
+import tiledRasters
 
 #Set input parameters
 elevation_raster = arcpy.GetParameterAsText(0)
 
 #Setup workspace
-#output cell size should be the same as elevation raster cell size
-arcpy.env.cellSize = elevation_raster
-output_cell_size = arcpy.env.cellSize
-scratchGDB = arcpy.env.scratchGDB
 arcpy.env.overwriteOutput = True
 
 #Start Process
 
-#Density Equation: y = -0.0395(elevation) + 405.26
-arcpy.AddMessage("Creating snow density raster from linear interpolation")
-snow_density_raster = -0.0395 * Raster(elevation_raster) + 405.26
-snow_density_raster.save("snow_density")
-
-#Upper Layer Temperature Equation: y = -0.0008(elevation) + 0.1053
-arcpy.AddMessage("Creating upper snow layer temperature raster from linear interpolation")
-upper_layer_temperature = -0.0008 * Raster(elevation_raster) + 0.1053
-upper_layer_temperature.save("upper_layer_snow_temperature")
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createInitialSnowPropertiesRasters", arcpy.env.scratchFolder)
 
-#lower layer temperature equation: y = -0.0008(elevation) + 1.3056
-arcpy.AddMessage("Creating lower snow layer temperature raster from linear interpolation")
-lower_layer_temperature = -0.0008 * Raster(elevation_raster) + 1.3056
+#create the snow density, upper snow layer temperature and average snowcover
+#temperature rasters from linear interpolation, tile by tile
+arcpy.AddMessage("Creating snow properties rasters from linear interpolation")
+instrumentation.startStage("map_algebra")
+grid, spatial_reference = gridIO.describeRaster(elevation_raster)
+snow_density_raster, upper_layer_temperature, average_snowcover_temperature = tiledRasters.evaluateTiled(
+    snowPropertiesTile, {"elevation": elevation_raster}, snowProperties.SNOW_PROPERTY_GRIDS, grid, spatial_reference)
 
-#average snowcover temperature is the average of the upper and lower layer temperatures
-arcpy.AddMessage("Creating average snowcover temperature raster")
-average_snowcover_temperature = arcpy.sa.CellStatistics([upper_layer_temperature, lower_layer_temperature],"MEAN","NODATA")
-average_snowcover_temperature.save("average_snowcover_temperature")
+instrumentation.closeRun(arcpy.AddMessage)
 
 # Set output parameters
 arcpy.SetParameterAsText(1, snow_density_raster)
@@ -5,57 +5,75 @@
 #          precipitation mass that was snow, density of snow portion of the
 #          precipitation)
 # Input: 0- Dew-point temperature raster
+#        3- Lookup table (optional) with fields dewpoint_upper, percent_snow and
+#           snow_density, one row per dew-point bin (leave dewpoint_upper empty
+#           for the warmest bin). Defaults to precipitationProperties.DEFAULT_TABLE
 # Output: percent snow raster, density of snow portion raster
 # Output used in:
 #
 #-------------------------------------------------------------------------------
 
 '''======Define internal functions======'''
-
+#percent snow and snow density of one tile of the dew-point raster
+def precipitationPropertiesTile(tile_grid, dewpoint):
+    percent_snow, snow_density = precipitationProperties.classifyDewpoint(dewpoint, lookup_table)
+    return {"percent_snow": percent_snow, "snow_density_of_precipitation": snow_density}
 
 
 
 '''==== start script ======'''
 #Import necessary modules
 import arcpy
-from arcpy.sa import *
 
-#Check-out necessary extensions
-arcpy.CheckOutExtension('Spatial')
+import buildManifest
+import gridIO
+import instrumentation
+import precipitationProperties
+import tiledRasters
 
 #Set input parameters
 dp_temperature_raster = arcpy.GetParameterAsText(0)
+lookup_table_path = arcpy.GetParameterAsText(3)
 
 #Setup workspace
-#output cell size should be the same as dp temp raster cell size
-arcpy.env.cellSize = dp_temperature_raster
-output_cell_size = arcpy.env.cellSize
-scratchGDB = arcpy.env.scratchGDB
 arcpy.env.overwriteOutput = True
 
 #Start Script
 
-#Percent snow conditional:
-arcpy.AddMessage("Creating raster for percentage of precipitation that was snow")
-inRas = Raster(dp_temperature_raster)
-outPercentSnowRaster = arcpy.sa.Con(inRas < -5.0, 1.0, Con((inRas >= -5.0) & (inRas < -3.0), 1.0,
-                                                           Con((inRas >= -3) & (inRas < -1.5), 1.0,
-                                                               Con((inRas >= -1.5) & (inRas < -0.5), 1.0,
-                                                                   Con((inRas >= -0.5) & (inRas < 0), 0.75,
-                                                                       Con((inRas >= 0) & (inRas < 0.5), 0.25,
-                                                                           Con(inRas >= 0.5,0)))))))
-outPercentSnowRaster.save("percent_snow")
-
-#Snow density conditional:
-arcpy.AddMessage("Creating raster for density of snow portion of precipitation")
-outSnowDensityRaster = arcpy.sa.Con(inRas < -5.0, 75.0, Con((inRas >= -5.0) & (inRas < -3.0), 100.0,
-                                                           Con((inRas >= -3) & (inRas < -1.5), 150.0,
-                                                               Con((inRas >= -1.5) & (inRas < -0.5), 175.0,
-                                                                   Con((inRas >= -0.5) & (inRas < 0), 200.0,
-                                                                       Con((inRas >= 0) & (inRas < 0.5), 250.0,
-                                                                           Con(inRas >= 0.5,0)))))))
-outSnowDensityRaster.save("snow_density_of_precipitation")
-
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createPrecipitationPropertiesRasters", arcpy.env.scratchFolder)
+
+#read the dew-point lookup curves
+if lookup_table_path:
+    arcpy.AddMessage("Reading lookup table")
+    instrumentation.startStage("extraction")
+    lookup_table = precipitationProperties.makeTable(
+        *gridIO.readTable(lookup_table_path, ["dewpoint_upper", "percent_snow", "snow_density"]))
+else:
+    lookup_table = precipitationProperties.DEFAULT_TABLE
+
+#keep the rasters if they were made from the same dew-point raster (see
+#gridIO.rasterSignature), lookup table and code
+instrumentation.startStage("manifest")
+output_names = ["percent_snow", "snow_density_of_precipitation"]
+manifest = buildManifest.openManifest(buildManifest.manifestPath(arcpy.env.workspace))
+key = buildManifest.inputKey(buildManifest.codeVersion([__file__, precipitationProperties.__file__]),
+                             gridIO.rasterSignature(dp_temperature_raster), list(lookup_table))
+if all(buildManifest.isFresh(manifest, name, key) and arcpy.Exists(name) for name in output_names):
+    arcpy.AddMessage("Percent snow and snow density rasters are up to date")
+    outPercentSnowRaster, outSnowDensityRaster = [arcpy.Raster(name) for name in output_names]
+else:
+    #classify the dew-point raster into percent snow and density of the snow portion
+    arcpy.AddMessage("Creating rasters for percentage of precipitation that was snow and density of snow portion")
+    instrumentation.startStage("map_algebra")
+    grid, spatial_reference = gridIO.describeRaster(dp_temperature_raster)
+    outPercentSnowRaster, outSnowDensityRaster = tiledRasters.evaluateTiled(precipitationPropertiesTile,
+        {"dewpoint": dp_temperature_raster}, output_names, grid, spatial_reference)
+    for name in output_names:
+        buildManifest.record(manifest, name, key)
+    buildManifest.saveManifest(manifest)
+
+instrumentation.closeRun(arcpy.AddMessage)
 
 # Set output parameters
 arcpy.SetParameterAsText(1, outPercentSnowRaster)
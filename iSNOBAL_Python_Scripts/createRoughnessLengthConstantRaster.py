@@ -21,6 +21,8 @@
 import arcpy
 from arcpy.sa import *
 
+import instrumentation
+
 #Check-out necessary extensions
 arcpy.CheckOutExtension('Spatial')
 
@@ -40,18 +42,26 @@ arcpy.env.overwriteOutput = True
 currentWS = arcpy.env.workspace
 roughnessLengthRaster = currentWS + "\\roughness_length"
 
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createRoughnessLengthConstantRaster", arcpy.env.scratchFolder)
+
 #Get coordinate system information
+instrumentation.startStage("extraction")
 desc = arcpy.Describe(elevation_raster)
 coordSystem = desc.spatialReference
 
 # Process: Create Constant Raster
 arcpy.AddMessage("Creating constant roughness length raster")
+instrumentation.startStage("map_algebra")
 arcpy.gp.CreateConstantRaster_sa(roughnessLengthRaster, constant_value, "FLOAT", output_cell_size, elevation_raster)
 
 # Process: Define Projection
 arcpy.AddMessage("Defining coordinate system")
+instrumentation.startStage("save")
 arcpy.DefineProjection_management(roughnessLengthRaster,coordSystem)
 
+instrumentation.closeRun(arcpy.AddMessage)
+
 # Set output parameter
 arcpy.SetParameterAsText(2, roughnessLengthRaster)
 '''==== end script ======'''
@@ -20,6 +20,8 @@
 import arcpy
 from arcpy.sa import *
 
+import instrumentation
+
 #Check-out necessary extensions
 arcpy.CheckOutExtension('Spatial')
 
@@ -39,18 +41,26 @@ arcpy.env.overwriteOutput = True
 currentWS = arcpy.env.workspace
 soilTemperatureRaster = currentWS + "\\soil_temperature"
 
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createSoilTemperatureConstantRaster", arcpy.env.scratchFolder)
+
 #Get coordinate system information
+instrumentation.startStage("extraction")
 desc = arcpy.Describe(elevation_raster)
 coordSystem = desc.spatialReference
 
 # Process: Create Constant Raster
 arcpy.AddMessage("Creating constant soil temperature raster")
+instrumentation.startStage("map_algebra")
 arcpy.gp.CreateConstantRaster_sa(soilTemperatureRaster, constant_value, "FLOAT", output_cell_size, elevation_raster)
 
 # Process: Define Projection
 arcpy.AddMessage("Defining coordinate system")
+instrumentation.startStage("save")
 arcpy.DefineProjection_management(soilTemperatureRaster,coordSystem)
 
+instrumentation.closeRun(arcpy.AddMessage)
+
 # Set output parameter
 arcpy.SetParameterAsText(2, soilTemperatureRaster)
 '''==== end script ======'''
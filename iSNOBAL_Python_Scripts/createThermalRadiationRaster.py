@@ -21,17 +21,21 @@
 #-------------------------------------------------------------------------------
 
 '''======Define internal functions======'''
-
+#thermal radiation of one tile of the input rasters (see thermalRadiation)
+def thermalRadiationTile(tile_grid, z, vf, T_a, vp):
+    return {"thermal_radiation": thermalRadiation.thermalRadiation(z, vf, T_a, vp, P_m, T_m, z_m, T_s)}
 
 
 
 '''==== start script ======'''
 #Import necessary modules
 import arcpy
-from arcpy.sa import *
 
-#Check-out necessary extensions
-arcpy.CheckOutExtension('Spatial')
+import buildManifest
+import gridIO
+import instrumentation
+import thermalRadiation
+import tiledRasters
 
 #Set input parameters
 elevation_raster = arcpy.GetParameterAsText(0)
@@ -44,64 +48,42 @@ reference_elevation = arcpy.GetParameter(6)
 surface_air_temperature = arcpy.GetParameter(7)
 
 #Setup workspace
-#output cell size should be the same as elevation raster cell size
-arcpy.env.cellSize = elevation_raster
-output_cell_size = arcpy.env.cellSize
-scratchGDB = arcpy.env.scratchGDB
 arcpy.env.overwriteOutput = True
 
-#Constants and re-defined variables (See Marks and Dozier (1979), pg. 160)
-z = elevation_raster
-vf = view_factor_raster
-T_a = air_temperature_raster
-vp = vapor_pressure_raster
+#Reference values (See Marks and Dozier (1979), pg. 160)
 P_m = reference_air_pressure
 T_m = reference_air_temperature
 z_m = reference_elevation
 T_s = surface_air_temperature
-g = 9.8
-m = 0.0289
-R = 8.3143
-sigma = 5.6697*10**-8
-epsilon_s = 0.95
-gamma = -0.006
-
-#convert temperature parameters to Kelvin
-arcpy.AddMessage("Converting temperature parameters to Kelvin")
-T_m = T_m + 274.15
-T_s = T_s + 274.15
-T_a = arcpy.sa.Float(Raster(T_a) + 274.15)
-
-#Correct air temperature and vapor pressure rasters (Marks and Dozier (1979), pg. 164)
-arcpy.AddMessage("Correcting air temperature and vapor pressure rasters")
-T_prime = T_a + (0.0065 * Raster(elevation_raster)) #(4) corrected air temperature
-e_sa = arcpy.sa.Float(6.11 * 10**((7.5*arcpy.sa.Float(T_a))/(237.3 + arcpy.sa.Float(T_a)))) #saturated vapor pressure from original air temperature (T_a)
-e_sprime = arcpy.sa.Float(6.11 * 10**((7.5*arcpy.sa.Float(T_a))/(237.3 + arcpy.sa.Float(T_a)))) #saturated vapor pressure from corrected air temperature (T_prime)
-rh = arcpy.sa.Float(vp / e_sa) #(5) relative humidity
-e_prime = arcpy.sa.Float(rh * e_sprime) #(6) corrected vapor pressure
-
-#Pressure at a given elevation (Marks and Dozier (1979), pg. 168-169)
-arcpy.AddMessage("Calculating air pressures at given elevations")
-term1 = ((-g*m)/(R*gamma))
-delta_z = Raster(z) - z_m
-term2 = ((T_m + gamma * delta_z)) / T_m
-lnTerm = arcpy.sa.Ln(term2)
-expTerm = arcpy.sa.Exp(term1 * lnTerm)
-P_a = P_m * expTerm #(10) air pressure
-
-#effective emissivity (Marks and Dozier (1979), pg. 164)
-arcpy.AddMessage("Calculating effective emissivity")
-epsilon_a = arcpy.sa.Float((1.24 * (e_prime / T_prime)**(1/7)) * (P_a / 1013.0)) #(7)
-
-#Incoming longwave radiation (Marks and Dozier (1979), pg. 164)
-arcpy.AddMessage("Calculating incoming longwave radiation")
-term3 = arcpy.sa.Float((epsilon_a * sigma * (T_a ** 4)) * vf)
-term4 = arcpy.sa.Float(epsilon_s * sigma * (T_s ** 4))
-term5 = (1 - Raster(vf))
-output_thermal_radiation = arcpy.sa.Float(term3 + (term4 * term5)) #(9)
-arcpy.AddMessage("Creating final raster")
-output_thermal_radiation.save("thermal_radiation")
 
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createThermalRadiationRaster", arcpy.env.scratchFolder)
+
+#keep the raster if it was made from the same input rasters (see
+#gridIO.rasterSignature; an upstream raster that was kept is not rewritten, so
+#its signature stays the same), reference values and code
+instrumentation.startStage("manifest")
+manifest = buildManifest.openManifest(buildManifest.manifestPath(arcpy.env.workspace))
+key = buildManifest.inputKey(buildManifest.codeVersion([__file__, thermalRadiation.__file__]),
+                             [gridIO.rasterSignature(raster) for raster in [elevation_raster, view_factor_raster,
+                                                                            air_temperature_raster,
+                                                                            vapor_pressure_raster]],
+                             [P_m, T_m, z_m, T_s])
+if buildManifest.isFresh(manifest, "thermal_radiation", key) and arcpy.Exists("thermal_radiation"):
+    arcpy.AddMessage("thermal_radiation is up to date")
+    output_thermal_radiation = arcpy.Raster("thermal_radiation")
+else:
+    #Calculate incoming longwave radiation tile by tile over the elevation grid
+    arcpy.AddMessage("Calculating incoming longwave radiation")
+    instrumentation.startStage("map_algebra")
+    grid, spatial_reference = gridIO.describeRaster(elevation_raster)
+    output_thermal_radiation = tiledRasters.evaluateTiled(thermalRadiationTile,
+        {"z": elevation_raster, "vf": view_factor_raster, "T_a": air_temperature_raster, "vp": vapor_pressure_raster},
+        ["thermal_radiation"], grid, spatial_reference)[0]
+    buildManifest.record(manifest, "thermal_radiation", key)
+    buildManifest.saveManifest(manifest)
+
+instrumentation.closeRun(arcpy.AddMessage)
 
 # Set output parameter
 arcpy.SetParameterAsText(8, output_thermal_radiation)
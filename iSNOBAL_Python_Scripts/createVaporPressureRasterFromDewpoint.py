@@ -30,6 +30,10 @@ import numpy
 from scipy import stats
 import arcpy.mapping
 
+import buildManifest
+import gridIO
+import instrumentation
+
 #Check-out necessary extensions
 arcpy.CheckOutExtension('Spatial')
 
@@ -45,10 +49,28 @@ arcpy.env.overwriteOutput = True
 
 #Start process
 
-inRaster = Raster(dewPoint_raster)
+#time the stages of the run (see instrumentation)
+instrumentation.openRun("createVaporPressureRasterFromDewpoint", arcpy.env.scratchFolder)
+
+#keep the raster if it was made from the same dew-point raster (see
+#gridIO.rasterSignature) and code
+instrumentation.startStage("manifest")
+manifest = buildManifest.openManifest(buildManifest.manifestPath(arcpy.env.workspace))
+key = buildManifest.inputKey(buildManifest.codeVersion([__file__]), gridIO.rasterSignature(dewPoint_raster))
+if buildManifest.isFresh(manifest, "vapor_pressure_from_dewpoint", key) and arcpy.Exists("vapor_pressure_from_dewpoint"):
+    arcpy.AddMessage("vapor_pressure_from_dewpoint is up to date")
+    output_raster = Raster("vapor_pressure_from_dewpoint")
+else:
+    instrumentation.startStage("map_algebra")
+    inRaster = Raster(dewPoint_raster)
+
+    output_raster = arcpy.sa.Float(6.11 * 10 ** ((7.5 * arcpy.sa.Float(inRaster))/(237.3 + arcpy.sa.Float(inRaster))))*100
+    instrumentation.startStage("save")
+    output_raster.save("vapor_pressure_from_dewpoint")
+    buildManifest.record(manifest, "vapor_pressure_from_dewpoint", key)
+    buildManifest.saveManifest(manifest)
 
-output_raster = arcpy.sa.Float(6.11 * 10 ** ((7.5 * arcpy.sa.Float(inRaster))/(237.3 + arcpy.sa.Float(inRaster))))*100
-output_raster.save("vapor_pressure_from_dewpoint")
+instrumentation.closeRun(arcpy.AddMessage)
 
 # Set output parameter
 arcpy.SetParameterAsText(1, output_raster)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: detrendedKriging
+# Purpose: In-memory implementation of the detrended kriging methods outlined
+#          by Susong, Marks, and Garen (1999). Station values are regressed
+#          against elevation, the residuals are kriged onto the elevation grid
+#          and the elevation trend is added back to the kriged residuals.
+# Input: station coordinates, station values, elevation array and GridSpec
+# Output: DetrendedSurface (estimated grid plus regression results)
+# Used in: 1- createAirTemperatureRaster
+#          2- createDewpointTemperatureRaster
+#          3- createVaporPressureRaster
+#          4- createPrecipitationMassRaster
+#          5- createInitialSnowDepthRaster
+#          6- createSoilTemperatureRaster
+#          7- createDetrendedKrigingRasters
+#          8- forcingSeries
+#          9- forcingPipeline
+#
+# Note: Residuals are interpolated with ordinary kriging using an exponential
+#       covariance model. Ordinary kriging weights do not depend on the sill,
+#       so the model only needs a practical range and the nugget as a fraction
+#       of the sill. The range defaults to a third of the largest distance
+#       between stations.
+#
+#       Over a run of many timesteps the weights that map station residuals to
+#       grid cells only change when the set of reporting stations does, so
+#       they can be cached per station set and grid (use_cache=True). Each
+#       cached set costs 4 bytes per cell per station (1.6 GB for a 2000 x 2000
+#       grid and 100 stations), so the cache is bounded by WEIGHT_CACHE_BYTES and
+#       a station set whose weights alone exceed it is kriged without the cache.
+#
+#       The elevation trend is fitted by ordinary least squares unless a
+#       robust fit of robustRegression is asked for ("trend_method").
+#
+#       An hour in which too few stations report a variable (e.g. a gauge
+#       outage) does not stop a run: with fewer than
+#       robustRegression.MIN_TREND_STATIONS no trend is fitted and the grid is
+#       no-data, and with a trend but no station residuals (a cached or
+#       smoothed trend) the grid is the trend alone. Both are reported with
+#       arcpy.AddWarning.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import hashlib
+import numpy
+import scipy.linalg
+
+import gridTools
+import instrumentation
+import robustRegression
+
+'''======Define internal functions======'''
+#Result of a detrended kriging run ("model" is the robustRegression.TrendModel of
+#the elevation trend; slope and intercept are its lowest band's)
+DetrendedSurface = collections.namedtuple("DetrendedSurface",
+    ["surface", "slope", "intercept", "r_value", "station_elevation", "residual", "used", "model",
+     "loo_residual", "outlier"])
+
+#station data fields kriged for the iSNOBAL forcing grids and the names of the
+#rasters they are saved as
+KRIGED_VARIABLES = collections.OrderedDict([
+    ("air_temperature", "air_temperature"),
+    ("dewpoint_temperature", "dewpoint_temperature"),
+    ("vapor_pressure", "vapor_pressure"),
+    ("ppts", "precipitation_mass"),
+    ("snow_depth", "snow_depth")])
+
+#fields that are only fitted to stations with a positive value and whose grids
+#are set to 0 where the estimate is negative
+NON_NEGATIVE_FIELDS = ["snow_depth"]
+
+#bytes of the (rows, columns, stations) cell-to-station covariance array of a
+#block of grid rows; the rows kriged at a time are chosen to stay within it (see
+#blockRows)
+BLOCK_BYTES = 1 << 26
+
+#bytes of station-set/grid weight matrices kept in memory (the least recently
+#used ones are dropped first)
+WEIGHT_CACHE_BYTES = 1 << 29
+
+#factorized kriging system and per-cell weights ((cells, stations) float32 array
+#in row-major cell order) for one station set and grid
+KrigingWeights = collections.namedtuple("KrigingWeights", ["factor", "weights"])
+
+#weight cache {key: KrigingWeights} in least to most recently used order
+_weight_cache = collections.OrderedDict()
+
+#fewest stations whose residuals are kriged
+MIN_KRIGING_STATIONS = 1
+
+#report a variable whose grid is not estimated as usual (arcpy is only imported
+#here, so the module can be used without ArcGIS)
+def _warn(message):
+    import arcpy
+    arcpy.AddWarning(message)
+
+#default practical range: one third of the largest distance between stations
+#(1 for fewer than two stations)
+def defaultRange(station_x, station_y):
+    if len(station_x) < 2:
+        return 1.0
+    dx = station_x[:, None] - station_x[None, :]
+    dy = station_y[:, None] - station_y[None, :]
+    max_distance = numpy.sqrt(dx**2 + dy**2).max()
+    if max_distance <= 0:
+        return 1.0
+    return max_distance / 3.0
+
+#exponential covariance model scaled to a unit sill
+def exponentialCovariance(distance, variogram_range, nugget):
+    covariance = (1.0 - nugget) * numpy.exp(-3.0 * distance / variogram_range)
+    covariance[distance == 0] = 1.0
+    return covariance
+
+#number of grid rows whose cell-to-station covariances fit in BLOCK_BYTES
+def blockRows(grid, n_stations):
+    return max(1, min(grid.n_rows, BLOCK_BYTES // (8 * grid.n_cols * max(n_stations, 1))))
+
+#exponential covariances between the cells of a block (rows at "cell_y",
+#columns at "cell_x") and the stations as a (rows, columns, stations) array,
+#computed in place in that one array
+def cellCovariance(cell_x, cell_y, station_x, station_y, variogram_range, nugget):
+    covariance = numpy.add(((cell_y[:, None] - station_y[None, :])**2)[:, None, :],
+                           ((cell_x[:, None] - station_x[None, :])**2)[None, :, :])
+    at_station = covariance == 0
+    numpy.sqrt(covariance, out=covariance)
+    covariance *= -3.0 / variogram_range
+    numpy.exp(covariance, out=covariance)
+    covariance *= 1.0 - nugget
+    covariance[at_station] = 1.0
+    return covariance
+
+#build the ordinary kriging system (station covariances bordered by the
+#unbiasedness constraint)
+def krigingMatrix(station_x, station_y, variogram_range, nugget):
+    n = len(station_x)
+    dx = station_x[:, None] - station_x[None, :]
+    dy = station_y[:, None] - station_y[None, :]
+    matrix = numpy.ones((n + 1, n + 1))
+    matrix[:n, :n] = exponentialCovariance(numpy.sqrt(dx**2 + dy**2), variogram_range, nugget)
+    matrix[n, n] = 0.0
+    return matrix
+
+#cache key of a station set, grid and covariance model
+def weightKey(station_x, station_y, grid, variogram_range, nugget):
+    digest = hashlib.sha1()
+    digest.update(numpy.ascontiguousarray(station_x, dtype=numpy.float64).tobytes())
+    digest.update(numpy.ascontiguousarray(station_y, dtype=numpy.float64).tobytes())
+    digest.update(repr((tuple(grid), float(variogram_range), float(nugget))).encode("utf-8"))
+    return digest.hexdigest()
+
+#bytes of the weight matrix of "n_stations" stations on a grid
+def weightBytes(grid, n_stations):
+    return grid.n_rows * grid.n_cols * n_stations * numpy.dtype(numpy.float32).itemsize
+
+#ordinary kriging weights of every grid cell for a station set. The kriging system
+#is factorized once and the weights are kept in an LRU cache of at most
+#WEIGHT_CACHE_BYTES, so later timesteps reported by the same stations only cost
+#one matrix-vector product. Returns None if the weights would not fit in the
+#cache.
+def krigingWeights(station_x, station_y, grid, variogram_range, nugget):
+    n = len(station_x)
+    size = weightBytes(grid, n)
+    if size > WEIGHT_CACHE_BYTES:
+        return None
+    key = weightKey(station_x, station_y, grid, variogram_range, nugget)
+    cached = _weight_cache.pop(key, None)
+    if cached is None:
+        factor = scipy.linalg.lu_factor(krigingMatrix(station_x, station_y, variogram_range, nugget))
+        weights = numpy.empty((grid.n_rows * grid.n_cols, n), dtype=numpy.float32)
+        cell_x = gridTools.columnCenters(grid)
+        block_rows = blockRows(grid, n)
+        for row_start in range(0, grid.n_rows, block_rows):
+            row_stop = min(row_start + block_rows, grid.n_rows)
+            cell_y = gridTools.rowCenters(grid, row_start, row_stop)
+            rhs = numpy.ones((n + 1, (row_stop - row_start) * grid.n_cols))
+            rhs[:n] = cellCovariance(cell_x, cell_y, station_x, station_y, variogram_range, nugget).reshape(-1, n).T
+            weights[row_start * grid.n_cols:row_stop * grid.n_cols] = scipy.linalg.lu_solve(factor, rhs)[:n].T
+        cached = KrigingWeights(factor, weights)
+        while _weight_cache and \
+                sum(entry.weights.nbytes for entry in _weight_cache.values()) + size > WEIGHT_CACHE_BYTES:
+            _weight_cache.popitem(last=False)
+    _weight_cache[key] = cached
+    return cached
+
+#drop every cached weight matrix
+def clearWeightCache():
+    _weight_cache.clear()
+
+#ordinary kriging of station residuals onto every cell of the grid. The system
+#is solved once in its dual form, so each cell only costs one covariance vector
+#and a dot product. "residual" may be a (stations, variables) array, in which
+#case every variable is kriged from the same covariances and the output has a
+#trailing variable axis. With use_cache=True the cached per-cell weights of the
+#station set are used instead (see krigingWeights), unless they are too large to
+#cache. The output is NaN with fewer than MIN_KRIGING_STATIONS stations.
+def krigeResiduals(station_x, station_y, residual, grid, variogram_range=None, nugget=0.0, mask=None, use_cache=False):
+    station_x = numpy.asarray(station_x, dtype=numpy.float64)
+    station_y = numpy.asarray(station_y, dtype=numpy.float64)
+    residual = numpy.asarray(residual, dtype=numpy.float64)
+    n = residual.shape[0]
+    if n < MIN_KRIGING_STATIONS:
+        return numpy.full((grid.n_rows, grid.n_cols) + residual.shape[1:], numpy.nan)
+    if variogram_range is None:
+        variogram_range = defaultRange(station_x, station_y)
+
+    weights = krigingWeights(station_x, station_y, grid, variogram_range, nugget) if use_cache else None
+    if weights is not None:
+        output = weights.weights.dot(residual.reshape(n, -1)).reshape((grid.n_rows, grid.n_cols) +
+                                                                      residual.shape[1:])
+        if mask is not None:
+            output[~mask] = numpy.nan
+        return output
+
+    rhs = numpy.zeros((n + 1,) + residual.shape[1:])
+    rhs[:n] = residual
+    dual = numpy.linalg.solve(krigingMatrix(station_x, station_y, variogram_range, nugget), rhs)
+
+    output = numpy.empty((grid.n_rows, grid.n_cols) + residual.shape[1:])
+    cell_x = gridTools.columnCenters(grid)
+    block_rows = blockRows(grid, n)
+    for row_start in range(0, grid.n_rows, block_rows):
+        row_stop = min(row_start + block_rows, grid.n_rows)
+        cell_y = gridTools.rowCenters(grid, row_start, row_stop)
+        covariance = cellCovariance(cell_x, cell_y, station_x, station_y, variogram_range, nugget)
+        output[row_start:row_stop] = covariance.dot(dual[:n]) + dual[n]
+
+    if mask is not None:
+        output[~mask] = numpy.nan
+    return output
+
+#Regression of one variable on elevation (residual, loo_residual and outlier are
+#aligned with the used stations; r_value carries the sign of the slope)
+TrendFit = collections.namedtuple("TrendFit", ["used", "slope", "intercept", "r_value", "residual", "model",
+                                               "loo_residual", "outlier"])
+
+#regress every variable in "station_values" ({name: values aligned with the
+#stations}) on the station elevations with a robustRegression.TREND_METHODS
+#method. Stations on "no-data" or non-positive elevations, or with a missing
+#value, are left out of that variable's fit. The variables in "models" ({name:
+#robustRegression.TrendModel}, e.g. cached or smoothed coefficients) use that
+#model instead of a new fit. A variable reported by fewer than
+#robustRegression.MIN_TREND_STATIONS stations is warned about and gets a
+#robustRegression.missingTrend. Returns an OrderedDict {name: TrendFit}.
+def fitTrends(station_values, station_elevation, trend_method="ols", models=None):
+    has_elevation = numpy.isfinite(station_elevation) & (station_elevation > 0)
+    fits = collections.OrderedDict()
+    for name, values in station_values.items():
+        values = numpy.asarray(values, dtype=numpy.float64)
+        used = has_elevation & numpy.isfinite(values)
+        if models and name in models:
+            result = robustRegression.applyTrend(models[name], station_elevation[used], values[used])
+        elif numpy.count_nonzero(used) < robustRegression.MIN_TREND_STATIONS:
+            _warn(name + ": " + str(numpy.count_nonzero(used)) + " station(s) with data, too few to fit an "
+                  "elevation trend; the grid is no-data")
+            result = robustRegression.missingTrend(trend_method, values[used])
+        else:
+            result = robustRegression.fitTrend(station_elevation[used], values[used], trend_method)
+        slope, intercept = result.model.coefficients[1], result.model.coefficients[0]
+        r_value = numpy.copysign(numpy.sqrt(max(result.r_squared, 0.0)), slope)
+        fits[name] = TrendFit(used, slope, intercept, r_value, result.residual, result.model,
+                              result.loo_residual, result.outlier)
+    return fits
+
+#site keys of the stations flagged as outliers of a fit (TrendFit or
+#DetrendedSurface, see robustRegression.flagOutliers)
+def outlierStations(fit, site_keys):
+    used_keys = [key for key, used in zip(site_keys, fit.used) if used]
+    return [str(key) for key, outlier in zip(used_keys, fit.outlier) if outlier]
+
+#compact record of the trend fits in "results" ({name: TrendFit or
+#DetrendedSurface}): {name: {"method", "coefficients", "breaks", "r_squared",
+#"stations", "outliers"}}, with the outlier stations listed by site key
+def trendRecord(results, site_keys):
+    record = collections.OrderedDict()
+    for name, fit in results.items():
+        record[name] = collections.OrderedDict([
+            ("method", fit.model.method),
+            ("coefficients", [float(value) for value in fit.model.coefficients]),
+            ("breaks", list(fit.model.breaks)),
+            ("r_squared", float(fit.r_value**2)),
+            ("stations", int(numpy.count_nonzero(fit.used))),
+            ("outliers", outlierStations(fit, site_keys))])
+    return record
+
+#evaluate fitted trends plus kriged residuals on "elevation" (any grid or tile of
+#a grid). The residuals of all variables fitted to the same set of stations are
+#kriged together. Set krige=False to return the elevation trends only, and
+#use_cache=True to reuse the kriging weights of station sets seen before.
+#Variables with fewer than MIN_KRIGING_STATIONS stations are not kriged: their
+#surface is the trend alone (warned about if the trend is not no-data).
+#Returns {name: surface}.
+def trendSurfaces(fits, station_x, station_y, elevation, grid, krige=True, variogram_range=None, nugget=0.0, use_cache=False):
+    station_x = numpy.asarray(station_x, dtype=numpy.float64)
+    station_y = numpy.asarray(station_y, dtype=numpy.float64)
+
+    #group the variables by the stations they use
+    groups = collections.OrderedDict()
+    for name, fit in fits.items():
+        groups.setdefault(fit.used.tobytes(), []).append(name)
+
+    surfaces = {}
+    for names in groups.values():
+        used = fits[names[0]].used
+        krige_group = krige and numpy.count_nonzero(used) >= MIN_KRIGING_STATIONS
+        if krige_group:
+            residual = numpy.column_stack([fits[name].residual for name in names])
+            kriged = krigeResiduals(station_x[used], station_y[used], residual, grid, variogram_range, nugget,
+                                    use_cache=use_cache)
+        for k, name in enumerate(names):
+            #Equation to follow for final raster:
+                #final = resid_raster + slope*elevation_raster + intercept
+            #(plus the slope changes above the band breaks of a piecewise fit)
+            surface = robustRegression.evaluateTrend(fits[name].model, elevation)
+            if krige_group:
+                surface += kriged[:, :, k]
+            elif krige and numpy.all(numpy.isfinite(fits[name].model.coefficients)):
+                _warn(name + ": no station residuals to krige; the grid is the elevation trend alone")
+            surfaces[name] = surface
+    return surfaces
+
+#Batch detrended kriging: extract station elevations once, regress every
+#variable in "station_values" ({name: values aligned with station_x}) on
+#elevation with "trend_method" (see fitTrends) and krige the residuals (see
+#trendSurfaces). Pass "station_elevation" (e.g. from a stationIndex.StationIndex)
+#to skip the extraction, and "fits" (see fitTrends) to use trend fits made
+#beforehand instead of regressing. Returns {name: DetrendedSurface}.
+def detrendedKrigingBatch(station_x, station_y, station_values, elevation, grid, krige=True, variogram_range=None, nugget=0.0, use_cache=False, station_elevation=None, trend_method="ols", fits=None):
+    #extract elevations to stations
+    if station_elevation is None:
+        with instrumentation.stage("extraction"):
+            station_elevation = gridTools.sampleGrid(elevation, grid, station_x, station_y)
+
+    if fits is None:
+        with instrumentation.stage("regression"):
+            fits = fitTrends(station_values, station_elevation, trend_method)
+    with instrumentation.stage("kriging" if krige else "map_algebra"):
+        surfaces = trendSurfaces(fits, station_x, station_y, elevation, grid, krige, variogram_range, nugget, use_cache)
+
+    results = {}
+    for name, fit in fits.items():
+        results[name] = DetrendedSurface(surfaces[name], fit.slope, fit.intercept, fit.r_value,
+                                         station_elevation, fit.residual, fit.used, fit.model, fit.loo_residual,
+                                         fit.outlier)
+    return results
+
+#Detrended kriging of a single variable (see detrendedKrigingBatch)
+def detrendedKriging(station_x, station_y, station_values, elevation, grid, krige=True, variogram_range=None, nugget=0.0, station_elevation=None, trend_method="ols"):
+    return detrendedKrigingBatch(station_x, station_y, {"value": station_values}, elevation, grid,
+                                 krige, variogram_range, nugget, station_elevation=station_elevation,
+                                 trend_method=trend_method)["value"]
+
+#station values of the forcing variables in "station_means" ({field: station
+#means}, see KRIGED_VARIABLES) with the NON_NEGATIVE_FIELDS stations rule applied
+def forcingStationValues(station_means):
+    station_values = collections.OrderedDict()
+    for field in station_means:
+        values = numpy.array(station_means[field], dtype=numpy.float64)
+        if field in NON_NEGATIVE_FIELDS:
+            values[~(values > 0)] = numpy.nan
+        station_values[field] = values
+    return station_values
+
+#If the cell value of a NON_NEGATIVE_FIELDS surface is less than 0, set it equal to 0
+def clampForcingSurface(field, surface):
+    if field in NON_NEGATIVE_FIELDS:
+        return numpy.where(surface < 0, 0, surface)
+    return surface
+
+#Detrended kriging of the forcing variables in "station_means", applying the
+#NON_NEGATIVE_FIELDS rules ("fits" must be fitted to the forcingStationValues)
+def krigeForcingVariables(station_x, station_y, station_means, elevation, grid, use_cache=False, station_elevation=None, trend_method="ols", fits=None):
+    results = detrendedKrigingBatch(station_x, station_y, forcingStationValues(station_means), elevation, grid,
+                                    use_cache=use_cache, station_elevation=station_elevation,
+                                    trend_method=trend_method, fits=fits)
+    for field in results:
+        results[field] = results[field]._replace(surface=clampForcingSurface(field, results[field].surface))
+    return results
+
+'''=======References======='''
+#Susong, D., Marks, D., & Garen, D. (1999). Methods for developing time-series
+#   climate surfaces to drive topographically distributed energy- and
+#   water-balance models. Hydrological Processes, 13, 2003–2021.
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: forcingCube
+# Purpose: Writes the forcing grids of a run into one chunked, compressed
+#          NetCDF4 file, with one variable per forcing grid and time as the
+#          leading dimension, in place of one raster per grid and timestep.
+#          A season of forcing grids becomes one file that is read back
+#          sequentially, a timestep at a time.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- forcingSeries
+#
+# Note: Each timestep is chunked as bands of whole rows of about CHUNK_BYTES,
+#       so reading one timestep of a variable (the way iSNOBAL reads its
+#       inputs) reads a few contiguous chunks. The time axis grows as steps
+#       are written, and a step is written at its offset from the start of
+#       the cube's series (kept in the cube with its step), so steps can be
+#       written in any order and a rerun over other hours writes their own
+#       slots. A cube is only added to on the grid and series it was created
+#       with. The worker processes of a parallel run take turns through a
+#       lock file next to the cube.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import contextlib
+import datetime
+import errno
+import os
+import time
+import numpy
+
+import gridTools
+
+#netCDF4 is optional (only needed for NetCDF output)
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+'''======Define internal functions======'''
+#name of the cube file in the output workspace
+CUBE_NAME = "forcing.nc"
+
+#target size in bytes of one chunk (a band of rows of one timestep)
+CHUNK_BYTES = 1 << 22
+
+#zlib compression level of the variables
+COMPRESSION_LEVEL = 4
+
+#reference time of the time coordinate
+EPOCH = datetime.datetime(1970, 1, 1)
+
+#seconds to wait for the write lock of a cube, and between tries
+LOCK_TIMEOUT = 600
+LOCK_POLL = 0.05
+
+#chunk shape (time, rows, columns) of a forcing variable: one timestep and
+#whole rows, about CHUNK_BYTES of float32 cells
+def chunkShape(grid):
+    rows = max(1, min(grid.n_rows, CHUNK_BYTES // (4 * grid.n_cols)))
+    return (1, rows, grid.n_cols)
+
+#hold the write lock of the cube at "path" (a "<path>.lock" file created
+#exclusively) while a with block runs
+@contextlib.contextmanager
+def _writeLock(path):
+    lock_path = path + ".lock"
+    start = time.time()
+    while True:
+        try:
+            handle = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+            if time.time() - start > LOCK_TIMEOUT:
+                raise RuntimeError("timed out waiting for " + lock_path + " (delete it if no run is writing the cube)")
+            time.sleep(LOCK_POLL)
+    try:
+        yield
+    finally:
+        os.close(handle)
+        os.remove(lock_path)
+
+#GeoTransform of a grid as written in the cube's "crs" variable
+def _geoTransform(grid):
+    return "%r %r 0 %r 0 %r" % (grid.x_min, grid.cell_size, gridTools.gridYMax(grid), -grid.cell_size)
+
+#create an empty cube on "grid" for the series of "step_hours" hour timesteps
+#from "start": time, y and x dimensions with their cell-center coordinates, and
+#the coordinate system as CF grid-mapping WKT
+def _createCube(dataset, grid, crs_wkt, start, step_hours):
+    dataset.Conventions = "CF-1.6"
+    dataset.series_start = start.strftime("%Y-%m-%d %H:%M:%S")
+    dataset.step_hours = float(step_hours)
+    dataset.createDimension("time", None)
+    dataset.createDimension("y", grid.n_rows)
+    dataset.createDimension("x", grid.n_cols)
+
+    times = dataset.createVariable("time", "f8", ("time",))
+    times.units = "hours since " + EPOCH.strftime("%Y-%m-%d %H:%M:%S")
+    times.standard_name = "time"
+    y = dataset.createVariable("y", "f8", ("y",))
+    y.standard_name = "projection_y_coordinate"
+    y[:] = gridTools.rowCenters(grid)
+    x = dataset.createVariable("x", "f8", ("x",))
+    x.standard_name = "projection_x_coordinate"
+    x[:] = gridTools.columnCenters(grid)
+
+    crs = dataset.createVariable("crs", "i4")
+    crs.crs_wkt = crs_wkt
+    crs.spatial_ref = crs_wkt
+    crs.GeoTransform = _geoTransform(grid)
+
+#raise ValueError unless an existing cube is on "grid" and holds the series of
+#"step_hours" hour timesteps from "start"
+def _checkCube(dataset, path, grid, start, step_hours):
+    if (len(dataset.dimensions["y"]), len(dataset.dimensions["x"])) != (grid.n_rows, grid.n_cols) or \
+            dataset.variables["crs"].GeoTransform != _geoTransform(grid):
+        raise ValueError(path + " is on another grid; write to another workspace")
+    if dataset.series_start != start.strftime("%Y-%m-%d %H:%M:%S") or dataset.step_hours != float(step_hours):
+        raise ValueError(path + " holds the series of " + str(dataset.step_hours) + " hour timesteps from " +
+                         dataset.series_start + "; write to another workspace")
+
+#slot of "date_time" in the series of "step_hours" hour timesteps from "start"
+def cubeSlot(start, step_hours, date_time):
+    slot = (date_time - start).total_seconds() / 3600.0 / step_hours
+    if slot < 0 or slot != round(slot):
+        raise ValueError(str(date_time) + " is not a timestep of the series of " + str(step_hours) +
+                         " hour timesteps from " + str(start))
+    return int(round(slot))
+
+#variable of a forcing grid, created on first use
+def _cubeVariable(dataset, name, grid):
+    if name in dataset.variables:
+        return dataset.variables[name]
+    variable = dataset.createVariable(name, "f4", ("time", "y", "x"), zlib=True, complevel=COMPRESSION_LEVEL,
+                                      shuffle=True, chunksizes=chunkShape(grid), fill_value=numpy.float32(numpy.nan))
+    variable.grid_mapping = "crs"
+    variable.long_name = name
+    return variable
+
+#write the grids of one timestep ({grid name: array}) into its slot of the cube at
+#"path" (see cubeSlot), creating the cube (on "grid", with the "crs_wkt"
+#coordinate system, for the series of "step_hours" hour timesteps from "start")
+#if it does not exist yet. Raises ValueError if an existing cube is on another
+#grid or series, or holds another time in the slot.
+def writeCubeStep(path, grid, crs_wkt, start, step_hours, date_time, grids):
+    if netCDF4 is None:
+        raise ImportError("NetCDF output needs the netCDF4 package")
+    slot = cubeSlot(start, step_hours, date_time)
+    hours = (date_time - EPOCH).total_seconds() / 3600.0
+    with _writeLock(path):
+        exists = os.path.exists(path)
+        dataset = netCDF4.Dataset(path, "a" if exists else "w", format="NETCDF4")
+        try:
+            if exists:
+                _checkCube(dataset, path, grid, start, step_hours)
+            else:
+                _createCube(dataset, grid, crs_wkt, start, step_hours)
+            times = dataset.variables["time"]
+            if slot < len(times) and not numpy.ma.is_masked(times[slot]) and float(times[slot]) != hours:
+                raise ValueError(path + " holds another time in the slot of " + str(date_time))
+            times[slot] = hours
+            for name, array in grids.items():
+                _cubeVariable(dataset, name, grid)[slot, :, :] = numpy.asarray(array, dtype=numpy.float32)
+        finally:
+            dataset.close()
+
+'''=======References======='''
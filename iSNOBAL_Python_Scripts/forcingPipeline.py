@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: forcingPipeline
+# Purpose: The forcing toolchain as a pipeline of in-memory stages (see
+#          pipeline). The ordering that used to be wired by hand between the
+#          toolbox tools is declared here: thermal radiation needs the kriged
+#          air temperature and vapor pressure, vapor pressure from dew point and
+#          the precipitation properties need the kriged dew point, the solar
+#          radiation needs the terrain terms, and the initial snow properties,
+#          the terrain terms, the kriging and WindNinja only need the elevation
+#          grid and the station data, so those branches run at the same time.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createForcingRasters
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+
+import clearSky
+import detrendedKriging
+import pipeline
+import precipitationProperties
+import snowProperties
+import solarRadiation
+import thermalRadiation
+import windNinja
+
+'''======Define internal functions======'''
+#station data fields read for the pipeline (the station means of the period)
+STATION_FIELDS = list(detrendedKriging.KRIGED_VARIABLES) + ["in_solar_radiation"]
+
+#detrended kriging of every KRIGED_VARIABLES field in one batch (variables
+#reported by the same stations share one kriging system) with the
+#"trend_method" elevation fit; "trend_fits" holds the record of the fits by
+#grid name (see detrendedKriging.trendRecord)
+def krigingStage(elevation, grid, station_x, station_y, station_elevation, station_means, site_keys, trend_method):
+    results = detrendedKriging.krigeForcingVariables(station_x, station_y,
+        collections.OrderedDict((field, station_means[field]) for field in detrendedKriging.KRIGED_VARIABLES),
+        elevation, grid, station_elevation=station_elevation, trend_method=trend_method)
+    outputs = {}
+    for field, output_name in detrendedKriging.KRIGED_VARIABLES.items():
+        outputs[output_name] = results[field].surface
+    outputs["trend_fits"] = detrendedKriging.trendRecord(
+        collections.OrderedDict((output_name, results[field])
+                                for field, output_name in detrendedKriging.KRIGED_VARIABLES.items()), site_keys)
+    return outputs
+
+#incoming thermal radiation (see thermalRadiation)
+def thermalRadiationStage(elevation, view_factor, air_temperature, vapor_pressure, reference_air_pressure,
+                          reference_air_temperature, reference_elevation, surface_air_temperature):
+    return {"thermal_radiation": thermalRadiation.thermalRadiation(elevation, view_factor, air_temperature,
+        vapor_pressure, reference_air_pressure, reference_air_temperature, reference_elevation,
+        surface_air_temperature)}
+
+#vapor pressure (Pa) from dew-point temperature (C), as in
+#createVaporPressureRasterFromDewpoint
+def vaporPressureStage(dewpoint_temperature):
+    T = dewpoint_temperature
+    return {"vapor_pressure_from_dewpoint": 6.11 * 10**((7.5 * T) / (237.3 + T)) * 100}
+
+#percent snow and snow density of the precipitation (see precipitationProperties)
+def precipitationPropertiesStage(dewpoint_temperature, lookup_table):
+    percent_snow, snow_density = precipitationProperties.classifyDewpoint(dewpoint_temperature, lookup_table)
+    return {"percent_snow": percent_snow, "snow_density_of_precipitation": snow_density}
+
+#initial snowcover properties (see snowProperties)
+def snowPropertiesStage(elevation):
+    return snowProperties.snowProperties(elevation)
+
+#clear-sky terrain terms, loaded from or saved to "terrain_folder"
+def terrainStage(elevation, grid, latitude, longitude, terrain_folder):
+    return {"terrain": clearSky.cachedTerrainIndex(elevation, grid, latitude, longitude, terrain_folder)}
+
+#clear-sky radiation of the hour corrected to the observed station means
+def solarRadiationStage(terrain, elevation, grid, date_time, station_x, station_y, station_means,
+                        solar_correction):
+    simulated = clearSky.clearSkyRadiation(terrain, elevation, date_time)
+    return {"solar_radiation": solarRadiation.correctedRadiation(simulated, grid, station_x, station_y,
+                                                                 station_means["in_solar_radiation"],
+                                                                 solar_correction)}
+
+#WindNinja velocity grid of the hour, initialized with the hour's
+#"station_winds" (windNinja.StationWinds, or None for the station file's
+#winds), with the solver's output written to the "ninja_log" file (a run taking
+#more than windNinja.TIMEOUT seconds is killed and retried)
+def windVelocityStage(ninja_path, ninja_elevation, date_time, station_file, station_winds, grid, ninja_log):
+    with open(ninja_log, "a") as log_file:
+        def log(line):
+            log_file.write(line + "\n")
+        return {"wind_velocity": windNinja.retriedVelocity(ninja_path, ninja_elevation, date_time, station_file,
+                                                           grid, log=log, winds=station_winds)}
+
+#stages of the toolchain (inputs are named values given to pipeline.runPipeline
+#or produced by another stage)
+FORCING_STAGES = [
+    pipeline.Stage("kriging", krigingStage,
+                   ["elevation", "grid", "station_x", "station_y", "station_elevation", "station_means",
+                    "site_keys", "trend_method"],
+                   list(detrendedKriging.KRIGED_VARIABLES.values()) + ["trend_fits"]),
+    pipeline.Stage("thermal_radiation", thermalRadiationStage,
+                   ["elevation", "view_factor", "air_temperature", "vapor_pressure", "reference_air_pressure",
+                    "reference_air_temperature", "reference_elevation", "surface_air_temperature"],
+                   ["thermal_radiation"]),
+    pipeline.Stage("vapor_pressure_from_dewpoint", vaporPressureStage, ["dewpoint_temperature"],
+                   ["vapor_pressure_from_dewpoint"]),
+    pipeline.Stage("precipitation_properties", precipitationPropertiesStage,
+                   ["dewpoint_temperature", "lookup_table"], ["percent_snow", "snow_density_of_precipitation"]),
+    pipeline.Stage("snow_properties", snowPropertiesStage, ["elevation"], snowProperties.SNOW_PROPERTY_GRIDS),
+    pipeline.Stage("terrain", terrainStage, ["elevation", "grid", "latitude", "longitude", "terrain_folder"],
+                   ["terrain"]),
+    pipeline.Stage("solar_radiation", solarRadiationStage,
+                   ["terrain", "elevation", "grid", "date_time", "station_x", "station_y", "station_means",
+                    "solar_correction"], ["solar_radiation"]),
+    pipeline.Stage("wind_velocity", windVelocityStage,
+                   ["ninja_path", "ninja_elevation", "date_time", "station_file", "station_winds", "grid",
+                    "ninja_log"],
+                   ["wind_velocity"])]
+
+#grids the pipeline can save as rasters
+OUTPUT_GRIDS = list(detrendedKriging.KRIGED_VARIABLES.values()) + \
+    ["thermal_radiation", "vapor_pressure_from_dewpoint", "percent_snow", "snow_density_of_precipitation"] + \
+    snowProperties.SNOW_PROPERTY_GRIDS + ["solar_radiation", "wind_velocity"]
+
+#inputs of the stages needed for "output_grids" that no stage produces
+def requiredInputs(output_grids):
+    stages = pipeline.requiredStages(FORCING_STAGES, output_grids)
+    produced = set(output for stage in stages for output in stage.outputs)
+    return set(name for stage in stages for name in stage.inputs if name not in produced)
+
+'''=======References======='''
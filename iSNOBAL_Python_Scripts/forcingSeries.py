@@ -0,0 +1,757 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: forcingSeries
+# Purpose: Generates the iSNOBAL forcing grids (air temperature, vapor pressure,
+#          thermal radiation, solar radiation, precipitation mass and
+#          properties, and wind velocity) for every timestep of a run in one
+#          process. The elevation
+#          grid, view factor and station geometry are read once and reused for
+#          every timestep, and each timestep's grids are saved as soon as they
+#          are finished, either as rasters (ESRI grids or tiled GeoTIFFs),
+#          as iSNOBAL input and precipitation images or into one NetCDF
+#          cube (forcingCube). With a build manifest (buildManifest) only
+#          the outputs whose inputs changed since they were written are
+#          computed again (see GRID_INPUTS). The elevation trends of every
+#          timestep are fitted before the grids, so their coefficients can be
+#          cached and smoothed over time (see trendFits and trendSeries), and
+#          can be kept in a JSON-lines record (see appendTrendRecord).
+#          Outputs numbered by timestep (IPW images and cube slots) are
+#          numbered from the first timestep of the series in the output
+#          workspace, not of the run (see seriesOrigin), so a rerun over other
+#          hours never writes over another hour's output.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createForcingTimeSeries
+#
+# Note: The solar_radiation grid is the incoming global solar radiation. The IPW
+#       output writes it as the S_n band, which iSNOBAL reads as net solar
+#       radiation; no albedo is applied, so iSNOBAL is given more shortwave
+#       than the snow absorbs.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import arcpy
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+import numpy
+
+import buildManifest
+import clearSky
+import detrendedKriging
+import forcingCube
+import gridIO
+import instrumentation
+import ipwImage
+import precipitationProperties
+import robustRegression
+import solarRadiation
+import staticLayers
+import stationData
+import stationIndex
+import thermalRadiation
+import trendSeries
+import windCache
+import windNinja
+
+'''======Define internal functions======'''
+#data table fields used by the forcing grids
+STATION_FIELDS = ["air_temperature", "dewpoint_temperature", "vapor_pressure", "ppts", "in_solar_radiation"]
+
+#grids written for every timestep, in the order they are produced
+FORCING_GRIDS = ["air_temperature", "dewpoint_temperature", "vapor_pressure", "thermal_radiation",
+                 "solar_radiation", "precipitation_mass", "percent_snow", "snow_density_of_precipitation",
+                 "wind_velocity"]
+
+#inputs of every forcing grid, in an order where grids come after the grids they
+#are computed from: (station fields, forcing grids, ForcingSetup inputs and
+#"date_time" if the grid depends on the hour, modules computing it)
+GRID_INPUTS = collections.OrderedDict([
+    ("air_temperature", (["air_temperature"], [], ["elevation", "stations", "trend_method"],
+                         ["detrendedKriging", "robustRegression"])),
+    ("dewpoint_temperature", (["dewpoint_temperature"], [], ["elevation", "stations", "trend_method"],
+                              ["detrendedKriging", "robustRegression"])),
+    ("vapor_pressure", (["vapor_pressure"], [], ["elevation", "stations", "trend_method"],
+                        ["detrendedKriging", "robustRegression"])),
+    ("thermal_radiation", ([], ["air_temperature", "vapor_pressure"],
+                           ["elevation", "view_factor", "reference_air_pressure", "reference_air_temperature",
+                            "reference_elevation", "surface_air_temperature"], ["thermalRadiation"])),
+    ("solar_radiation", (["in_solar_radiation"], [], ["elevation", "stations", "solar_correction", "date_time"],
+                         ["clearSky", "solarPosition", "solarRadiation", "detrendedKriging"])),
+    ("precipitation_mass", (["ppts"], [], ["elevation", "stations", "trend_method"],
+                            ["detrendedKriging", "robustRegression"])),
+    ("percent_snow", ([], ["dewpoint_temperature"], [], ["precipitationProperties"])),
+    ("snow_density_of_precipitation", ([], ["dewpoint_temperature"], [], ["precipitationProperties"])),
+    ("wind_velocity", (windNinja.WIND_FIELDS, [], ["elevation", "station_file", "date_time"], ["windNinja"]))])
+
+#grids kriged from the station values of one field
+KRIGED_GRIDS = ["air_temperature", "dewpoint_temperature", "vapor_pressure", "precipitation_mass"]
+
+#timesteps computed between saves of the build manifest
+MANIFEST_SAVE_STEPS = 24
+
+#name of the record of the elevation trend fits beside the outputs (see
+#appendTrendRecord and buildManifest.manifestPath)
+TREND_RECORD_NAME = "trend_fits.jsonl"
+
+#name of the folder of trend coefficient series beside the outputs (see
+#trendSeries)
+TREND_SERIES_NAME = "trend_coefficients"
+
+#name of the file beside the outputs holding the origin of their series (see
+#seriesOrigin)
+SERIES_ORIGIN_NAME = "series_origin.json"
+
+#first timestep and hours between timesteps of the series of outputs in an
+#output workspace
+SeriesOrigin = collections.namedtuple("SeriesOrigin", ["start", "step_hours"])
+
+#static inputs shared by every timestep of a run
+ForcingSetup = collections.namedtuple("ForcingSetup", [
+    "elevation_raster", "elevation", "grid", "spatial_reference",
+    "site_keys", "station_x", "station_y", "stations", "view_factor", "station_file",
+    "reference_air_pressure", "reference_air_temperature", "reference_elevation",
+    "surface_air_temperature", "soil_temperature", "ninja_path", "ninja_elevation", "elevation_hash",
+    "view_factor_hash", "terrain", "solar_correction", "trend_method", "weight_cache", "series_origin", "scratch_workspace"])
+
+#read the static inputs of a run (the elevation raster is exported once for
+#WindNinja into a folder of the scratch folder, and the elevation and view
+#factor grids, the clear-sky terrain terms and the station index are mapped from
+#or saved to "terrain_folder", see staticLayers). The elevation and view factor
+#rasters are keyed by their signatures (gridIO.rasterSignature), so no worker
+#hashes their cells.
+#"solar_correction" is one of solarRadiation.CORRECTION_METHODS and
+#"trend_method" one of robustRegression.TREND_METHODS. With "weight_cache" the
+#kriging weights of every station set are kept in memory and reused by the
+#timesteps reported by the same stations (see detrendedKriging.krigingWeights).
+#"series_origin" (a SeriesOrigin, see seriesOrigin) numbers the timesteps of
+#writers that number their outputs (None numbers them from the run's first
+#timestep).
+def readSetup(elevation_raster, station_locations, view_factor_raster, station_file,
+              reference_air_pressure, reference_air_temperature, reference_elevation,
+              surface_air_temperature, soil_temperature, solar_correction, trend_method, weight_cache,
+              series_origin, terrain_folder, scratch_workspace):
+    elevation, grid, spatial_reference = staticLayers.readStaticRaster(elevation_raster, terrain_folder)
+    stations = stationIndex.readStationIndex(station_locations, elevation_raster, terrain_folder, elevation)
+    view_factor = staticLayers.readStaticRaster(view_factor_raster, terrain_folder)[0]
+    elevation_hash = gridIO.rasterSignature(elevation_raster)
+    return ForcingSetup(elevation_raster, elevation, grid, spatial_reference,
+                        stations.site_keys, stations.x, stations.y, stations, view_factor, station_file,
+                        reference_air_pressure, reference_air_temperature, reference_elevation,
+                        surface_air_temperature, soil_temperature, windNinja.findNinja(),
+                        windNinja.ninjaElevation(elevation_raster,
+                                                 tempfile.mkdtemp(prefix="ninja_", dir=arcpy.env.scratchFolder)),
+                        elevation_hash, gridIO.rasterSignature(view_factor_raster),
+                        solarRadiation.readTerrain(elevation, grid, spatial_reference, terrain_folder,
+                                                   elevation_hash),
+                        solar_correction, trend_method, weight_cache, series_origin, scratch_workspace)
+
+#timesteps from "start" to "end" (inclusive) every "step_hours" hours
+def timeSteps(start, end, step_hours):
+    step = datetime.timedelta(hours=step_hours)
+    date_time = start
+    while date_time <= end:
+        yield date_time
+        date_time = date_time + step
+
+#origin of the series of outputs in "output_workspace": the one saved beside the
+#outputs by an earlier run, or this run's "start" and "step_hours" (saved for
+#later runs). Raises ValueError if the run's timesteps are not timesteps of the
+#saved series (a start before the series start, between its timesteps or with
+#another step).
+def seriesOrigin(output_workspace, start, step_hours):
+    path = buildManifest.manifestPath(output_workspace, SERIES_ORIGIN_NAME)
+    if not os.path.exists(path):
+        origin = SeriesOrigin(start, float(step_hours))
+        with open(path, "w") as origin_file:
+            json.dump({"start": start.strftime("%Y-%m-%dT%H:%M:%S"), "step_hours": origin.step_hours}, origin_file)
+        return origin
+    with open(path) as origin_file:
+        saved = json.load(origin_file)
+    origin = SeriesOrigin(datetime.datetime.strptime(saved["start"], "%Y-%m-%dT%H:%M:%S"), float(saved["step_hours"]))
+    offset = (start - origin.start).total_seconds() / 3600.0 / origin.step_hours
+    if float(step_hours) != origin.step_hours or offset < 0 or offset != round(offset):
+        raise ValueError("The outputs in " + output_workspace + " are a series of " + str(origin.step_hours) +
+                         " hour timesteps from " + str(origin.start) + "; start the run on one of its timesteps "
+                         "or write to another workspace")
+    return origin
+
+#number of a timestep in the series starting at "origin" (a SeriesOrigin)
+def seriesStep(origin, date_time):
+    return int(round((date_time - origin.start).total_seconds() / 3600.0 / origin.step_hours))
+
+#(number, timestep) of every timestep in "time_steps": its number in the series
+#of "origin" (see seriesStep), or its position in the run without an origin
+def numberedSteps(time_steps, origin=None):
+    if origin is None:
+        return list(enumerate(time_steps))
+    return [(seriesStep(origin, date_time), date_time) for date_time in time_steps]
+
+#data table fields read for every timestep from "store": STATION_FIELDS and the
+#station winds if the table has them (see windNinja.WIND_FIELDS)
+def stepFields(store):
+    return STATION_FIELDS + [field for field in windNinja.WIND_FIELDS if field in store.values]
+
+#station winds of a timestep for WindNinja (windNinja.StationWinds), or None if
+#the data table has no wind fields and the station file's winds are used
+def stationWinds(setup, station_values):
+    if not all(field in station_values for field in windNinja.WIND_FIELDS):
+        return None
+    return windNinja.StationWinds(setup.site_keys, *[station_values[field] for field in windNinja.WIND_FIELDS])
+
+#name of the raster a grid is saved as for a given timestep
+def outputName(variable, date_time):
+    return variable + "_" + date_time.strftime("%Y%m%d_%H%M")
+
+#simulated clear-sky radiation corrected by the observed/simulated ratios
+#(setup.solar_correction)
+def solarGrid(setup, date_time, observed):
+    simulated = clearSky.clearSkyRadiation(setup.terrain, setup.elevation, date_time)
+    return solarRadiation.correctedRadiation(simulated, setup.grid, setup.station_x, setup.station_y, observed,
+                                             setup.solar_correction, setup.weight_cache)
+
+#WindNinja velocity grid for a timestep, initialized with the timestep's station
+#"winds" if given (see stationWinds) and taken from "wind_cache" (a
+#windCache.WindCache) when the timestep's wind conditions have been solved before.
+#A run taking more than "timeout" seconds is killed and retried (see
+#windNinja.retriedVelocity).
+def windGrid(setup, date_time, num_threads=8, wind_cache=None, winds=None, timeout=windNinja.TIMEOUT):
+    if wind_cache is None:
+        return windNinja.retriedVelocity(setup.ninja_path, setup.ninja_elevation, date_time, setup.station_file,
+                                         setup.grid, num_threads, timeout=timeout, winds=winds)
+    key = windNinja.velocityKey(setup.station_file, winds, date_time, setup.elevation_hash)
+    velocity = windCache.cachedVelocity(wind_cache, key)
+    if velocity is None:
+        velocity = windNinja.retriedVelocity(setup.ninja_path, setup.ninja_elevation, date_time, setup.station_file,
+                                             setup.grid, num_threads, timeout=timeout, winds=winds)
+        windCache.storeVelocity(wind_cache, key, velocity)
+    return velocity
+
+#"grid_names" and every grid they are computed from (see GRID_INPUTS)
+def requiredGrids(grid_names):
+    required = set(grid_names)
+    for name in reversed(list(GRID_INPUTS)):
+        if name in required:
+            required.update(GRID_INPUTS[name][1])
+    return required
+
+#compute the forcing grids "grid_names" (default FORCING_GRIDS) for one timestep
+#from that timestep's station values ({field: array aligned with
+#setup.site_keys}), along with only the grids they need. WindNinja is run for
+#the timestep if the velocity grid is needed and not given or found in
+#"wind_cache". The kriged grids use the elevation trends in "trend_fits"
+#({field: detrendedKriging.TrendFit}, see trendFits) if given, and fit their own
+#otherwise. If a "fit_record" dictionary is given the record of the trend fits of
+#the kriged grids is added to it (see detrendedKriging.trendRecord). Returns
+#{grid name: array} in FORCING_GRIDS order. WindNinja runs taking more than
+#"ninja_timeout" seconds are killed and retried.
+def forcingStep(setup, date_time, station_values, wind_velocity=None, ninja_threads=8, wind_cache=None,
+                grid_names=None, trend_fits=None, fit_record=None, ninja_timeout=windNinja.TIMEOUT):
+    grid_names = FORCING_GRIDS if grid_names is None else grid_names
+    needed = requiredGrids(grid_names)
+    grids = {}
+
+    kriged_grids = [name for name in KRIGED_GRIDS if name in needed]
+    if kriged_grids:
+        fields = [GRID_INPUTS[name][0][0] for name in kriged_grids]
+        kriged = detrendedKriging.krigeForcingVariables(setup.station_x, setup.station_y,
+            collections.OrderedDict((field, station_values[field]) for field in fields),
+            setup.elevation, setup.grid, use_cache=setup.weight_cache, station_elevation=setup.stations.elevation,
+            trend_method=setup.trend_method,
+            fits=None if trend_fits is None else collections.OrderedDict((field, trend_fits[field])
+                                                                         for field in fields))
+        for name in kriged_grids:
+            grids[name] = kriged[GRID_INPUTS[name][0][0]].surface
+        if fit_record is not None:
+            fit_record.update(detrendedKriging.trendRecord(kriged, setup.site_keys))
+
+    with instrumentation.stage("map_algebra"):
+        if "thermal_radiation" in needed:
+            grids["thermal_radiation"] = thermalRadiation.thermalRadiation(setup.elevation, setup.view_factor,
+                grids["air_temperature"], grids["vapor_pressure"], setup.reference_air_pressure,
+                setup.reference_air_temperature, setup.reference_elevation, setup.surface_air_temperature)
+        if "percent_snow" in needed or "snow_density_of_precipitation" in needed:
+            grids["percent_snow"], grids["snow_density_of_precipitation"] = \
+                precipitationProperties.classifyDewpoint(grids["dewpoint_temperature"])
+    if "solar_radiation" in needed:
+        with instrumentation.stage("solar_radiation"):
+            grids["solar_radiation"] = solarGrid(setup, date_time, station_values["in_solar_radiation"])
+    if "wind_velocity" in needed:
+        if wind_velocity is None:
+            with instrumentation.stage("wind"):
+                wind_velocity = windGrid(setup, date_time, ninja_threads, wind_cache,
+                                         stationWinds(setup, station_values), ninja_timeout)
+        grids["wind_velocity"] = wind_velocity
+    return collections.OrderedDict((name, grids[name]) for name in FORCING_GRIDS if name in grid_names)
+
+#hashes of the static inputs and code of a run used in the grid keys (see
+#gridKeys): {"inputs": {ForcingSetup input: value or hash}, "code": {grid: hash}}
+def keyInputs(setup):
+    with open(setup.station_file, "rb") as station_file:
+        station_file_hash = buildManifest.inputKey(station_file.read())
+    inputs = {"elevation": setup.elevation_hash, "stations": setup.stations.key,
+              "view_factor": setup.view_factor_hash, "station_file": station_file_hash}
+    for name in ["reference_air_pressure", "reference_air_temperature", "reference_elevation",
+                 "surface_air_temperature", "solar_correction", "trend_method"]:
+        inputs[name] = getattr(setup, name)
+    code = {}
+    for name, (fields, grids, setup_inputs, modules) in GRID_INPUTS.items():
+        code[name] = buildManifest.codeVersion([sys.modules[module].__file__ for module in modules])
+    return {"inputs": inputs, "code": code}
+
+#key of every forcing grid of a timestep: a hash of its station values (and
+#the trend model of the field, if "trend_fits" are given), its setup inputs, its
+#code and the keys of the grids it is computed from, so a grid's key only
+#changes when something it depends on does
+def gridKeys(key_inputs, date_time, station_values, trend_fits=None):
+    inputs = dict(key_inputs["inputs"], date_time=date_time)
+    keys = {}
+    for name, (fields, grids, setup_inputs, modules) in GRID_INPUTS.items():
+        keys[name] = buildManifest.inputKey(name, key_inputs["code"][name],
+                                            [station_values.get(field) for field in fields],
+                                            [trend_fits[field].model for field in fields
+                                             if trend_fits is not None and field in trend_fits],
+                                            [keys[grid] for grid in grids],
+                                            [inputs[setup_input] for setup_input in setup_inputs])
+    return keys
+
+#save every grid of a timestep as a raster in the current workspace ("step" is the
+#number of the timestep, see numberedSteps)
+def saveStep(setup, step, date_time, grids):
+    for variable, array in grids.items():
+        gridIO.saveArray(array, setup.grid, setup.spatial_reference, outputName(variable, date_time))
+
+#write the iSNOBAL input image of a timestep, and its precipitation image if any
+#precipitation fell, into the current workspace folder ("step" is the number of
+#the timestep in the series, see numberedSteps, used as the image number). A
+#precipitation image left from an earlier run of a timestep without
+#precipitation is removed, so ppt_desc does not list it. The soil temperature
+#band is the constant setup.soil_temperature, the solar band is only written
+#while the sun is up, and the dew-point temperature is used as the
+#precipitation temperature. The solar band (S_n, read by iSNOBAL as net solar)
+#holds the incoming global solar radiation, as no albedo is applied (see
+#ipwImage).
+def writeIpwStep(setup, step, date_time, grids):
+    output_dir = arcpy.env.workspace
+    soil_temperature = numpy.full((setup.grid.n_rows, setup.grid.n_cols), float(setup.soil_temperature))
+    solar_radiation = grids["solar_radiation"]
+    if not numpy.nanmax(solar_radiation) > 0:
+        solar_radiation = None
+    ipwImage.writeInputImage(output_dir, step, setup.grid, grids["thermal_radiation"], grids["air_temperature"],
+                             grids["vapor_pressure"], grids["wind_velocity"], soil_temperature, solar_radiation)
+
+    #negative kriged precipitation is no precipitation
+    precipitation_mass = numpy.where(grids["precipitation_mass"] < 0, 0, grids["precipitation_mass"])
+    if numpy.nanmax(precipitation_mass) > 0:
+        ipwImage.writePrecipitationImage(output_dir, step, setup.grid, precipitation_mass, grids["percent_snow"],
+                                         grids["snow_density_of_precipitation"], grids["dewpoint_temperature"])
+    elif os.path.exists(os.path.join(output_dir, ipwImage.precipitationImageName(step))):
+        os.remove(os.path.join(output_dir, ipwImage.precipitationImageName(step)))
+
+#compression and tile size of the GeoTIFF output
+TIFF_COMPRESSION = "LZW"
+TIFF_TILE_SIZE = "256 256"
+
+#save every grid of a timestep as a tiled, compressed GeoTIFF with overviews
+#(pyramids) in the current workspace folder (the compression and tile size
+#environments are restored afterwards, so later saves are not affected)
+def saveTiffStep(setup, step, date_time, grids):
+    compression = arcpy.env.compression
+    tile_size = arcpy.env.tileSize
+    arcpy.env.compression = TIFF_COMPRESSION
+    arcpy.env.tileSize = TIFF_TILE_SIZE
+    try:
+        for variable, array in grids.items():
+            output_name = outputName(variable, date_time) + ".tif"
+            gridIO.saveArray(array, setup.grid, setup.spatial_reference, output_name)
+            arcpy.BuildPyramids_management(output_name, -1, "NONE", "BILINEAR")
+    finally:
+        arcpy.env.compression = compression
+        arcpy.env.tileSize = tile_size
+
+#write the grids of a timestep into the forcing cube (see forcingCube) in the
+#current workspace folder, in the slot of the timestep in the series of
+#setup.series_origin (see seriesOrigin)
+def writeCubeStep(setup, step, date_time, grids):
+    if setup.series_origin is None:
+        raise ValueError("NetCDF output needs the origin of its series (see seriesOrigin)")
+    forcingCube.writeCubeStep(os.path.join(arcpy.env.workspace, forcingCube.CUBE_NAME), setup.grid,
+                              setup.spatial_reference.exportToString().split(";")[0], setup.series_origin.start,
+                              setup.series_origin.step_hours, date_time, grids)
+
+#output writers by output format
+WRITERS = collections.OrderedDict([("ESRI raster", saveStep), ("IPW", writeIpwStep), ("GeoTIFF", saveTiffStep),
+                                   ("NetCDF", writeCubeStep)])
+
+#outputs saveStep writes for a timestep: {output name: grids it holds}
+def rasterOutputs(step, date_time):
+    return collections.OrderedDict((outputName(name, date_time), [name]) for name in FORCING_GRIDS)
+
+#outputs writeIpwStep writes for a timestep (the input image and the
+#precipitation image are written together from every grid)
+def ipwOutputs(step, date_time):
+    return collections.OrderedDict([(ipwImage.inputImageName(step), FORCING_GRIDS),
+                                    (ipwImage.precipitationImageName(step), FORCING_GRIDS)])
+
+#outputs saveTiffStep writes for a timestep
+def tiffOutputs(step, date_time):
+    return collections.OrderedDict((outputName(name, date_time) + ".tif", [name]) for name in FORCING_GRIDS)
+
+#outputs writeCubeStep writes for a timestep: one "<cube>:<raster name>:<step>"
+#slice of the cube per grid
+def cubeOutputs(step, date_time):
+    return collections.OrderedDict((forcingCube.CUBE_NAME + ":" + outputName(name, date_time) + ":" + str(step), [name])
+                                   for name in FORCING_GRIDS)
+
+#outputs of every writer
+STEP_OUTPUTS = {saveStep: rasterOutputs, writeIpwStep: ipwOutputs, saveTiffStep: tiffOutputs,
+                writeCubeStep: cubeOutputs}
+
+#True if an output is missing from a written timestep when nothing was to be
+#written (the precipitation image of a timestep without precipitation)
+def _optionalOutput(output_name):
+    return output_name.startswith(ipwImage.precipitationImageName(0)[:-4])
+
+#True if an output exists in "workspace" (the current workspace if not given; a
+#slice of the cube exists if the cube does)
+def _outputExists(output_name, workspace=None):
+    output_path = os.path.join(workspace or arcpy.env.workspace, output_name.split(":")[0])
+    return os.path.exists(output_path) or arcpy.Exists(output_path)
+
+#outputs of a timestep that are missing from "workspace" (the current workspace
+#if not given) or recorded in "manifest" with other inputs: {output name: (key,
+#grid names)}. Without a manifest every output is stale. An optional output (see
+#_optionalOutput) only has to be recorded.
+def staleOutputs(manifest, write, step, date_time, keys, workspace=None):
+    stale = collections.OrderedDict()
+    for name, grid_names in STEP_OUTPUTS[write](step, date_time).items():
+        if manifest is None:
+            stale[name] = (None, grid_names)
+            continue
+        key = buildManifest.inputKey([keys[grid] for grid in grid_names])
+        if not (buildManifest.isFresh(manifest, name, key) and (_optionalOutput(name) or
+                                                                  _outputExists(name, workspace))):
+            stale[name] = (key, grid_names)
+    return stale
+
+#append the elevation trend fits of a timestep ({field: fit record}, see
+#detrendedKriging.trendRecord) to the record at "path" as one line of JSON
+#(a rerun appends the timesteps it computes again; the last line of a timestep
+#is the current one)
+def appendTrendRecord(path, date_time, fits):
+    with open(path, "a") as record_file:
+        record_file.write(json.dumps(collections.OrderedDict([("date_time", date_time.isoformat()),
+                                                              ("fits", fits)])) + "\n")
+
+#elevation trend fits of the kriged fields for every timestep in "tasks"
+#((step, date_time, station_values) tuples), made before the grids so they can
+#be smoothed over time with "smoothing" (one of trendSeries.SMOOTHING_METHODS).
+#With a "trend_series" folder the coefficients of the timesteps whose station
+#values are unchanged are reused from it instead of fitted, and the new fits are
+#saved to it. Returns {date_time: {field: detrendedKriging.TrendFit}}.
+def trendFits(tasks, station_elevation, trend_method, trend_series=None, smoothing="none"):
+    fields = [GRID_INPUTS[name][0][0] for name in KRIGED_GRIDS]
+    code = buildManifest.codeVersion([robustRegression.__file__])
+    series = trendSeries.openSeries(trend_series) if trend_series else {}
+    new_fits = dict((field, []) for field in fields)
+    fits = {}
+    values = {}
+    for task in tasks:
+        date_time, station_values = task[1], task[2]
+        values[date_time] = detrendedKriging.forcingStationValues(
+            collections.OrderedDict((field, station_values[field]) for field in fields))
+        keys = dict((field, buildManifest.inputKey(values[date_time][field], station_elevation, trend_method, code))
+                    for field in fields)
+        models = {}
+        for field in fields:
+            model = trendSeries.cachedModel(series.get(field), date_time, keys[field])
+            if model is not None:
+                models[field] = model
+        fits[date_time] = detrendedKriging.fitTrends(values[date_time], station_elevation, trend_method, models)
+        for field, fit in fits[date_time].items():
+            if field not in models:
+                new_fits[field].append((date_time, keys[field], fit.model, robustRegression.coefficientVariances(
+                    fit.model, station_elevation[fit.used], fit.residual), fit.r_value**2))
+
+    for field in fields:
+        series[field] = trendSeries.updateSeries(series.get(field), new_fits[field])
+    if trend_series and any(new_fits.values()):
+        trendSeries.saveSeries(trend_series, series)
+
+    #fit the smoothed models to the station values again for their residuals
+    if smoothing != "none":
+        smoothed = dict((field, trendSeries.smoothedModels(series[field], list(fits), smoothing)) for field in fields)
+        for date_time in fits:
+            fits[date_time] = detrendedKriging.fitTrends(values[date_time], station_elevation, trend_method,
+                                                         dict((field, smoothed[field][date_time])
+                                                              for field in fields if date_time in smoothed[field]))
+    return fits
+
+#grids needed to write the stale outputs of a timestep
+def staleGrids(stale):
+    grid_names = set()
+    for key, names in stale.values():
+        grid_names.update(names)
+    return [name for name in FORCING_GRIDS if name in grid_names]
+
+#run every timestep in "time_steps", writing each timestep's grids with "write"
+#(see WRITERS) as soon as they are computed. "station_store" is the
+#stationData.StationStore of the data table; timesteps without station data are
+#skipped. WindNinja runs for the coming timesteps in the background (see
+#windNinja.solveVelocitySeries), logging to "ninja_log" and killing and
+#retrying runs that take more than "ninja_timeout" seconds, while the other
+#grids are computed; with a "wind_cache" (windCache.WindCache) hours with the same
+#binned wind conditions reuse one solved grid. With a "manifest"
+#(buildManifest.Manifest) only the stale outputs of each timestep are computed
+#(see staleOutputs) and the written ones are recorded in it. The elevation
+#trends are fitted for every timestep first (see trendFits, with the
+#"trend_series" folder and "smoothing"), and the fits of the kriged grids are
+#added to the "trend_record" file if one is given (see appendTrendRecord).
+#Timesteps are numbered from setup.series_origin (see numberedSteps). A
+#timestep that fails (its WindNinja run, its grids or their save) is warned
+#about and skipped, so one bad timestep does not stop the run. Returns the
+#timesteps that were written and a list of (timestep, error report) for the ones
+#that failed, like runSeriesParallel.
+def runSeries(setup, station_store, time_steps, write=saveStep, ninja_log=None, wind_cache=None, manifest=None,
+              trend_record=None, trend_series=None, smoothing="none", ninja_timeout=windNinja.TIMEOUT):
+    key_inputs = keyInputs(setup) if manifest is not None else None
+    tasks = []
+    for step, date_time in numberedSteps(time_steps, setup.series_origin):
+        with instrumentation.stage("statistics"):
+            station_values = stationData.timestepValues(station_store, date_time, setup.site_keys,
+                                                        stepFields(station_store))
+        if station_values is None:
+            arcpy.AddWarning("No station data for " + str(date_time) + ", skipping")
+            continue
+        tasks.append((step, date_time, station_values))
+    with instrumentation.stage("regression"):
+        fits = trendFits(tasks, setup.stations.elevation, setup.trend_method, trend_series, smoothing)
+
+    steps = []
+    for step, date_time, station_values in tasks:
+        with instrumentation.stage("manifest"):
+            keys = gridKeys(key_inputs, date_time, station_values, fits[date_time]) if manifest is not None else None
+            stale = staleOutputs(manifest, write, step, date_time, keys)
+        if not stale:
+            arcpy.AddMessage("Forcing grids for " + str(date_time) + " are up to date")
+            continue
+        steps.append((step, date_time, station_values, stale))
+
+    #WindNinja only runs for the timesteps whose velocity grid is needed, each
+    #initialized with its own station winds
+    wind_steps = [(date_time, station_values) for step, date_time, station_values, stale in steps
+                  if "wind_velocity" in requiredGrids(staleGrids(stale))]
+    velocities = windNinja.solveVelocitySeries(setup.ninja_path, setup.ninja_elevation,
+                                               [date_time for date_time, station_values in wind_steps],
+                                               setup.station_file, setup.grid, timeout=ninja_timeout,
+                                               log_path=ninja_log, cache=wind_cache,
+                                               elevation_hash=setup.elevation_hash,
+                                               winds=dict((date_time, stationWinds(setup, station_values))
+                                                          for date_time, station_values in wind_steps))
+    written = []
+    failed = []
+    try:
+        for step, date_time, station_values, stale in steps:
+            grid_names = staleGrids(stale)
+            wind_velocity = None
+            if "wind_velocity" in requiredGrids(grid_names):
+                with instrumentation.stage("wind"):
+                    wind_date_time, wind_velocity, error = next(velocities)
+                if error is not None:
+                    arcpy.AddWarning("WindNinja failed for " + str(date_time) + " (" + error + "), skipping")
+                    failed.append((date_time, "WindNinja: " + error))
+                    continue
+            arcpy.AddMessage("Creating forcing grids for " + str(date_time))
+            fit_record = collections.OrderedDict()
+            try:
+                grids = forcingStep(setup, date_time, station_values, wind_velocity, grid_names=grid_names,
+                                    trend_fits=fits[date_time], fit_record=fit_record)
+                with instrumentation.stage("save"):
+                    write(setup, step, date_time, grids)
+                    if trend_record is not None and fit_record:
+                        appendTrendRecord(trend_record, date_time, fit_record)
+            except Exception:
+                error = traceback.format_exc()
+                arcpy.AddWarning("Failed to create forcing grids for " + str(date_time) + "\n" + error)
+                failed.append((date_time, error))
+                continue
+            written.append(date_time)
+            if manifest is not None:
+                for name, (key, names) in stale.items():
+                    buildManifest.record(manifest, name, key)
+                if len(written) % MANIFEST_SAVE_STEPS == 0:
+                    buildManifest.saveManifest(manifest)
+    finally:
+        if manifest is not None:
+            buildManifest.saveManifest(manifest)
+    if wind_cache is not None:
+        arcpy.AddMessage("Wind field cache: " + windCache.cacheSummary(wind_cache))
+    return written, failed
+
+#per-process state of a parallel run (set by _initWorker)
+_worker_setup = None
+_worker_write = None
+_worker_ninja_threads = 1
+_worker_ninja_timeout = windNinja.TIMEOUT
+_worker_wind_cache = None
+_worker_manifest = None
+_worker_key_inputs = None
+_worker_output_workspace = None
+
+#writers that save through arcpy, whose outputs cannot be written into one
+#geodatabase by several processes at once
+RASTER_WRITERS = [saveStep, saveTiffStep]
+
+#True if "workspace" is a geodatabase rather than a folder
+def _isGeodatabase(workspace):
+    return arcpy.Describe(workspace).workspaceType != "FileSystem"
+
+#True if the workers of a run writing with "write" into "output_workspace" must
+#save into their own workspace, copied into the output by the parent process
+#(see copyOutputs)
+def stagedOutputs(write, output_workspace):
+    return write in RASTER_WRITERS and _isGeodatabase(output_workspace)
+
+#copy the outputs "names" a worker saved in its "staging_workspace" into
+#"output_workspace" and delete them from the staging workspace
+def copyOutputs(staging_workspace, output_workspace, names):
+    for name in names:
+        output_path = os.path.join(output_workspace, name)
+        if arcpy.Exists(output_path):
+            arcpy.Delete_management(output_path)
+        arcpy.Copy_management(os.path.join(staging_workspace, name), output_path)
+        arcpy.Delete_management(os.path.join(staging_workspace, name))
+
+#process pool initializer: give the worker its own scratch workspace (and its own
+#output geodatabase if the outputs must be staged, see stagedOutputs) and its
+#share of the cores and timeout for WindNinja, then read the static inputs once
+#for all of the worker's timesteps ("manifest" is a read-only copy of the build
+#manifest)
+def _initWorker(setup_args, output_workspace, scratch_root, write, ninja_threads, ninja_timeout, wind_cache,
+                manifest):
+    global _worker_setup, _worker_write, _worker_ninja_threads, _worker_ninja_timeout, _worker_wind_cache, \
+        _worker_manifest, _worker_key_inputs, _worker_output_workspace
+    _worker_write = write
+    _worker_ninja_threads = ninja_threads
+    _worker_ninja_timeout = ninja_timeout
+    _worker_wind_cache = wind_cache
+    _worker_manifest = manifest
+    _worker_output_workspace = output_workspace
+    worker_dir = os.path.join(scratch_root, "worker_" + str(os.getpid()))
+    os.makedirs(worker_dir)
+    arcpy.env.scratchWorkspace = worker_dir
+    if stagedOutputs(write, output_workspace):
+        arcpy.CreateFileGDB_management(worker_dir, "output.gdb")
+        arcpy.env.workspace = os.path.join(worker_dir, "output.gdb")
+    else:
+        arcpy.env.workspace = output_workspace
+    arcpy.env.overwriteOutput = True
+    arcpy.CheckOutExtension('Spatial')
+    arcpy.env.cellSize = setup_args[0]
+    _worker_setup = readSetup(*setup_args, scratch_workspace=arcpy.env.scratchGDB)
+    if manifest is not None:
+        _worker_key_inputs = keyInputs(_worker_setup)
+
+#compute and save the stale outputs of one timestep in a worker. Returns
+#(date_time, None, {output name: key} of the outputs written, trend fits record,
+#workspace they were saved in) on success or (date_time, error report, {}, {},
+#None) on failure, so one bad timestep does not stop the run.
+def _runStep(task):
+    step, date_time, station_values, trend_fits = task
+    try:
+        keys = gridKeys(_worker_key_inputs, date_time, station_values, trend_fits) \
+            if _worker_manifest is not None else None
+        stale = staleOutputs(_worker_manifest, _worker_write, step, date_time, keys, _worker_output_workspace)
+        fit_record = collections.OrderedDict()
+        if stale:
+            _worker_write(_worker_setup, step, date_time,
+                          forcingStep(_worker_setup, date_time, station_values, ninja_threads=_worker_ninja_threads,
+                                      wind_cache=_worker_wind_cache, grid_names=staleGrids(stale),
+                                      trend_fits=trend_fits, fit_record=fit_record,
+                                      ninja_timeout=_worker_ninja_timeout))
+        return date_time, None, dict((name, key) for name, (key, names) in stale.items()), fit_record, \
+            arcpy.env.workspace
+    except Exception:
+        return date_time, "worker " + str(os.getpid()) + ":\n" + traceback.format_exc(), {}, {}, None
+
+#run the timesteps across a pool of "processes" worker processes, each writing its
+#timesteps with "write" (rasters bound for a geodatabase are saved by each worker
+#in its own geodatabase and copied into "output_workspace" by this process, as
+#a file geodatabase only takes one writer at a time). "setup_args" are the arguments of readSetup except
+#scratch_workspace (the clear-sky terrain terms should already be saved in the
+#terrain folder, see solarRadiation.readTerrain). Only each timestep's slice of "station_store" is sent to the
+#workers, and the workers share the "wind_cache" folder if one is given. With a
+#"manifest" the workers only compute stale outputs and the written ones are
+#recorded in it by this process, as are the trend fits in the "trend_record"
+#file. The elevation trends of every timestep are fitted by this process
+#before the workers start (see trendFits) from the "stations"
+#(stationIndex.StationIndex) with "trend_method". WindNinja runs taking more
+#than "ninja_timeout" seconds are killed and retried. Timesteps are numbered from
+#"series_origin" (see numberedSteps; it should be the one in "setup_args").
+#Results are collected in time order whatever order the workers finish in.
+#Returns the timesteps that were written and a list of (timestep, error report)
+#for the ones that failed.
+def runSeriesParallel(setup_args, output_workspace, stations, station_store, time_steps, processes=None,
+                      write=saveStep, wind_cache=None, manifest=None, trend_record=None, trend_method="ols",
+                      trend_series=None, smoothing="none", ninja_timeout=windNinja.TIMEOUT, series_origin=None):
+    tasks = []
+    for step, date_time in numberedSteps(time_steps, series_origin):
+        station_values = stationData.timestepValues(station_store, date_time, stations.site_keys,
+                                                    stepFields(station_store))
+        if station_values is None:
+            arcpy.AddWarning("No station data for " + str(date_time) + ", skipping")
+            continue
+        tasks.append((step, date_time, station_values))
+    with instrumentation.stage("regression"):
+        fits = trendFits(tasks, stations.elevation, trend_method, trend_series, smoothing)
+    tasks = [(step, date_time, station_values, fits[date_time]) for step, date_time, station_values in tasks]
+
+    #inside ArcGIS sys.executable is the application, not python
+    multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe" if os.name == "nt" else "python"))
+    scratch_root = tempfile.mkdtemp(prefix="isnobal_")
+    written = []
+    failed = []
+    ninja_threads = max(1, multiprocessing.cpu_count() // (processes or multiprocessing.cpu_count()))
+    pool = multiprocessing.Pool(processes, _initWorker, (setup_args, output_workspace, scratch_root, write,
+                                                         ninja_threads, ninja_timeout, wind_cache, manifest))
+    try:
+        for date_time, error, recorded, fit_record, workspace in pool.imap(_runStep, tasks):
+            if error is None and recorded and workspace != output_workspace:
+                try:
+                    copyOutputs(workspace, output_workspace, recorded)
+                except Exception:
+                    error = "copying from " + workspace + ":\n" + traceback.format_exc()
+            if error is None and not recorded:
+                arcpy.AddMessage("Forcing grids for " + str(date_time) + " are up to date")
+            elif error is None:
+                arcpy.AddMessage("Created forcing grids for " + str(date_time))
+                written.append(date_time)
+                if trend_record is not None and fit_record:
+                    appendTrendRecord(trend_record, date_time, fit_record)
+                if manifest is not None:
+                    for name, key in recorded.items():
+                        buildManifest.record(manifest, name, key)
+                    if len(written) % MANIFEST_SAVE_STEPS == 0:
+                        buildManifest.saveManifest(manifest)
+            else:
+                arcpy.AddWarning("Failed to create forcing grids for " + str(date_time) + "\n" + error)
+                failed.append((date_time, error))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        with instrumentation.stage("cleanup"):
+            shutil.rmtree(scratch_root, ignore_errors=True)
+        if manifest is not None:
+            buildManifest.saveManifest(manifest)
+    return written, failed
+
+'''=======References======='''
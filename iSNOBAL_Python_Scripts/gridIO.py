@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: gridIO
+# Purpose: arcpy helpers that move rasters, station locations and tables in
+#          and out of NumPy arrays, so the forcing engines can run without
+#          round-tripping through scratch geodatabase tables.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createAirTemperatureRaster
+#          2- createDewpointTemperatureRaster
+#          3- createVaporPressureRaster
+#          4- createPrecipitationMassRaster
+#          5- createInitialSnowDepthRaster
+#          6- createSoilTemperatureRaster
+#          7- createDetrendedKrigingRasters
+#          8- forcingSeries
+#          9- tiledRasters
+#          10- createPrecipitationPropertiesRasters
+#          11- createWindSpeedRaster
+#          12- createSolarRadiationRaster
+#          13- stationIndex
+#          14- createThermalRadiationRaster
+#          15- createVaporPressureRasterFromDewpoint
+#          16- createForcingRasters
+#          17- staticLayers
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import arcpy
+import hashlib
+import os
+import numpy
+
+import gridTools
+
+'''======Define internal functions======'''
+#value written to "no-data" cells of output rasters
+NODATA_VALUE = -9999.0
+
+#return the GridSpec and spatial reference of a raster without reading its cells
+def describeRaster(raster_path):
+    raster = arcpy.Raster(raster_path)
+    grid = gridTools.GridSpec(raster.extent.XMin, raster.extent.YMin, raster.meanCellWidth,
+                              raster.height, raster.width)
+    return grid, raster.spatialReference
+
+#convert an array read from a raster to float64 with "no-data" cells set to numpy.nan
+def _toFloat(array, nodata_value):
+    array = array.astype(numpy.float64)
+    if nodata_value is not None:
+        array[array == nodata_value] = numpy.nan
+    return array
+
+#read a raster into a float64 array ("no-data" cells become numpy.nan). Returns
+#the array, its GridSpec and its spatial reference.
+def readRaster(raster_path):
+    raster = arcpy.Raster(raster_path)
+    grid, spatial_reference = describeRaster(raster_path)
+    return _toFloat(arcpy.RasterToNumPyArray(raster), raster.noDataValue), grid, spatial_reference
+
+#read the window [row_start, row_stop) x [col_start, col_stop) of "grid" from a
+#raster aligned with it. Cells outside the raster are read as "no-data".
+def readWindow(raster_path, grid, row_start, row_stop, col_start, col_stop):
+    raster = arcpy.Raster(raster_path)
+    window = gridTools.subGrid(grid, row_start, row_stop, col_start, col_stop)
+    array = arcpy.RasterToNumPyArray(raster, arcpy.Point(window.x_min, window.y_min),
+                                     window.n_cols, window.n_rows)
+    return _toFloat(array, raster.noDataValue)
+
+#sample the raster cell under each point without reading the whole raster
+#(numpy.nan for points off the raster)
+def sampleRaster(raster_path, x, y):
+    grid = describeRaster(raster_path)[0]
+    row, col = gridTools.pointToCell(grid, x, y)
+    values = numpy.full(row.shape, numpy.nan)
+    for i in numpy.flatnonzero(row >= 0):
+        r = int(row[i])
+        c = int(col[i])
+        values[i] = readWindow(raster_path, grid, r, r + 1, c, c + 1)[0, 0]
+    return values
+
+#modification times and sizes of files (name, mtime, size) for rasterSignature
+def _fileSignature(files):
+    return [(os.path.basename(f), os.path.getmtime(f), os.path.getsize(f)) for f in files if os.path.isfile(f)]
+
+#signature of a raster that changes when the raster does, without reading its
+#cells: a hash of its path, GridSpec and files. For a raster stored as files (a
+#file such as a GeoTIFF with its side files, or the folder of an ESRI grid) these
+#are the modification times and sizes of its files. A raster in a geodatabase
+#shares the geodatabase's files with every other dataset in it, so its own
+#properties are used instead (pixel type, "no-data" value and statistics), or,
+#if its statistics have not been calculated, the files of the whole
+#geodatabase (so it is taken as changed whenever anything in the geodatabase is).
+def rasterSignature(raster_path):
+    grid = describeRaster(raster_path)[0]
+    if os.path.isdir(raster_path):
+        files = _fileSignature(sorted(os.path.join(raster_path, f) for f in os.listdir(raster_path)))
+    elif os.path.exists(raster_path):
+        directory = os.path.dirname(raster_path) or "."
+        files = _fileSignature([os.path.join(directory, f) for f in sorted(os.listdir(directory))
+                                if f.startswith(os.path.basename(raster_path))])
+    else:
+        raster = arcpy.Raster(raster_path)
+        statistics = (raster.minimum, raster.maximum, raster.mean, raster.standardDeviation)
+        files = [(raster.pixelType, raster.noDataValue) + statistics]
+        if None in statistics:
+            workspace = os.path.dirname(raster_path)
+            while workspace and not os.path.isdir(workspace):
+                workspace = os.path.dirname(workspace)
+            files += _fileSignature(sorted(os.path.join(workspace, f) for f in os.listdir(workspace)))
+    return hashlib.sha1(repr((os.path.abspath(raster_path), tuple(grid), files)).encode("utf-8")).hexdigest()
+
+#save an array as a float raster named "output_name" in the current workspace
+def saveArray(array, grid, spatial_reference, output_name):
+    array = numpy.where(numpy.isfinite(array), array, NODATA_VALUE).astype(numpy.float32)
+    raster = arcpy.NumPyArrayToRaster(array, arcpy.Point(grid.x_min, grid.y_min),
+                                      grid.cell_size, grid.cell_size, NODATA_VALUE)
+    raster.save(output_name)
+    arcpy.DefineProjection_management(output_name, spatial_reference)
+    return arcpy.Raster(output_name)
+
+#read the site keys and x/y coordinates of the station location feature class
+def readStations(station_locations):
+    site_keys = []
+    x = []
+    y = []
+    with arcpy.da.SearchCursor(station_locations, ["Site_Key", "SHAPE@X", "SHAPE@Y"]) as cursor:
+        for row in cursor:
+            site_keys.append(row[0])
+            x.append(row[1])
+            y.append(row[2])
+    return site_keys, numpy.array(x, dtype=numpy.float64), numpy.array(y, dtype=numpy.float64)
+
+#read fields of a table (geodatabase table, dBASE or CSV) into lists, one per field
+def readTable(table, fields):
+    columns = [[] for field in fields]
+    with arcpy.da.SearchCursor(table, list(fields)) as cursor:
+        for row in cursor:
+            for j, value in enumerate(row):
+                columns[j].append(value)
+    return columns
+
+'''=======References======='''
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: gridTools
+# Purpose: Grid geometry helpers shared by the NumPy forcing engines. A grid is
+#          described by its lower-left corner, cell size and shape, which is
+#          the same information arcpy.NumPyArrayToRaster needs to write an
+#          array back out as a raster.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- detrendedKriging
+#          2- gridIO
+#          3- tiledRasters
+#          4- ipwImage
+#          5- windNinja
+#          6- clearSky
+#          7- stationIndex
+#          8- forcingCube
+#
+# Note: Arrays follow the arcpy.RasterToNumPyArray convention: row 0 is the
+#       northern-most row of the raster and "no-data" cells are numpy.nan.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import hashlib
+import numpy
+
+'''======Define internal functions======'''
+#Grid geometry (x_min/y_min are the lower-left corner of the raster extent)
+GridSpec = collections.namedtuple("GridSpec", ["x_min", "y_min", "cell_size", "n_rows", "n_cols"])
+
+#return the upper edge of the grid
+def gridYMax(grid):
+    return grid.y_min + grid.n_rows * grid.cell_size
+
+#return the x coordinates of the cell centers of every column
+def columnCenters(grid):
+    return grid.x_min + (numpy.arange(grid.n_cols) + 0.5) * grid.cell_size
+
+#return the y coordinates of the cell centers of the rows in [row_start, row_stop)
+def rowCenters(grid, row_start=0, row_stop=None):
+    if row_stop is None:
+        row_stop = grid.n_rows
+    return gridYMax(grid) - (numpy.arange(row_start, row_stop) + 0.5) * grid.cell_size
+
+#geometry of the window [row_start, row_stop) x [col_start, col_stop) of a grid
+def subGrid(grid, row_start, row_stop, col_start, col_stop):
+    return GridSpec(grid.x_min + col_start * grid.cell_size,
+                    gridYMax(grid) - row_stop * grid.cell_size,
+                    grid.cell_size, row_stop - row_start, col_stop - col_start)
+
+#windows (row_start, row_stop, col_start, col_stop) of at most tile_size x tile_size
+#cells covering the grid, row by row from the north-west corner
+def tileWindows(grid, tile_size):
+    windows = []
+    for row_start in range(0, grid.n_rows, tile_size):
+        for col_start in range(0, grid.n_cols, tile_size):
+            windows.append((row_start, min(row_start + tile_size, grid.n_rows),
+                            col_start, min(col_start + tile_size, grid.n_cols)))
+    return windows
+
+#convert x/y coordinates to row/column indices (-1 where the point is off the grid)
+def pointToCell(grid, x, y):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    col = numpy.floor((x - grid.x_min) / grid.cell_size).astype(numpy.int64)
+    row = numpy.floor((gridYMax(grid) - y) / grid.cell_size).astype(numpy.int64)
+    outside = (row < 0) | (row >= grid.n_rows) | (col < 0) | (col >= grid.n_cols)
+    row[outside] = -1
+    col[outside] = -1
+    return row, col
+
+#copy "array" on "source_grid" onto "grid" by taking, for each cell of "grid", the
+#source cell under its center (an exact copy when the grids are aligned). Cells
+#of "grid" outside the source grid get numpy.nan.
+def regridNearest(array, source_grid, grid):
+    row = numpy.floor((gridYMax(source_grid) - rowCenters(grid)) / source_grid.cell_size).astype(numpy.int64)
+    col = numpy.floor((columnCenters(grid) - source_grid.x_min) / source_grid.cell_size).astype(numpy.int64)
+    row_inside = (row >= 0) & (row < source_grid.n_rows)
+    col_inside = (col >= 0) & (col < source_grid.n_cols)
+    values = numpy.full((grid.n_rows, grid.n_cols), numpy.nan)
+    values[numpy.ix_(row_inside, col_inside)] = array[numpy.ix_(row[row_inside], col[col_inside])]
+    return values
+
+#hash of an array's values and its grid (identifies a DEM in persistent caches)
+def gridHash(array, grid):
+    digest = hashlib.sha1()
+    digest.update(numpy.ascontiguousarray(array, dtype=numpy.float64).tobytes())
+    digest.update(repr(tuple(grid)).encode("utf-8"))
+    return digest.hexdigest()
+
+#sample the value of the cell under each point (equivalent to ExtractValuesToPoints
+#with no interpolation). Points off the grid get numpy.nan.
+def sampleGrid(array, grid, x, y):
+    row, col = pointToCell(grid, x, y)
+    values = numpy.full(row.shape, numpy.nan)
+    inside = row >= 0
+    values[inside] = array[row[inside], col[inside]]
+    return values
+
+'''=======References======='''
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: instrumentation
+# Purpose: Per-stage timing of a tool run. A tool opens a run and marks the
+#          start of each of its stages (extraction, statistics, regression,
+#          kriging, map algebra, save, cleanup); the library modules time their
+#          own inner stages, which are recorded under the tool stage that was
+#          running (e.g. "detrended_kriging/regression"). Every stage records
+#          its wall time, CPU time, bytes read and written and the peak memory
+#          of the process, summed over the times it ran, and the run is written
+#          as JSON next to the tool's scratch files. With the ISNOBAL_PROFILE
+#          environment variable set the run is also profiled with cProfile.
+# Input: none (imported by other modules)
+# Output: "<tool>_<date>_<process>_timing.json" (and ".prof") in the run folder
+# Used in: 1- createAirTemperatureRaster
+#          2- createDewpointTemperatureRaster
+#          3- createVaporPressureRaster
+#          4- createPrecipitationMassRaster
+#          5- createInitialSnowDepthRaster
+#          6- createSoilTemperatureRaster
+#          7- createDetrendedKrigingRasters
+#          8- createThermalRadiationRaster
+#          9- createVaporPressureRasterFromDewpoint
+#          10- createPrecipitationPropertiesRasters
+#          11- createInitialSnowPropertiesRasters
+#          12- createRoughnessLengthConstantRaster
+#          13- createSoilTemperatureConstantRaster
+#          14- createSolarRadiationRaster
+#          15- createWindSpeedRaster
+#          16- createForcingTimeSeries
+#          17- createForcingRasters
+#          18- detrendedKriging
+#          19- forcingSeries
+#          20- pipeline
+#
+# Note: Only stages on the thread that opened the run are recorded. Stages run
+#       by pipeline threads are timed on their thread and added by the calling
+#       thread as they finish (see addStage), with the wall time and the CPU
+#       time of their thread but no bytes or memory; stages of forcingSeries
+#       worker processes are not recorded. cProfile only profiles the thread
+#       that opened the run. The .prof file can be read with
+#       pstats or drawn as a flame graph with e.g. snakeviz or flameprof.
+#       Bytes read and written come from /proc/self/io on Linux and from
+#       psutil elsewhere (left out if psutil is not installed); the peak memory
+#       comes from the resource module or psutil.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+#resource is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#psutil is optional
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+'''======Define internal functions======'''
+#environment variable that turns on the cProfile dump of a run
+PROFILE_VARIABLE = "ISNOBAL_PROFILE"
+
+#An open run: "stages" is {stage path: totals}, "open_stages" the stack of
+#(name, counters at its start) being timed and "thread" the thread it belongs to
+Run = collections.namedtuple("Run", ["tool", "folder", "started", "counters", "stages", "open_stages", "thread",
+                                     "profiler"])
+
+#the run being recorded (None outside of a run)
+_run = None
+
+#bytes read and written by this process so far (None if unknown)
+def _ioBytes():
+    if os.path.exists("/proc/self/io"):
+        counters = {}
+        with open("/proc/self/io") as io_file:
+            for line in io_file:
+                name, value = line.split(":")
+                counters[name] = int(value)
+        return counters["rchar"], counters["wchar"]
+    if psutil is not None:
+        io = psutil.Process().io_counters()
+        return io.read_bytes, io.write_bytes
+    return None, None
+
+#peak resident memory of this process so far in MB (None if unknown)
+def _peakMemory():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #kilobytes on Linux, bytes on macOS
+        return peak / (1024.0**2 if sys.platform == "darwin" else 1024.0)
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / 1024.0**2
+    return None
+
+#wall time, CPU time (of this process and its finished child processes, e.g.
+#WindNinja) and bytes read and written so far
+def _counters():
+    times = os.times()
+    read_bytes, write_bytes = _ioBytes()
+    return {"wall_seconds": time.time(), "cpu_seconds": times[0] + times[1] + times[2] + times[3],
+            "read_bytes": read_bytes, "write_bytes": write_bytes}
+
+#counters since "start" and the peak memory so far
+def _elapsed(start):
+    now = _counters()
+    elapsed = {}
+    for name, value in now.items():
+        elapsed[name] = None if value is None or start[name] is None else value - start[name]
+    elapsed["peak_memory_mb"] = _peakMemory()
+    return elapsed
+
+#True if stages timed on this thread belong to the open run
+def _recording():
+    return _run is not None and threading.current_thread() is _run.thread
+
+#add the "elapsed" counters of one call of the stage at "path" to its totals
+def _addTotals(run, path, elapsed):
+    totals = run.stages.setdefault(path, collections.OrderedDict(
+        [("calls", 0), ("wall_seconds", 0.0), ("cpu_seconds", 0.0), ("read_bytes", 0), ("write_bytes", 0),
+         ("peak_memory_mb", None)]))
+    totals["calls"] += 1
+    for counter in ["wall_seconds", "cpu_seconds", "read_bytes", "write_bytes"]:
+        if totals[counter] is not None and elapsed[counter] is not None:
+            totals[counter] += elapsed[counter]
+        else:
+            totals[counter] = None
+    totals["peak_memory_mb"] = elapsed["peak_memory_mb"]
+
+#add the counters of the innermost open stage to its totals and close it
+def _closeStage(run):
+    path = "/".join(name for name, start in run.open_stages)
+    name, start = run.open_stages.pop()
+    _addTotals(run, path, _elapsed(start))
+
+#CPU time of the calling thread so far (None where Python cannot tell, e.g.
+#Python 2)
+def threadCpuTime():
+    if hasattr(time, "thread_time"):
+        return time.thread_time()
+    return None
+
+#add a stage "name" timed on another thread (e.g. a pipeline stage) to the open
+#run, inside the stage that is running on this thread. "cpu_seconds" is the CPU
+#time of the thread it ran on (None if unknown). Does nothing outside of a run.
+def addStage(name, wall_seconds, cpu_seconds=None):
+    if _recording():
+        path = "/".join([stage_name for stage_name, start in _run.open_stages] + [name])
+        _addTotals(_run, path, {"wall_seconds": wall_seconds, "cpu_seconds": cpu_seconds, "read_bytes": None,
+                                "write_bytes": None, "peak_memory_mb": _peakMemory()})
+
+#start recording a run of "tool", written to "folder" when it is closed (see
+#closeRun). Opening a run closes any run still open without writing it.
+def openRun(tool, folder):
+    global _run
+    profiler = None
+    if os.environ.get(PROFILE_VARIABLE):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    _run = Run(tool, folder, datetime.datetime.now(), _counters(), collections.OrderedDict(), [],
+               threading.current_thread(), profiler)
+    return _run
+
+#end every open stage and start timing the tool stage "name" (does nothing
+#outside of a run)
+def startStage(name):
+    if _recording():
+        while _run.open_stages:
+            _closeStage(_run)
+        _run.open_stages.append((name, _counters()))
+
+#time the statements of a with block as stage "name", inside the stage that is
+#already running (does nothing outside of a run)
+@contextlib.contextmanager
+def stage(name):
+    if not _recording():
+        yield
+        return
+    run = _run
+    run.open_stages.append((name, _counters()))
+    depth = len(run.open_stages)
+    try:
+        yield
+    finally:
+        while len(run.open_stages) >= depth:
+            _closeStage(run)
+
+#"%.2f" of a number of seconds, "?" if unknown
+def _seconds(seconds):
+    return "?" if seconds is None else "%.2f" % seconds
+
+#end the open run and write it as JSON to its folder, with the cProfile dump
+#beside it if profiling was on. A line per stage goes to "log" (a function
+#taking one line of text) if it is given, inner stages indented under the stage
+#they ran in. Returns the path of the JSON file (None outside of a run).
+def closeRun(log=None):
+    global _run
+    if not _recording():
+        return None
+    run = _run
+    _run = None
+    while run.open_stages:
+        _closeStage(run)
+    if run.profiler is not None:
+        run.profiler.disable()
+
+    name = "%s_%s_%d" % (run.tool, run.started.strftime("%Y%m%d_%H%M%S"), os.getpid())
+    summary = collections.OrderedDict([
+        ("tool", run.tool), ("started", run.started.isoformat()), ("python", platform.python_version()),
+        ("platform", platform.platform())])
+    summary.update(sorted(_elapsed(run.counters).items()))
+    summary["stages"] = run.stages
+    if run.profiler is not None:
+        summary["profile"] = os.path.join(run.folder, name + ".prof")
+        run.profiler.dump_stats(summary["profile"])
+    path = os.path.join(run.folder, name + "_timing.json")
+    with open(path, "w") as timing_file:
+        json.dump(summary, timing_file, indent=1)
+
+    if log is not None:
+        #inner stages close before the stage they ran in, so list each stage
+        #before its inner stages
+        first_closed = dict((stage_path, i) for i, stage_path in enumerate(run.stages))
+        def outline(stage_path):
+            names = stage_path.split("/")
+            return [first_closed.get("/".join(names[:depth + 1]), 0) for depth in range(len(names))]
+        for stage_path in sorted(run.stages, key=outline):
+            totals = run.stages[stage_path]
+            log("  " * stage_path.count("/") + "%s: %s s (%s s CPU)" % (
+                stage_path.split("/")[-1], _seconds(totals["wall_seconds"]), _seconds(totals["cpu_seconds"])))
+        log("Stage timings written to " + path)
+    return path
+
+'''=======References======='''
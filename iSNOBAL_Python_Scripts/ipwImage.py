@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: ipwImage
+# Purpose: Writes forcing arrays straight into the IPW images read by iSNOBAL,
+#          so a season of inputs can be produced without intermediate GIS
+#          rasters. Each image is written with one header and one buffered
+#          sequential write of its pixels.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- forcingSeries
+#          2- createForcingTimeSeries
+#
+# Note: iSNOBAL input images hold the bands I_lw, T_a, e_a, u, T_g and, during
+#       daylight, S_n. Precipitation images hold m_pp, %_snow, rho_snow and
+#       T_pp and are listed by timestep in a "ppt_desc" file. Bands are
+#       linearly quantized (IPW "lq" header) to integers of "bits" bits between
+#       the band's minimum and maximum, and pixels are stored band-interleaved
+#       by pixel. "no-data" cells are written as the band minimum, since iSNOBAL
+#       images have no "no-data" value.
+#
+#       iSNOBAL reads S_n as net solar radiation, but no albedo grid is
+#       available to these scripts, so the S_n band holds whatever solar grid
+#       it is given. forcingSeries gives it the incoming global solar radiation,
+#       which overstates the shortwave absorbed by the snow; apply an albedo to
+#       that grid before writing it if net solar is needed.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import os
+import numpy
+
+import gridTools
+
+'''======Define internal functions======'''
+#bands of the iSNOBAL input image (S_n is only written when it is given)
+INPUT_BANDS = ["I_lw", "T_a", "e_a", "u", "T_g", "S_n"]
+
+#bands of the iSNOBAL precipitation image
+PRECIPITATION_BANDS = ["m_pp", "%_snow", "rho_snow", "T_pp"]
+
+#default quantization (bits per band)
+DEFAULT_BITS = 16
+
+#largest quantization supported (bands are stored as 1 or 2 byte integers)
+MAX_BITS = 16
+
+#write buffer size in bytes
+BUFFER_SIZE = 1 << 20
+
+#file names of the input and precipitation images of a timestep
+def inputImageName(step):
+    return "in.%04d" % step
+
+def precipitationImageName(step):
+    return "ppt.4b_%04d" % step
+
+#bytes a band quantized to "bits" bits is stored in
+def bandBytes(bits):
+    if not 1 <= bits <= MAX_BITS:
+        raise ValueError("IPW bands take 1 to " + str(MAX_BITS) + " bits, not " + str(bits))
+    return (bits + 7) // 8
+
+#build the IPW header (basic_image, geo and lq sections) for a set of bands
+def ipwHeader(grid, band_ranges, bits, units="m", coord_sys_ID="UTM"):
+    nbands = len(band_ranges)
+    header = ["!<header> basic_image_i -1 $Revision: 1.11 $",
+              "byteorder = 0123 ",
+              "nlines = %d " % grid.n_rows,
+              "nsamps = %d " % grid.n_cols,
+              "nbands = %d " % nbands]
+    for band in range(nbands):
+        header += ["!<header> basic_image %d $Revision: 1.11 $" % band,
+                   "bytes = %d " % bandBytes(bits),
+                   "bits = %d " % bits]
+    #geo coordinates of the center of the first (north-west) pixel
+    for band in range(nbands):
+        header += ["!<header> geo %d $Revision: 1.7 $" % band,
+                   "bline = %r " % (gridTools.gridYMax(grid) - 0.5 * grid.cell_size),
+                   "bsamp = %r " % (grid.x_min + 0.5 * grid.cell_size),
+                   "dline = %r " % -grid.cell_size,
+                   "dsamp = %r " % grid.cell_size,
+                   "units = %s " % units,
+                   "coord_sys_ID = %s " % coord_sys_ID]
+    for band, (band_min, band_max) in enumerate(band_ranges):
+        header += ["!<header> lq %d $Revision: 1.6 $" % band,
+                   "map = 0 %r " % band_min,
+                   "map = %d %r " % (2**bits - 1, band_max)]
+    header.append("!<header> image -1 $Revision: 1.5 $")
+    return ("\n".join(header) + "\n\f\n").encode("ascii")
+
+#linear quantization of an array to [0, 2**bits - 1] over its finite range.
+#Returns the integer array and the (minimum, maximum) of the mapping.
+def quantize(array, bits):
+    array = numpy.asarray(array, dtype=numpy.float64)
+    finite = numpy.isfinite(array)
+    if not finite.any():
+        band_min = band_max = 0.0
+    else:
+        band_min = float(array[finite].min())
+        band_max = float(array[finite].max())
+    if band_max == band_min:
+        band_max = band_min + 1.0
+    levels = 2**bits - 1
+    scaled = numpy.where(finite, (array - band_min) * (levels / (band_max - band_min)), 0.0)
+    return numpy.rint(scaled).astype("<u%d" % bandBytes(bits)), (band_min, band_max)
+
+#write a multi-band IPW image
+def writeImage(path, bands, grid, bits=DEFAULT_BITS):
+    quantized = []
+    band_ranges = []
+    for band in bands:
+        values, band_range = quantize(band, bits)
+        quantized.append(values)
+        band_ranges.append(band_range)
+
+    #band-interleaved by pixel
+    pixels = numpy.dstack(quantized)
+    with open(path, "wb", BUFFER_SIZE) as image:
+        image.write(ipwHeader(grid, band_ranges, bits))
+        pixels.tofile(image)
+    return path
+
+#write the input image of timestep "step" into "output_dir"
+def writeInputImage(output_dir, step, grid, I_lw, T_a, e_a, u, T_g, S_n=None, bits=DEFAULT_BITS):
+    bands = [I_lw, T_a, e_a, u, T_g]
+    if S_n is not None:
+        bands.append(S_n)
+    return writeImage(os.path.join(output_dir, inputImageName(step)), bands, grid, bits)
+
+#write the precipitation image of timestep "step" into "output_dir"
+def writePrecipitationImage(output_dir, step, grid, m_pp, percent_snow, rho_snow, T_pp, bits=DEFAULT_BITS):
+    return writeImage(os.path.join(output_dir, precipitationImageName(step)),
+                      [m_pp, percent_snow, rho_snow, T_pp], grid, bits)
+
+#write the "ppt_desc" file listing "<timestep> <precipitation image>" for every
+#precipitation image in "output_dir"
+def writePrecipitationDescription(output_dir):
+    prefix = precipitationImageName(0)[:-4]
+    steps = sorted(int(name[len(prefix):]) for name in os.listdir(output_dir)
+                   if name.startswith(prefix) and name[len(prefix):].isdigit())
+    path = os.path.join(output_dir, "ppt_desc")
+    with open(path, "w") as description:
+        for step in steps:
+            description.write("%d %s\n" % (step, os.path.join(output_dir, precipitationImageName(step))))
+    return path
+
+'''=======References======='''
+#Marks, D., Domingo, J., Susong, D., Link, T., & Garen, D. (1999). A spatially
+#   distributed energy balance snowmelt model for application in mountain
+#   basins. Hydrological Processes, 13, 1935–1959.
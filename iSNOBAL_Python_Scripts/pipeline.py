@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: pipeline
+# Purpose: Dependency-aware runner for chains of in-memory stages. Every stage
+#          declares the named values it reads and the named values it
+#          produces; a stage starts as soon as all of its inputs exist, so
+#          independent branches (e.g. solar radiation, wind and the kriged
+#          variables) run at the same time on a thread pool, and the arrays a
+#          stage produces are handed to the stages that need them without
+#          being saved and read back as rasters.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- forcingPipeline
+#
+# Note: Stages run on threads. NumPy, SciPy and WindNinja (a separate process)
+#       release the interpreter lock for their heavy work, while arcpy is not
+#       safe to call from several threads, so stages must not use arcpy;
+#       outputs are passed to "on_output" on the calling thread instead.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import multiprocessing
+import multiprocessing.pool
+import time
+import traceback
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import instrumentation
+
+'''======Define internal functions======'''
+#One step of a pipeline: function(**{input name: value}) returns {output name:
+#value} holding every name in "outputs"
+Stage = collections.namedtuple("Stage", ["name", "function", "inputs", "outputs"])
+
+#stages needed to produce "wanted" (every stage if None), in the order given
+def requiredStages(stages, wanted=None):
+    if wanted is None:
+        return list(stages)
+    producers = dict((output, stage) for stage in stages for output in stage.outputs)
+    needed = set()
+    pending = list(wanted)
+    while pending:
+        name = pending.pop()
+        stage = producers.get(name)
+        if stage is not None and stage.name not in needed:
+            needed.add(stage.name)
+            pending.extend(stage.inputs)
+    return [stage for stage in stages if stage.name in needed]
+
+#check that every input of "stages" is given in "available" or produced by
+#exactly one stage, and that the stages have no cycle. Returns the stages in an
+#order that runs one at a time (each stage after the stages it depends on).
+def stageOrder(stages, available):
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers or output in available:
+                raise ValueError("\"" + output + "\" is produced by more than one stage or input")
+            producers[output] = stage.name
+    for stage in stages:
+        for name in stage.inputs:
+            if name not in producers and name not in available:
+                raise ValueError("stage \"" + stage.name + "\" needs \"" + name + "\", which nothing produces")
+
+    order = []
+    produced = set(available)
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if all(name in produced for name in stage.inputs)]
+        if not ready:
+            raise ValueError("stages " + ", ".join(stage.name for stage in remaining) + " depend on each other")
+        for stage in ready:
+            order.append(stage)
+            produced.update(stage.outputs)
+            remaining.remove(stage)
+    return order
+
+#wall time and CPU time of the calling thread (None if unknown) since "start"
+#(a pair of the two, see _runStage)
+def _elapsed(start):
+    cpu_time = instrumentation.threadCpuTime()
+    return time.time() - start[0], None if cpu_time is None else cpu_time - start[1]
+
+#run one stage on a pool thread. Returns (stage, outputs, (seconds, CPU seconds),
+#None) or (stage, None, (seconds, CPU seconds), error report).
+def _runStage(stage, arguments):
+    start = (time.time(), instrumentation.threadCpuTime())
+    try:
+        outputs = stage.function(**arguments)
+        missing = [name for name in stage.outputs if name not in outputs]
+        if missing:
+            raise ValueError("stage did not produce " + ", ".join(missing))
+        return stage, outputs, _elapsed(start), None
+    except Exception:
+        return stage, None, _elapsed(start), traceback.format_exc()
+
+#run "stages" starting from the named values in "values", with up to "jobs"
+#stages at a time (one per core by default). Only the stages needed for
+#"wanted" are run if it is given. Every output is passed to
+#on_output(name, value) on this thread as soon as its stage finishes, and
+#progress messages go to "log" (a function taking one line of text). The wall
+#and CPU time of every stage are added to the open instrumentation run under
+#the stage running on this thread (see instrumentation.addStage). Returns
+#"values" with every stage output added. Raises RuntimeError if a stage fails,
+#after the stages already running have finished.
+def runPipeline(stages, values, jobs=None, wanted=None, on_output=None, log=None):
+    values = dict(values)
+    remaining = stageOrder(requiredStages(stages, wanted), values)
+    finished = queue.Queue()
+    pool = multiprocessing.pool.ThreadPool(jobs or multiprocessing.cpu_count())
+    running = 0
+    error = None
+    try:
+        while remaining or running:
+            #start every stage whose inputs are ready (none after a failure)
+            if error is None:
+                for stage in [stage for stage in remaining if all(name in values for name in stage.inputs)]:
+                    remaining.remove(stage)
+                    arguments = dict((name, values[name]) for name in stage.inputs)
+                    pool.apply_async(_runStage, (stage, arguments), callback=finished.put)
+                    running += 1
+                    if log is not None:
+                        log("Started " + stage.name)
+            if not running:
+                break
+
+            stage, outputs, (seconds, cpu_seconds), stage_error = finished.get()
+            running -= 1
+            instrumentation.addStage(stage.name, seconds, cpu_seconds)
+            if stage_error is not None:
+                error = error or "stage \"" + stage.name + "\" failed:\n" + stage_error
+                continue
+            if log is not None:
+                log("Finished " + stage.name + " (%.1f s)" % seconds)
+            for name in stage.outputs:
+                values[name] = outputs[name]
+                if on_output is not None:
+                    on_output(name, outputs[name])
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if error is not None:
+        raise RuntimeError(error)
+    return values
+
+'''=======References======='''
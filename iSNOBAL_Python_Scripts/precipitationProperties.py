@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: precipitationProperties
+# Purpose: Classifies dew-point temperature into the percentage of
+#          precipitation mass that was snow and the density of the snow portion
+#          of the precipitation, using a breakpoint lookup table. Both outputs
+#          are gathered from the same bin index, found with one searchsorted
+#          pass over the grid.
+# Input: dew-point temperature array and a PrecipitationTable
+# Output: percent snow and snow density arrays
+# Used in: 1- createPrecipitationPropertiesRasters
+#          2- forcingSeries
+#          3- forcingPipeline
+#          4- createForcingRasters
+#
+# Note: Bin i of a table holds dew points in [breakpoints[i-1], breakpoints[i]);
+#       the first bin is open below and the last bin is open above, so a table
+#       has one more value than breakpoints.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import numpy
+
+'''======Define internal functions======'''
+#dew-point breakpoints (C) and the percent snow and snow density (kg/m^3) of each bin
+PrecipitationTable = collections.namedtuple("PrecipitationTable", ["breakpoints", "percent_snow", "snow_density"])
+
+#build a table from rows of (dew-point upper bound, percent snow, snow density).
+#The row without an upper bound (None) is the bin open above.
+def makeTable(dewpoint_upper, percent_snow, snow_density):
+    rows = sorted(zip(dewpoint_upper, percent_snow, snow_density),
+                  key=lambda row: (row[0] is None, row[0]))
+    if [row[0] for row in rows].count(None) != 1:
+        raise ValueError("the lookup table needs exactly one row without a dew-point upper bound")
+    return PrecipitationTable(numpy.array([row[0] for row in rows[:-1]], dtype=numpy.float64),
+                              numpy.array([row[1] for row in rows], dtype=numpy.float64),
+                              numpy.array([row[2] for row in rows], dtype=numpy.float64))
+
+#Percent snow and snow density lookup curves
+DEFAULT_TABLE = makeTable([-5.0, -3.0, -1.5, -0.5, 0.0, 0.5, None],
+                          [1.0, 1.0, 1.0, 1.0, 0.75, 0.25, 0.0],
+                          [75.0, 100.0, 150.0, 175.0, 200.0, 250.0, 0.0])
+
+#classify a dew-point array. Returns the percent snow and snow density arrays
+#("no-data" dew points stay numpy.nan).
+def classifyDewpoint(dewpoint, table=DEFAULT_TABLE):
+    dewpoint = numpy.asarray(dewpoint)
+    bins = numpy.searchsorted(table.breakpoints, dewpoint, side="right")
+    percent_snow = table.percent_snow[bins]
+    snow_density = table.snow_density[bins]
+    nodata = numpy.isnan(dewpoint)
+    percent_snow[nodata] = numpy.nan
+    snow_density[nodata] = numpy.nan
+    return percent_snow, snow_density
+
+'''=======References======='''
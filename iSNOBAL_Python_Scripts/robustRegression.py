@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: robustRegression
+# Purpose: Fits of station values against elevation for the detrending step of
+#          detrended kriging: ordinary least squares, Theil-Sen, Huber and
+#          piecewise-linear fits by elevation band. Every fit also returns
+#          the leave-one-out residual of each station (its residual when it
+#          is left out of the fit) and flags the stations whose leave-one-out
+#          residual is far from the others', so one bad station (e.g. a snow
+#          depth spike or a frozen gauge) can be found and kept from
+#          dominating the lapse rate. All stations are handled at once in
+#          array operations.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- detrendedKriging
+#          2- createAirTemperatureRaster
+#          3- createDewpointTemperatureRaster
+#          4- trendSeries
+#          5- forcingSeries
+#
+# Note: Models are value = c0 + c1*z + sum(c_k * max(z - break_k, 0)), a
+#       continuous line whose slope changes by c_k at each break elevation
+#       (no breaks except for "piecewise"). The leave-one-out residuals of the
+#       least-squares fits come from the hat matrix; for "huber" the weights of
+#       the full fit are kept, and for "theil_sen" the medians are taken again
+#       without the station. The Theil-Sen slopes without each station are read
+#       from the one sorted array of pair slopes by skipping the station's
+#       pairs (see _medianWithout), so the n(n-1)/2 slopes are never copied per
+#       station.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import numpy
+
+'''======Define internal functions======'''
+#fit methods
+TREND_METHODS = ["ols", "theil_sen", "huber", "piecewise"]
+
+#Huber tuning constant (in robust standard deviations) and iteration limits
+HUBER_K = 1.345
+HUBER_ITERATIONS = 50
+HUBER_TOLERANCE = 1e-8
+
+#number of elevation bands of the piecewise fit (breaks at quantiles of the
+#station elevations) and the fewest stations a band may hold
+PIECEWISE_BANDS = 2
+MIN_BAND_STATIONS = 3
+
+#robust z-score of a leave-one-out residual above which a station is flagged
+OUTLIER_THRESHOLD = 3.5
+
+#fewest stations a trend is fitted to (one per coefficient of a line)
+MIN_TREND_STATIONS = 2
+
+#Fitted trend: method name, coefficients [c0, c1, c_k...] and break elevations
+TrendModel = collections.namedtuple("TrendModel", ["method", "coefficients", "breaks"])
+
+#Result of a fit: model, coefficient of determination, residual and
+#leave-one-out residual of every station, and the stations flagged as outliers
+TrendResult = collections.namedtuple("TrendResult", ["model", "r_squared", "residual", "loo_residual", "outlier"])
+
+#design matrix of the trend model at station elevations: columns 1, z and
+#max(z - break, 0) per break
+def trendBasis(elevation, breaks=()):
+    elevation = numpy.asarray(elevation, dtype=numpy.float64)
+    columns = [numpy.ones_like(elevation), elevation]
+    for elevation_break in breaks:
+        columns.append(numpy.maximum(elevation - elevation_break, 0.0))
+    return numpy.column_stack(columns)
+
+#evaluate a trend model on an elevation grid (a new array)
+def evaluateTrend(model, elevation):
+    trend = elevation * model.coefficients[1] + model.coefficients[0]
+    for elevation_break, slope_change in zip(model.breaks, model.coefficients[2:]):
+        trend += slope_change * numpy.maximum(elevation - elevation_break, 0.0)
+    return trend
+
+#weighted least-squares coefficients of "values" on the columns of "basis"
+def _leastSquares(basis, values, weights):
+    root_weights = numpy.sqrt(weights)
+    return numpy.linalg.lstsq(basis * root_weights[:, None], values * root_weights, rcond=-1)[0]
+
+#leave-one-out residuals of a weighted least-squares fit: residual / (1 - leverage)
+def _leastSquaresLoo(basis, values, weights, coefficients):
+    inverse = numpy.linalg.pinv(numpy.dot(basis.T, basis * weights[:, None]))
+    leverage = weights * numpy.einsum("ij,jk,ik->i", basis, inverse, basis)
+    residual = values - numpy.dot(basis, coefficients)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(leverage < 1 - 1e-10, residual / (1 - leverage), numpy.nan)
+
+#median absolute deviation scaled to a standard deviation
+def _robustScale(values):
+    return 1.4826 * numpy.median(numpy.abs(values - numpy.median(values)))
+
+#Huber weights of the residuals of a fit
+def _huberWeights(residual):
+    scale = _robustScale(residual)
+    if not scale > 0:
+        return numpy.ones_like(residual)
+    u = numpy.abs(residual) / (HUBER_K * scale)
+    return numpy.where(u <= 1, 1.0, 1.0 / numpy.maximum(u, 1.0))
+
+#Huber M-estimate by iteratively reweighted least squares. Returns the
+#coefficients and the final weights.
+def _huber(basis, values):
+    weights = numpy.ones_like(values)
+    coefficients = _leastSquares(basis, values, weights)
+    for _ in range(HUBER_ITERATIONS):
+        weights = _huberWeights(values - numpy.dot(basis, coefficients))
+        updated = _leastSquares(basis, values, weights)
+        converged = numpy.allclose(updated, coefficients, rtol=HUBER_TOLERANCE, atol=HUBER_TOLERANCE)
+        coefficients = updated
+        if converged:
+            break
+    return coefficients, weights
+
+#median of every row of "values" ignoring NaN (NaN for rows without values)
+def _rowMedians(values):
+    counts = numpy.sum(numpy.isfinite(values), axis=1)
+    medians = numpy.full(values.shape[0], numpy.nan)
+    rows = counts > 0
+    medians[rows] = numpy.nanmedian(values[rows], axis=1)
+    return medians
+
+#medians of a sorted array "ordered" without the positions in each row of
+#"removed" ((rows, k) sorted positions, padded with len(ordered) past the
+#"counts" used in each row; NaN for rows left without values). The element of
+#rank t among the kept ones is at position t + (number of removed positions p_l
+#with p_l - l <= t).
+def _medianWithout(ordered, removed, counts):
+    m = len(ordered)
+    shifted = removed - numpy.arange(removed.shape[1])[None, :]
+    valid = numpy.arange(removed.shape[1])[None, :] < counts[:, None]
+    kept = m - counts
+    medians = numpy.full(len(counts), numpy.nan)
+    rows = kept > 0
+    halves = []
+    for rank in [(kept[rows] - 1) // 2, kept[rows] // 2]:
+        skipped = numpy.sum(valid[rows] & (shifted[rows] <= rank[:, None]), axis=1)
+        halves.append(ordered[rank + skipped])
+    medians[rows] = 0.5 * (halves[0] + halves[1])
+    return medians
+
+#Theil-Sen line (median of the slopes between every pair of stations, median
+#intercept) and its leave-one-out residuals
+def _theilSen(elevation, values):
+    n = len(values)
+    first, second = numpy.triu_indices(n, 1)
+    rise = values[second] - values[first]
+    run = elevation[second] - elevation[first]
+    finite = run != 0
+    first, second = first[finite], second[finite]
+    pair_slopes = rise[finite] / run[finite]
+    order = numpy.argsort(pair_slopes, kind="mergesort")
+    ordered = pair_slopes[order]
+    slope = numpy.median(ordered) if len(ordered) else numpy.nan
+    intercept = numpy.median(values - slope * elevation)
+
+    #the same medians without each station's pairs: the sorted positions of the
+    #pairs of every station, one row per station
+    rank = numpy.empty(len(order), dtype=numpy.int64)
+    rank[order] = numpy.arange(len(order))
+    removed = numpy.full((n, n), len(order), dtype=numpy.int64)
+    removed[first, second] = rank
+    removed[second, first] = rank
+    removed.sort(axis=1)
+    counts = numpy.bincount(first, minlength=n) + numpy.bincount(second, minlength=n)
+    loo_slopes = _medianWithout(ordered, removed, counts)
+    offsets = values[None, :] - loo_slopes[:, None] * elevation[None, :]
+    offsets[numpy.arange(n), numpy.arange(n)] = numpy.nan
+    loo_intercepts = _rowMedians(offsets)
+    return numpy.array([intercept, slope]), values - (loo_slopes * elevation + loo_intercepts)
+
+#break elevations of the piecewise fit: PIECEWISE_BANDS bands split at station
+#elevation quantiles, fewer if a band would hold less than MIN_BAND_STATIONS
+def bandBreaks(elevation):
+    bands = min(PIECEWISE_BANDS, len(elevation) // MIN_BAND_STATIONS)
+    if bands < 2:
+        return []
+    return [float(value) for value in numpy.percentile(elevation, 100.0 * numpy.arange(1, bands) / bands)]
+
+#stations whose leave-one-out residual has a robust z-score above OUTLIER_THRESHOLD
+def flagOutliers(loo_residual):
+    finite = numpy.isfinite(loo_residual)
+    outlier = numpy.zeros(len(loo_residual), dtype=bool)
+    if numpy.count_nonzero(finite) < 3:
+        return outlier
+    scale = _robustScale(loo_residual[finite])
+    if scale > 0:
+        z = numpy.abs(loo_residual[finite] - numpy.median(loo_residual[finite])) / scale
+        outlier[finite] = z > OUTLIER_THRESHOLD
+    return outlier
+
+#TrendResult of too few stations to fit (see MIN_TREND_STATIONS): NaN
+#coefficients, residuals and r-squared, so the trend and every grid made from it
+#are no-data
+def missingTrend(method, values):
+    missing = numpy.full(len(values), numpy.nan)
+    return TrendResult(TrendModel(method, numpy.full(2, numpy.nan), []), numpy.nan, missing, missing.copy(),
+                       numpy.zeros(len(values), dtype=bool))
+
+#fit "values" against "elevation" (one per station, all finite) with a method in
+#TREND_METHODS. "breaks" sets the band edges of the piecewise fit (see
+#bandBreaks by default). Returns a TrendResult, or a missingTrend for fewer
+#than MIN_TREND_STATIONS stations.
+def fitTrend(elevation, values, method="ols", breaks=None):
+    elevation = numpy.asarray(elevation, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if method not in TREND_METHODS:
+        raise ValueError("unknown trend method: " + str(method))
+    if len(values) < MIN_TREND_STATIONS:
+        return missingTrend(method, values)
+    if method == "piecewise":
+        breaks = bandBreaks(elevation) if breaks is None else sorted(float(value) for value in breaks)
+    else:
+        breaks = []
+    basis = trendBasis(elevation, breaks)
+
+    if method == "theil_sen" and len(values) >= 3:
+        coefficients, loo_residual = _theilSen(elevation, values)
+    elif method == "huber":
+        coefficients, weights = _huber(basis, values)
+        loo_residual = _leastSquaresLoo(basis, values, weights, coefficients)
+    else:
+        weights = numpy.ones_like(values)
+        coefficients = _leastSquares(basis, values, weights)
+        loo_residual = _leastSquaresLoo(basis, values, weights, coefficients)
+
+    residual = values - numpy.dot(basis, coefficients)
+    total = numpy.sum((values - numpy.mean(values))**2)
+    r_squared = 1.0 - numpy.sum(residual**2) / total if total > 0 else 0.0
+    return TrendResult(TrendModel(method, coefficients, breaks), r_squared, residual, loo_residual,
+                       flagOutliers(loo_residual))
+
+#TrendResult of "values" against a model fitted elsewhere (e.g. a cached or
+#smoothed model, see trendSeries). Nothing is refitted, so the leave-one-out
+#residuals are the plain residuals and the outliers are flagged from those.
+def applyTrend(model, elevation, values):
+    elevation = numpy.asarray(elevation, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.float64)
+    residual = values - evaluateTrend(model, elevation)
+    total = numpy.sum((values - numpy.mean(values))**2) if len(values) > 0 else 0.0
+    r_squared = 1.0 - numpy.sum(residual**2) / total if total > 0 else 0.0
+    return TrendResult(model, r_squared, residual, residual, flagOutliers(residual))
+
+#variances of the coefficients of a model from its residuals at the station
+#elevations (the least-squares standard errors squared; infinite if there are
+#no more stations than coefficients)
+def coefficientVariances(model, elevation, residual):
+    basis = trendBasis(elevation, model.breaks)
+    n, p = basis.shape
+    if n <= p:
+        return numpy.full(p, numpy.inf)
+    variance = numpy.sum(numpy.asarray(residual, dtype=numpy.float64)**2) / (n - p)
+    return variance * numpy.diag(numpy.linalg.pinv(numpy.dot(basis.T, basis)))
+
+'''=======References======='''
+#Theil, H. (1950). A rank-invariant method of linear and polynomial regression
+#   analysis. Indagationes Mathematicae, 12, 85-91.
+#Sen, P. K. (1968). Estimates of the regression coefficient based on Kendall's
+#   tau. Journal of the American Statistical Association, 63, 1379-1389.
+#Huber, P. J. (1964). Robust estimation of a location parameter. The Annals of
+#   Mathematical Statistics, 35, 73-101.
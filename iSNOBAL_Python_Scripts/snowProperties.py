@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: snowProperties
+# Purpose: Initial snowcover properties (average snowcover density, active
+#          (upper) snow layer temperature and average snowcover temperature)
+#          interpolated linearly from elevation.
+# Input: elevation array
+# Output: snow density, upper layer temperature and average snowcover
+#         temperature arrays
+# Used in: 1- createInitialSnowPropertiesRasters
+#          2- forcingPipeline
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+
+'''======Define internal functions======'''
+#names of the snow property grids, in the order snowProperties returns them
+SNOW_PROPERTY_GRIDS = ["snow_density", "upper_layer_snow_temperature", "average_snowcover_temperature"]
+
+#snow properties of an elevation grid (or tile of one), keyed by grid name
+def snowProperties(elevation):
+    #Density Equation: y = -0.0395(elevation) + 405.26
+    snow_density = -0.0395 * elevation + 405.26
+
+    #Upper Layer Temperature Equation: y = -0.0008(elevation) + 0.1053
+    upper_layer_temperature = -0.0008 * elevation + 0.1053
+
+    #lower layer temperature equation: y = -0.0008(elevation) + 1.3056
+    lower_layer_temperature = -0.0008 * elevation + 1.3056
+
+    #average snowcover temperature is the average of the upper and lower layer temperatures
+    average_snowcover_temperature = (upper_layer_temperature + lower_layer_temperature) / 2.0
+
+    return collections.OrderedDict([("snow_density", snow_density),
+                                    ("upper_layer_snow_temperature", upper_layer_temperature),
+                                    ("average_snowcover_temperature", average_snowcover_temperature)])
+
+'''=======References======='''
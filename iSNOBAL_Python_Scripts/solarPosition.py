@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: solarPosition
+# Purpose: Array-based sun position. Declination, hour angle, zenith and
+#          azimuth are computed for arrays of timestamps and coordinates in one
+#          vectorized call (inputs broadcast against each other), e.g. every
+#          station at every hour of a run with timestamps of shape (hours, 1)
+#          and station coordinates of shape (stations,).
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- clearSky
+#
+# Note: Uses the NOAA fractional-year approximations (errors of a few minutes
+#       of time in the hour angle, well under a degree in zenith), which is far
+#       cheaper than building an ephem.Observer per point as in temp.py/temp2.py.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import numpy
+
+'''======Define internal functions======'''
+#local standard time of the station data, hours from UTC (Mountain Standard Time)
+UTC_OFFSET = -7.0
+
+#Sun position (radians): declination, hour angle (0 at solar noon, negative in
+#the morning), zenith, and azimuth clockwise from north
+SunPosition = collections.namedtuple("SunPosition", ["declination", "hour_angle", "zenith", "azimuth"])
+
+#day of the year (1-366), hours since midnight and length of the year (days) of
+#an array of timestamps
+def _timeParts(date_times):
+    date_times = numpy.asarray(date_times, dtype="datetime64[s]")
+    days = date_times.astype("datetime64[D]")
+    years = date_times.astype("datetime64[Y]")
+    day_of_year = (days - years.astype("datetime64[D]")).astype(numpy.float64) + 1
+    hours = (date_times - days).astype(numpy.float64) / 3600.0
+    year_length = ((years + 1).astype("datetime64[D]") - years.astype("datetime64[D]")).astype(numpy.float64)
+    return day_of_year, hours, year_length
+
+#sun position at "date_times" (datetimes or numpy.datetime64, in local standard
+#time "utc_offset" hours from UTC) seen from "longitude"/"latitude" (degrees,
+#east/north positive)
+def sunPosition(date_times, longitude, latitude, utc_offset=UTC_OFFSET):
+    day_of_year, hours, year_length = _timeParts(date_times)
+    longitude = numpy.asarray(longitude, dtype=numpy.float64)
+    phi = numpy.radians(latitude)
+
+    #fractional year (radians)
+    gamma = 2 * numpy.pi / year_length * (day_of_year - 1 + (hours - 12) / 24.0)
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * numpy.cos(gamma) - 0.032077 * numpy.sin(gamma)
+                                 - 0.014615 * numpy.cos(2 * gamma) - 0.040849 * numpy.sin(2 * gamma))
+    declination = (0.006918 - 0.399912 * numpy.cos(gamma) + 0.070257 * numpy.sin(gamma)
+                   - 0.006758 * numpy.cos(2 * gamma) + 0.000907 * numpy.sin(2 * gamma)
+                   - 0.002697 * numpy.cos(3 * gamma) + 0.00148 * numpy.sin(3 * gamma))
+
+    #true solar time (minutes) and hour angle
+    solar_minutes = hours * 60 + equation_of_time + 4 * longitude - 60 * utc_offset
+    hour_angle = numpy.radians((solar_minutes / 4.0) % 360 - 180)
+
+    cos_zenith = numpy.sin(phi) * numpy.sin(declination) + \
+                 numpy.cos(phi) * numpy.cos(declination) * numpy.cos(hour_angle)
+    zenith = numpy.arccos(numpy.clip(cos_zenith, -1.0, 1.0))
+    azimuth = numpy.arctan2(-numpy.cos(declination) * numpy.sin(hour_angle),
+                            numpy.sin(declination) * numpy.cos(phi) -
+                            numpy.cos(declination) * numpy.sin(phi) * numpy.cos(hour_angle)) % (2 * numpy.pi)
+    return SunPosition(declination, hour_angle, zenith, azimuth)
+
+'''=======References======='''
+#NOAA Global Monitoring Division. General solar position calculations.
+#Spencer, J. W. (1971). Fourier series representation of the position of the
+#   sun. Search, 2, 172.
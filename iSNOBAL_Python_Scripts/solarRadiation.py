@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: solarRadiation
+# Purpose: Helpers for estimating a clear-sky solar radiation grid with the
+#          NumPy clear-sky model (clearSky) and correcting it to observed
+#          station data. The observed/simulated ratios are read from the grid
+#          cells under the stations and either averaged or spread over the grid.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createSolarRadiationRaster
+#          2- forcingSeries
+#          3- forcingPipeline
+#          4- createForcingRasters
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import arcpy
+import numpy
+
+import clearSky
+import detrendedKriging
+import gridTools
+
+'''======Define internal functions======'''
+#latitude and longitude (degrees) of the center of a grid
+def gridCenterLatLon(grid, spatial_reference):
+    center = arcpy.PointGeometry(arcpy.Point(grid.x_min + 0.5 * grid.n_cols * grid.cell_size,
+                                             grid.y_min + 0.5 * grid.n_rows * grid.cell_size), spatial_reference)
+    geographic = center.projectAs(arcpy.SpatialReference(4326)).firstPoint
+    return geographic.Y, geographic.X
+
+#terrain terms of the clear-sky model for an elevation grid, kept in
+#"terrain_folder" so they are only computed once per elevation grid (keyed by
+#"elevation_key" if given, e.g. the raster's gridIO.rasterSignature)
+def readTerrain(elevation, grid, spatial_reference, terrain_folder, elevation_key=None):
+    latitude, longitude = gridCenterLatLon(grid, spatial_reference)
+    return clearSky.cachedTerrainIndex(elevation, grid, latitude, longitude, terrain_folder,
+                                       elevation_key=elevation_key)
+
+#ways of spreading the station observed/simulated ratios over the grid: one
+#mean ratio, inverse-distance weighting or ordinary kriging of the ratios
+CORRECTION_METHODS = ["mean", "idw", "kriged"]
+
+#power of the inverse-distance weights
+IDW_POWER = 2.0
+
+#rows of the grid evaluated at a time by inverseDistanceWeighting
+BLOCK_ROWS = 256
+
+#observed/simulated ratio at every station, read from the simulated grid cell
+#under the station. Returns the ratios of the stations with an observation and
+#simulated radiation, and the mask of those stations.
+def stationRatios(simulated, grid, station_x, station_y, observed):
+    simulated_at_stations = gridTools.sampleGrid(simulated, grid, station_x, station_y)
+    observed = numpy.asarray(observed, dtype=numpy.float64)
+    used = numpy.isfinite(observed) & (simulated_at_stations > 0)
+    return observed[used] / simulated_at_stations[used], used
+
+#inverse-distance weighted surface of station values (a cell holding a station
+#takes that station's value)
+def inverseDistanceWeighting(station_x, station_y, values, grid, power=IDW_POWER):
+    output = numpy.empty((grid.n_rows, grid.n_cols))
+    cell_x = gridTools.columnCenters(grid)
+    for row_start in range(0, grid.n_rows, BLOCK_ROWS):
+        row_stop = min(row_start + BLOCK_ROWS, grid.n_rows)
+        cell_y = gridTools.rowCenters(grid, row_start, row_stop)
+        dx = cell_x[None, :, None] - station_x[None, None, :]
+        dy = cell_y[:, None, None] - station_y[None, None, :]
+        distance = numpy.maximum(numpy.sqrt(dx**2 + dy**2), 1e-6 * grid.cell_size)
+        weights = distance**-power
+        output[row_start:row_stop] = weights.dot(values) / weights.sum(axis=2)
+    return output
+
+#correction factor of the simulated grid from the station ratios: a scalar for
+#"mean", a grid for "idw" and "kriged" (see CORRECTION_METHODS). With no usable
+#station (e.g. at night) the grid is left uncorrected; a spatial method with
+#fewer than two usable stations falls back to the mean. With use_cache=True the
+#kriged factor reuses the cached kriging weights of the station set (see
+#detrendedKriging.krigingWeights).
+def correctionFactor(simulated, grid, station_x, station_y, observed, method="mean", use_cache=False):
+    ratios, used = stationRatios(simulated, grid, station_x, station_y, observed)
+    if len(ratios) == 0:
+        return 1.0
+    if method == "mean" or len(ratios) < 2:
+        return numpy.mean(ratios)
+    station_x = numpy.asarray(station_x, dtype=numpy.float64)[used]
+    station_y = numpy.asarray(station_y, dtype=numpy.float64)[used]
+    if method == "idw":
+        return inverseDistanceWeighting(station_x, station_y, ratios, grid)
+    if method == "kriged":
+        return numpy.maximum(detrendedKriging.krigeResiduals(station_x, station_y, ratios, grid,
+                                                             use_cache=use_cache), 0.0)
+    raise ValueError("unknown solar correction method: " + str(method))
+
+#simulated clear-sky radiation corrected to the station observations
+def correctedRadiation(simulated, grid, station_x, station_y, observed, method="mean", use_cache=False):
+    return simulated * correctionFactor(simulated, grid, station_x, station_y, observed, method, use_cache)
+
+'''=======References======='''
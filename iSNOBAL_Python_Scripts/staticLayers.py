@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: staticLayers
+# Purpose: Store of the static grids of a run (the elevation and view factor
+#          rasters and the terrain terms derived from the elevation grid) as raw
+#          .npy files that are memory-mapped instead of read. A raster is
+#          decoded once into the store; later reads by any tool, timestep or
+#          worker process map the same file, so the processes share its pages
+#          through the operating system's file cache rather than each holding
+#          a decoded copy.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- clearSky
+#          2- forcingSeries
+#          3- createForcingTimeSeries
+#          4- createForcingRasters
+#          5- createAirTemperatureRaster
+#          6- createDewpointTemperatureRaster
+#          7- createVaporPressureRaster
+#          8- createPrecipitationMassRaster
+#          9- createInitialSnowDepthRaster
+#          10- createSoilTemperatureRaster
+#          11- createSolarRadiationRaster
+#
+# Note: Mapped arrays are read-only; code that changes a static grid must copy
+#       it first. A raster is stored again when it changes (see
+#       gridIO.rasterSignature; a raster in a geodatabase with statistics is
+#       not stored again when other datasets are written to the geodatabase),
+#       and the older copy is removed.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import hashlib
+import os
+import shutil
+import numpy
+
+'''======Define internal functions======'''
+#extension of a stored layer
+LAYER_EXTENSION = ".npy"
+
+#save "array" as a raw layer file at "path" (written to a temporary file first, so
+#a process mapping the layer never sees a partial file)
+def saveLayer(array, path):
+    temporary_path = path + "." + str(os.getpid()) + ".tmp"
+    with open(temporary_path, "wb") as layer_file:
+        numpy.save(layer_file, numpy.ascontiguousarray(array))
+    try:
+        os.rename(temporary_path, path)
+    except OSError:
+        #another process stored the same layer first
+        os.remove(temporary_path)
+        if not os.path.exists(path):
+            raise
+
+#memory-map a layer saved by saveLayer (read-only)
+def loadLayer(path):
+    return numpy.load(path, mmap_mode="r")
+
+#save a set of layers ({name: array}) as the folder "path", one file per layer
+#(written to a temporary folder first)
+def saveLayers(arrays, path):
+    temporary_path = path + "." + str(os.getpid()) + ".tmp"
+    os.makedirs(temporary_path)
+    for name, array in arrays.items():
+        numpy.save(os.path.join(temporary_path, name + LAYER_EXTENSION), numpy.ascontiguousarray(array))
+    try:
+        os.rename(temporary_path, path)
+    except OSError:
+        #another process stored the same layers first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+#memory-map the layers of a folder saved by saveLayers: {name: array}
+def loadLayers(path):
+    return dict((name[:-len(LAYER_EXTENSION)], loadLayer(os.path.join(path, name)))
+                for name in os.listdir(path) if name.endswith(LAYER_EXTENSION))
+
+#remove the layers in "directory" that start with "prefix" other than "keep"
+#(files still mapped by another process on Windows are left for a later run)
+def _removeOlder(directory, prefix, keep):
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(LAYER_EXTENSION) and name != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+#grid of a raster as a memory-mapped array ("no-data" cells are numpy.nan),
+#stored in "directory" the first time the raster is read. Returns (array,
+#GridSpec, spatial reference) like gridIO.readRaster.
+def readStaticRaster(raster_path, directory):
+    import gridIO
+    grid, spatial_reference = gridIO.describeRaster(raster_path)
+    prefix = "static_" + hashlib.sha1(os.path.abspath(raster_path).encode("utf-8")).hexdigest()[:16] + "_"
+    name = prefix + gridIO.rasterSignature(raster_path)[:16] + LAYER_EXTENSION
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        saveLayer(gridIO.readRaster(raster_path)[0], path)
+        _removeOlder(directory, prefix, name)
+    return loadLayer(path), grid, spatial_reference
+
+'''=======References======='''
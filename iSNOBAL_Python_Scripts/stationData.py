@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: stationData
+# Purpose: Columnar store of the station observation table. The table is read
+#          once into one (timesteps, stations) array per field, indexed by
+#          timestamp and site_key, so the values of a timestep and the mean of
+#          each station over any time window are lookups instead of table
+#          scans. A store can be saved to and loaded from a compressed .npz
+#          file so later runs skip the table read.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createAirTemperatureRaster
+#          2- createDewpointTemperatureRaster
+#          3- createVaporPressureRaster
+#          4- createPrecipitationMassRaster
+#          5- createInitialSnowDepthRaster
+#          6- createSoilTemperatureRaster
+#          7- createDetrendedKrigingRasters
+#          8- createForcingTimeSeries
+#          9- forcingSeries
+#          10- createSolarRadiationRaster
+#          11- createForcingRasters
+#          12- createWindSpeedRaster
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import datetime
+import numpy
+
+'''======Define internal functions======'''
+#Columnar station data
+#   site_keys: sorted site keys (columns)
+#   times: sorted timestamps (rows, numpy.datetime64[s]); a table without a time
+#          field has a single row
+#   values: {field: (times, stations) float32 array, numpy.nan where missing}
+#   time_index: {datetime: row}
+#   site_index: {site_key: column}
+#   cumulative_sums/cumulative_counts: {field: (times + 1, stations) running sums
+#          and counts of the observed values, for window means}
+StationStore = collections.namedtuple("StationStore", ["site_keys", "times", "values", "time_index", "site_index",
+                                                       "cumulative_sums", "cumulative_counts"])
+
+#build a store from columns: site keys, timestamps (None for a table without a
+#time field) and {field: values} (None or numpy.nan where missing). Several
+#rows for the same station and timestep are averaged.
+def buildStore(site_key_column, time_column, field_columns):
+    site_keys, site_of_row = numpy.unique(numpy.asarray(site_key_column), return_inverse=True)
+    if time_column is None:
+        times = numpy.array([numpy.datetime64("NaT", "s")])
+        time_of_row = numpy.zeros(len(site_of_row), dtype=numpy.int64)
+    else:
+        times, time_of_row = numpy.unique(numpy.asarray(time_column, dtype="datetime64[s]"), return_inverse=True)
+
+    values = {}
+    for field, column in field_columns.items():
+        column = numpy.array(column, dtype=numpy.float64)
+        observed = numpy.isfinite(column)
+        sums = numpy.zeros((len(times), len(site_keys)))
+        counts = numpy.zeros((len(times), len(site_keys)))
+        numpy.add.at(sums, (time_of_row[observed], site_of_row[observed]), column[observed])
+        numpy.add.at(counts, (time_of_row[observed], site_of_row[observed]), 1)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            values[field] = (sums / counts).astype(numpy.float32)
+    return _indexStore(site_keys, times, values)
+
+#add the lookup indexes and running sums to a store's arrays
+def _indexStore(site_keys, times, values):
+    time_index = dict((time, row) for row, time in enumerate(times.astype(datetime.datetime).tolist()))
+    site_index = dict((key, column) for column, key in enumerate(site_keys.tolist()))
+    cumulative_sums = {}
+    cumulative_counts = {}
+    for field, field_values in values.items():
+        observed = numpy.isfinite(field_values)
+        cumulative_sums[field] = numpy.zeros((len(times) + 1, len(site_keys)))
+        cumulative_counts[field] = numpy.zeros((len(times) + 1, len(site_keys)))
+        numpy.cumsum(numpy.where(observed, field_values, 0), axis=0, out=cumulative_sums[field][1:])
+        numpy.cumsum(observed, axis=0, out=cumulative_counts[field][1:])
+    return StationStore(site_keys, times, values, time_index, site_index, cumulative_sums, cumulative_counts)
+
+#parse a "M/D/YYYY H:MM:SS AM" date/time string into a datetime
+def parseDateTime(date_time):
+    dateParts = date_time.split("/")
+    strMonth = dateParts[0]
+    strDay = dateParts[1]
+    dateParts2 = dateParts[2].split(" ")
+    strYear = dateParts2[0]
+    timeParts = dateParts2[1].split(":")
+    intHour = int(timeParts[0])
+    strMinute = timeParts[1]
+    if dateParts2[2] == "PM" and intHour != 12:
+        intHour = intHour + 12
+    elif dateParts2[2] == "AM" and intHour == 12:
+        intHour = 0
+    return datetime.datetime(int(strYear), int(strMonth), int(strDay), intHour, int(strMinute))
+
+#read the station data table into a store in one pass (arcpy.da.TableToNumPyArray).
+#Set time_field to None for tables without timestamps.
+def ingestTable(data_table, fields, time_field="date_time"):
+    import arcpy
+    table_fields = ["site_key"] + list(fields) + ([time_field] if time_field else [])
+    null_values = dict((field, numpy.nan) for field in fields)
+    where_clause = time_field + " IS NOT NULL" if time_field else None
+    table = arcpy.da.TableToNumPyArray(data_table, table_fields, where_clause, skip_nulls=False,
+                                       null_value=null_values)
+    return buildStore(table["site_key"], table[time_field] if time_field else None,
+                      dict((field, table[field]) for field in fields))
+
+#save a store to a compressed .npz file
+def saveStore(store, path):
+    arrays = {"site_keys": store.site_keys, "times": store.times}
+    for field, field_values in store.values.items():
+        arrays["values_" + field] = field_values
+    numpy.savez_compressed(path, **arrays)
+
+#load a store saved by saveStore
+def loadStore(path):
+    with numpy.load(path) as arrays:
+        values = dict((name[len("values_"):], arrays[name]) for name in arrays.files if name.startswith("values_"))
+        return _indexStore(arrays["site_keys"], arrays["times"], values)
+
+#column of each site key in the store (-1 for sites without data)
+def siteColumns(store, site_keys):
+    return numpy.array([store.site_index.get(key, -1) for key in site_keys], dtype=numpy.int64)
+
+#gather store columns into arrays aligned with "site_keys" (numpy.nan where a
+#station has no data)
+def _alignSites(row_values, columns):
+    aligned = numpy.full(len(columns), numpy.nan)
+    has_data = columns >= 0
+    aligned[has_data] = row_values[columns[has_data]]
+    return aligned
+
+#values of every field at one timestep, aligned with "site_keys". Returns
+#{field: array}, or None if the table has no rows for the timestep.
+def timestepValues(store, date_time, site_keys, fields=None):
+    row = store.time_index.get(date_time)
+    if row is None:
+        return None
+    columns = siteColumns(store, site_keys)
+    return dict((field, _alignSites(store.values[field][row], columns)) for field in (fields or store.values))
+
+#mean of each field for each station over the timesteps from "start" to "end"
+#(inclusive; the whole table by default), aligned with "site_keys". Returns
+#{field: array}; stations without data get numpy.nan.
+def stationMeans(store, site_keys, fields=None, start=None, end=None):
+    first = 0 if start is None else int(numpy.searchsorted(store.times, numpy.datetime64(start, "s"), side="left"))
+    last = len(store.times) if end is None else int(numpy.searchsorted(store.times, numpy.datetime64(end, "s"), side="right"))
+    columns = siteColumns(store, site_keys)
+    means = {}
+    for field in (fields or store.values):
+        sums = store.cumulative_sums[field][last] - store.cumulative_sums[field][first]
+        counts = store.cumulative_counts[field][last] - store.cumulative_counts[field][first]
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means[field] = _alignSites(sums / counts, columns)
+    return means
+
+#calculate the mean of each field for each station over the whole data table
+#(equivalent to Statistics_analysis MEAN grouped by site_key). Returns {field:
+#array aligned with site_keys}.
+def readStationMeans(data_table, site_keys, fields):
+    return stationMeans(ingestTable(data_table, fields, time_field=None), site_keys, fields)
+
+'''=======References======='''
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: stationIndex
+# Purpose: Station-to-grid index of an elevation grid. Each station's cell
+#          (row/column), its four bilinear interpolation cells and weights, and
+#          its elevation are computed once and saved, so sampling any grid
+#          aligned with the elevation grid at the stations is NumPy indexing.
+#          The saved index is keyed by the station locations and the elevation
+#          raster's signature (its path, extent, cell size and files, see
+#          gridIO.rasterSignature), so it is rebuilt whenever either one changes
+#          without reading the elevation grid to find out.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createAirTemperatureRaster
+#          2- createDewpointTemperatureRaster
+#          3- createVaporPressureRaster
+#          4- createPrecipitationMassRaster
+#          5- createInitialSnowDepthRaster
+#          6- createSoilTemperatureRaster
+#          7- createDetrendedKrigingRasters
+#          8- forcingSeries
+#          9- createForcingRasters
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import hashlib
+import os
+import numpy
+
+import gridTools
+
+'''======Define internal functions======'''
+#Station-to-grid index
+#   site_keys, x, y: stations in the order of the station feature class
+#   row, col: cell under each station (-1 for stations off the grid)
+#   bilinear_rows, bilinear_cols, bilinear_weights: (stations, 4) cells and
+#          weights of bilinear interpolation between cell centers
+#   elevation: elevation of the cell under each station (numpy.nan off the grid),
+#          as ExtractValuesToPoints without interpolation
+#   key: hash of the stations and elevation grid the index was built for
+StationIndex = collections.namedtuple("StationIndex", ["site_keys", "x", "y", "row", "col", "bilinear_rows",
+                                                       "bilinear_cols", "bilinear_weights", "elevation", "key"])
+
+#bilinear interpolation cells and weights of points between the cell centers of
+#"grid" (points within half a cell of the edge use the edge cells)
+def bilinearCells(grid, x, y):
+    col_position = numpy.clip((x - grid.x_min) / grid.cell_size - 0.5, 0, grid.n_cols - 1)
+    row_position = numpy.clip((gridTools.gridYMax(grid) - y) / grid.cell_size - 0.5, 0, grid.n_rows - 1)
+    col0 = numpy.minimum(numpy.floor(col_position).astype(numpy.int64), max(grid.n_cols - 2, 0))
+    row0 = numpy.minimum(numpy.floor(row_position).astype(numpy.int64), max(grid.n_rows - 2, 0))
+    col1 = numpy.minimum(col0 + 1, grid.n_cols - 1)
+    row1 = numpy.minimum(row0 + 1, grid.n_rows - 1)
+    wx = col_position - col0
+    wy = row_position - row0
+    rows = numpy.column_stack([row0, row0, row1, row1])
+    cols = numpy.column_stack([col0, col1, col0, col1])
+    weights = numpy.column_stack([(1 - wy) * (1 - wx), (1 - wy) * wx, wy * (1 - wx), wy * wx])
+    return rows, cols, weights
+
+#build the index of stations on "grid"; "station_elevation" is the elevation of
+#the cell under each station
+def buildStationIndex(site_keys, x, y, grid, station_elevation, key=None):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    row, col = gridTools.pointToCell(grid, x, y)
+    rows, cols, weights = bilinearCells(grid, x, y)
+    return StationIndex(list(site_keys), x, y, row, col, rows, cols, weights,
+                        numpy.asarray(station_elevation, dtype=numpy.float64), key)
+
+#value of the cell under each station (numpy.nan for stations off the grid)
+def sampleNearest(index, array):
+    values = numpy.full(index.row.shape, numpy.nan)
+    inside = index.row >= 0
+    values[inside] = array[index.row[inside], index.col[inside]]
+    return values
+
+#bilinear interpolation of a grid at the stations (numpy.nan for stations off
+#the grid)
+def sampleBilinear(index, array):
+    values = (array[index.bilinear_rows, index.bilinear_cols] * index.bilinear_weights).sum(axis=1)
+    values[index.row < 0] = numpy.nan
+    return values
+
+#save an index to a .npz file
+def saveStationIndex(index, path):
+    numpy.savez(path, site_keys=numpy.array(index.site_keys), x=index.x, y=index.y, row=index.row, col=index.col,
+                bilinear_rows=index.bilinear_rows, bilinear_cols=index.bilinear_cols,
+                bilinear_weights=index.bilinear_weights, elevation=index.elevation, key=index.key)
+
+#load an index saved by saveStationIndex
+def loadStationIndex(path):
+    with numpy.load(path) as arrays:
+        return StationIndex(arrays["site_keys"].tolist(), arrays["x"], arrays["y"], arrays["row"], arrays["col"],
+                            arrays["bilinear_rows"], arrays["bilinear_cols"], arrays["bilinear_weights"],
+                            arrays["elevation"], str(arrays["key"]))
+
+#key of an index: hash of the station keys and locations and the elevation
+#raster's signature (see gridIO.rasterSignature)
+def indexKey(site_keys, x, y, elevation_signature):
+    digest = hashlib.sha1()
+    digest.update(repr([str(key) for key in site_keys]).encode("utf-8"))
+    digest.update(numpy.ascontiguousarray(x, dtype=numpy.float64).tobytes())
+    digest.update(numpy.ascontiguousarray(y, dtype=numpy.float64).tobytes())
+    digest.update(elevation_signature.encode("utf-8"))
+    return digest.hexdigest()
+
+#station index of "station_locations" on "elevation_raster", loaded from
+#"directory" if it was built for the same stations and elevation raster and built
+#and saved there otherwise. Pass the elevation array if it has been read already
+#(the station cells are read from the raster otherwise).
+def readStationIndex(station_locations, elevation_raster, directory, elevation=None):
+    import gridIO
+    site_keys, x, y = gridIO.readStations(station_locations)
+    grid = gridIO.describeRaster(elevation_raster)[0]
+    key = indexKey(site_keys, x, y, gridIO.rasterSignature(elevation_raster))
+    path = os.path.join(directory, "stations_" + key[:16] + ".npz")
+    if os.path.exists(path):
+        return loadStationIndex(path)
+
+    if elevation is None:
+        station_elevation = gridIO.sampleRaster(elevation_raster, x, y)
+    else:
+        station_elevation = gridTools.sampleGrid(elevation, grid, x, y)
+    index = buildStationIndex(site_keys, x, y, grid, station_elevation, key)
+    saveStationIndex(index, path)
+    return index
+
+'''=======References======='''
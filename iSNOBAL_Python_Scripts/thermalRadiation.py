@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: thermalRadiation
+# Purpose: NumPy implementation of the Marks and Dozier (1979) thermal
+#          radiation chain used by createThermalRadiationRaster.
+#          thermalRadiation evaluates equations (4)-(10) as one fused kernel
+#          into a preallocated float32 buffer (with numexpr when it is
+#          installed); thermalRadiationChain keeps the step-by-step version
+#          for reference and benchmarking.
+# Input: elevation, view factor, air temperature and vapor pressure arrays plus
+#        the reference air pressure, air temperature and elevation and the
+#        surface temperature
+# Output: thermal radiation array
+# Used in: 1- forcingSeries
+#          2- createThermalRadiationRaster
+#          3- Benchmarks/benchmarkThermalRadiation
+#          4- forcingPipeline
+#
+# Note: Numbers next to equations correspond to equations in Marks and
+#       Dozier (1979).
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import numpy
+
+#numexpr is optional
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+'''======Define internal functions======'''
+#Constants (See Marks and Dozier (1979), pg. 160)
+g = 9.8
+m = 0.0289
+R = 8.3143
+sigma = 5.6697*10**-8
+epsilon_s = 0.95
+gamma = -0.006
+
+#fused expression used with numexpr (same steps as thermalRadiation below)
+FUSED_EXPRESSION = ("epsilon_sigma * (vp / (T_a + 274.15 + 0.0065 * z))**(1.0/7.0)"
+                    " * (1.0 + lapse * (z - z_m))**term1 * vf * (T_a + 274.15)**4"
+                    " + term4 * (1.0 - vf)")
+
+#incoming longwave radiation for arrays z (elevation), vf (view factor), T_a (air
+#temperature, C) and vp (vapor pressure) and scalars P_m, T_m (C), z_m and T_s (C),
+#computed in one pass into "out" (a new float32 array if not given).
+#
+#The corrected vapor pressure e_prime = rh * e_sprime (6) reduces to vp because
+#e_sprime is computed from T_a, the same as e_sa (see thermalRadiationChain), and
+#the air pressure (10) is P_m * term2**term1, so no saturation vapor pressure, log
+#or exp has to be evaluated per cell.
+def thermalRadiation(z, vf, T_a, vp, P_m, T_m, z_m, T_s, out=None):
+    #convert reference temperatures to Kelvin
+    T_m = T_m + 274.15
+    T_s = T_s + 274.15
+
+    #scalar terms
+    term1 = ((-g*m)/(R*gamma))
+    term4 = epsilon_s * sigma * (T_s ** 4)
+    epsilon_sigma = 1.24 * (P_m / 1013.0) * sigma
+    lapse = gamma / T_m
+
+    if out is None:
+        out = numpy.empty(numpy.shape(z), dtype=numpy.float32)
+
+    if numexpr is not None:
+        return numexpr.evaluate(FUSED_EXPRESSION, out=out, casting="same_kind", local_dict={
+            "z": z, "vf": vf, "T_a": T_a, "vp": vp, "z_m": z_m, "term1": term1, "term4": term4,
+            "epsilon_sigma": epsilon_sigma, "lapse": lapse})
+
+    work = numpy.empty(out.shape, dtype=numpy.float32)
+
+    #(e_prime / T_prime)**(1/7) with T_prime = T_a + 0.0065 * z (4) and e_prime = vp (6)
+    numpy.multiply(z, 0.0065, out=work)
+    work += T_a
+    work += 274.15
+    numpy.divide(vp, work, out=work)
+    numpy.power(work, 1.0/7.0, out=work)
+
+    #P_a / P_m * T_m**term1 = (T_m + gamma * delta_z)**term1 (10)
+    numpy.subtract(z, z_m, out=out)
+    out *= gamma
+    out += T_m
+    numpy.power(out, term1, out=out)
+    work *= out
+
+    #epsilon_a * sigma * T_a**4 * vf (7), (9)
+    numpy.add(T_a, 274.15, out=out)
+    numpy.square(out, out=out)
+    numpy.square(out, out=out)
+    work *= out
+    work *= vf
+    work *= epsilon_sigma / T_m ** term1
+
+    #+ epsilon_s * sigma * T_s**4 * (1 - vf) (9)
+    numpy.subtract(1.0, vf, out=out)
+    out *= term4
+    out += work
+    return out
+
+#incoming longwave radiation computed step by step as in the original arcpy chain
+#of createThermalRadiationRaster (one full-size array per intermediate)
+def thermalRadiationChain(z, vf, T_a, vp, P_m, T_m, z_m, T_s):
+    #convert temperature parameters to Kelvin
+    T_m = T_m + 274.15
+    T_s = T_s + 274.15
+    T_a = T_a + 274.15
+
+    #Correct air temperature and vapor pressure (Marks and Dozier (1979), pg. 164)
+    T_prime = T_a + (0.0065 * z) #(4) corrected air temperature
+    e_sa = 6.11 * 10**((7.5*T_a)/(237.3 + T_a)) #saturated vapor pressure from original air temperature (T_a)
+    e_sprime = 6.11 * 10**((7.5*T_a)/(237.3 + T_a)) #saturated vapor pressure from corrected air temperature (T_prime)
+    rh = vp / e_sa #(5) relative humidity
+    e_prime = rh * e_sprime #(6) corrected vapor pressure
+
+    #Pressure at a given elevation (Marks and Dozier (1979), pg. 168-169)
+    term1 = ((-g*m)/(R*gamma))
+    delta_z = z - z_m
+    term2 = ((T_m + gamma * delta_z)) / T_m
+    lnTerm = numpy.log(term2)
+    expTerm = numpy.exp(term1 * lnTerm)
+    P_a = P_m * expTerm #(10) air pressure
+
+    #effective emissivity (Marks and Dozier (1979), pg. 164)
+    epsilon_a = (1.24 * (e_prime / T_prime)**(1.0/7.0)) * (P_a / 1013.0) #(7)
+
+    #Incoming longwave radiation (Marks and Dozier (1979), pg. 164)
+    term3 = (epsilon_a * sigma * (T_a ** 4)) * vf
+    term4 = epsilon_s * sigma * (T_s ** 4)
+    term5 = (1 - vf)
+    return term3 + (term4 * term5) #(9)
+
+'''=======References======='''
+#Marks, D., and Dozier, J., 1979, A clear-sky longwave radiation model for
+#   remote alpine areas: Archiv für Meteorologie, Geophysik und Bioklimatologie
+#   Serie B, v. 27, p. 159–187, doi: 10.1007/BF02243741.
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: tiledRasters
+# Purpose: Block-by-block evaluation of NumPy map algebra over rasters, so the
+#          memory used by a tool is bounded by the tile size rather than the
+#          size of the basin. For every tile, aligned windows of the input
+#          rasters are read, the outputs are computed and written to disk, and
+#          the tiles are mosaicked into the output rasters at the end.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createThermalRadiationRaster
+#          2- createInitialSnowPropertiesRasters
+#          3- createDetrendedKrigingRasters
+#          4- createPrecipitationPropertiesRasters
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import arcpy
+import os
+import shutil
+import tempfile
+
+import gridIO
+import gridTools
+
+'''======Define internal functions======'''
+#tile edge length in cells (a float64 tile is TILE_SIZE**2 * 8 bytes)
+TILE_SIZE = 1024
+
+#evaluate "function" tile by tile over "grid" and save its outputs as rasters in
+#the current workspace. "input_rasters" is {argument name: raster path} of rasters
+#aligned with the grid; function(tile_grid, **inputs) must return
+#{output name: array} containing every name in "output_names". Returns the output
+#rasters in "output_names" order.
+def evaluateTiled(function, input_rasters, output_names, grid, spatial_reference, tile_size=TILE_SIZE):
+    tile_dir = tempfile.mkdtemp(prefix="tiles_", dir=arcpy.env.scratchFolder)
+    tiles = dict((name, []) for name in output_names)
+    try:
+        for i, window in enumerate(gridTools.tileWindows(grid, tile_size)):
+            tile_grid = gridTools.subGrid(grid, *window)
+            inputs = dict((name, gridIO.readWindow(path, grid, *window)) for name, path in input_rasters.items())
+            outputs = function(tile_grid, **inputs)
+            for name in output_names:
+                tile_raster = os.path.join(tile_dir, name + "_" + str(i) + ".tif")
+                gridIO.saveArray(outputs[name], tile_grid, spatial_reference, tile_raster)
+                tiles[name].append(tile_raster)
+            del inputs, outputs
+
+        #mosaic the tiles of every output into the final raster
+        output_rasters = []
+        for name in output_names:
+            arcpy.MosaicToNewRaster_management(";".join(tiles[name]), arcpy.env.workspace, name, spatial_reference,
+                                               "32_BIT_FLOAT", grid.cell_size, "1")
+            output_rasters.append(arcpy.Raster(os.path.join(arcpy.env.workspace, name)))
+    finally:
+        shutil.rmtree(tile_dir, ignore_errors=True)
+    return output_rasters
+
+'''=======References======='''
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: trendSeries
+# Purpose: Time series of the elevation trend coefficients (lapse rates and
+#          intercepts, see robustRegression) of each kriged variable, kept
+#          beside the outputs of a run as one small .npz file of arrays per
+#          variable: the hour, the coefficients and their variances, r-squared
+#          and the key of the station values each fit was made from. Reruns
+#          reuse the coefficients of the hours whose station values did not
+#          change instead of fitting them again, and the coefficients can be
+#          smoothed over the neighboring hours (a centered rolling mean or a
+#          Kalman smoother) so a few noisy station hours do not swing the
+#          lapse rates from one hour to the next.
+# Input: none (imported by other modules)
+# Output: "<variable>.npz" in the series folder
+# Used in: 1- forcingSeries
+#          2- createForcingTimeSeries
+#
+# Note: An hour is only smoothed with the hours fitted with the same method and
+#       band breaks. The Kalman smoother treats each coefficient as a random
+#       walk observed with the variance of its fit; the variance the walk gains
+#       per hour is estimated from the series itself, so a steady series is
+#       smoothed more than one that really changes.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import datetime
+import os
+import numpy
+
+import buildManifest
+import robustRegression
+
+'''======Define internal functions======'''
+#smoothing methods of the coefficients
+SMOOTHING_METHODS = ["none", "rolling", "kalman"]
+
+#hours on each side of an hour averaged by the rolling smoother
+ROLLING_HOURS = 3
+
+#extension of a variable's series file
+SERIES_EXTENSION = ".npz"
+
+#reference time of the hours of a series
+EPOCH = datetime.datetime(1970, 1, 1)
+
+#most coefficients and band breaks a fit can have (see robustRegression.trendBasis)
+MAX_BREAKS = robustRegression.PIECEWISE_BANDS - 1
+MAX_COEFFICIENTS = 2 + MAX_BREAKS
+
+#variance standing in for "unknown" in the Kalman smoother
+DIFFUSE_VARIANCE = 1e30
+
+#Coefficient series of one variable, one row per hour in time order: hours since
+#EPOCH, station value keys, fit methods, coefficients and their variances and
+#band breaks (NaN padded to MAX_COEFFICIENTS and MAX_BREAKS) and r-squared
+CoefficientSeries = collections.namedtuple("CoefficientSeries", ["hours", "keys", "methods", "coefficients",
+                                                                 "variances", "breaks", "r_squared"])
+
+#hours since EPOCH of a timestep
+def seriesHour(date_time):
+    return (date_time - EPOCH).total_seconds() / 3600.0
+
+#series without any rows
+def emptySeries():
+    return CoefficientSeries(numpy.zeros(0), numpy.zeros(0, dtype="S40"), numpy.zeros(0, dtype="S16"),
+                             numpy.zeros((0, MAX_COEFFICIENTS)), numpy.zeros((0, MAX_COEFFICIENTS)),
+                             numpy.zeros((0, MAX_BREAKS)), numpy.zeros(0))
+
+#series of every variable saved in "folder": {variable: CoefficientSeries}
+#(empty if the folder does not exist yet)
+def openSeries(folder):
+    series = {}
+    if not os.path.isdir(folder):
+        return series
+    for name in os.listdir(folder):
+        if name.endswith(SERIES_EXTENSION):
+            with numpy.load(os.path.join(folder, name)) as arrays:
+                series[name[:-len(SERIES_EXTENSION)]] = CoefficientSeries(
+                    *[arrays[field] for field in CoefficientSeries._fields])
+    return series
+
+#save the series of every variable ({variable: CoefficientSeries}) in "folder",
+#each written to a temporary file first that then replaces the old one (see
+#buildManifest.replaceFile)
+def saveSeries(folder, series):
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    for variable, variable_series in series.items():
+        path = os.path.join(folder, variable + SERIES_EXTENSION)
+        temporary_path = path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_path, "wb") as series_file:
+            numpy.savez(series_file, **variable_series._asdict())
+        buildManifest.replaceFile(temporary_path, path)
+
+#trend model of a row of a series, with "coefficients" in place of the row's
+#own if given (e.g. smoothed ones)
+def rowModel(series, row, coefficients=None):
+    coefficients = series.coefficients[row] if coefficients is None else coefficients
+    breaks = [float(value) for value in series.breaks[row] if numpy.isfinite(value)]
+    method = series.methods[row]
+    if not isinstance(method, str):
+        method = method.decode("ascii")
+    return robustRegression.TrendModel(method, numpy.array(coefficients[:2 + len(breaks)]), breaks)
+
+#saved model of "date_time" if the series has one fitted from the station values
+#hashed into "key" (None otherwise)
+def cachedModel(series, date_time, key):
+    if series is None or len(series.hours) == 0:
+        return None
+    hour = seriesHour(date_time)
+    row = numpy.searchsorted(series.hours, hour)
+    if row < len(series.hours) and series.hours[row] == hour and series.keys[row] == key.encode("ascii"):
+        return rowModel(series, row)
+    return None
+
+#series with rows added for new fits, replacing the rows of the same hours. "fits"
+#is a list of (date_time, key, robustRegression.TrendModel, coefficient
+#variances, r-squared).
+def updateSeries(series, fits):
+    if not fits:
+        return series
+    series = emptySeries() if series is None else series
+    n = len(fits)
+    coefficients = numpy.full((n, MAX_COEFFICIENTS), numpy.nan)
+    variances = numpy.full((n, MAX_COEFFICIENTS), numpy.nan)
+    breaks = numpy.full((n, MAX_BREAKS), numpy.nan)
+    for row, (date_time, key, model, model_variances, r_squared) in enumerate(fits):
+        coefficients[row, :len(model.coefficients)] = model.coefficients
+        variances[row, :len(model_variances)] = model_variances
+        breaks[row, :len(model.breaks)] = model.breaks
+    added = CoefficientSeries(numpy.array([seriesHour(fit[0]) for fit in fits]),
+                              numpy.array([fit[1] for fit in fits], dtype="S40"),
+                              numpy.array([fit[2].method for fit in fits], dtype="S16"),
+                              coefficients, variances, breaks, numpy.array([fit[4] for fit in fits], dtype=float))
+
+    #keep the old rows of the other hours and sort the rows by hour
+    added_hours = numpy.sort(added.hours)
+    kept = added_hours[numpy.minimum(numpy.searchsorted(added_hours, series.hours), n - 1)] != series.hours
+    merged = [numpy.concatenate([old[kept], new]) for old, new in zip(series, added)]
+    order = numpy.argsort(merged[0], kind="mergesort")
+    return CoefficientSeries(*[array[order] for array in merged])
+
+#groups of rows fitted with the same method and band breaks (index arrays in
+#time order)
+def _groups(series):
+    groups = collections.OrderedDict()
+    for row in range(len(series.hours)):
+        groups.setdefault((series.methods[row], series.breaks[row].tobytes()), []).append(row)
+    return [numpy.array(rows) for rows in groups.values()]
+
+#centered rolling mean of the rows of "values" within ROLLING_HOURS of each hour
+#(NaN values left out)
+def _rollingMean(hours, values):
+    finite = numpy.isfinite(values)
+    sums = numpy.vstack([numpy.zeros((1, values.shape[1])), numpy.cumsum(numpy.where(finite, values, 0.0), axis=0)])
+    counts = numpy.vstack([numpy.zeros((1, values.shape[1])), numpy.cumsum(finite, axis=0)])
+    first = numpy.searchsorted(hours, hours - ROLLING_HOURS, side="left")
+    last = numpy.searchsorted(hours, hours + ROLLING_HOURS, side="right")
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(finite, (sums[last] - sums[first]) / (counts[last] - counts[first]), numpy.nan)
+
+#Kalman (Rauch-Tung-Striebel) smoothing of the rows of "values", every column a
+#random walk observed with the row's "variances"
+def _kalmanSmooth(hours, values, variances):
+    observed = numpy.isfinite(values)
+    noise = numpy.where(observed & numpy.isfinite(variances), numpy.minimum(variances, DIFFUSE_VARIANCE),
+                        DIFFUSE_VARIANCE)
+    values = numpy.where(observed, values, 0.0)
+    gaps = numpy.diff(hours)
+
+    #variance the walk gains per hour: mean squared change between hours less
+    #the variance of the two observations
+    with numpy.errstate(invalid="ignore"):
+        changes = numpy.diff(values, axis=0)**2 - noise[1:] - noise[:-1]
+        pairs = observed[1:] & observed[:-1] & (noise[1:] < DIFFUSE_VARIANCE) & (noise[:-1] < DIFFUSE_VARIANCE)
+        drift = numpy.array([numpy.mean(changes[pairs[:, k], k] / gaps[pairs[:, k]]) if numpy.any(pairs[:, k])
+                             else 0.0 for k in range(values.shape[1])])
+    drift = numpy.maximum(numpy.where(numpy.isfinite(drift), drift, 0.0), 1e-12)
+
+    #forward filter
+    n = len(hours)
+    filtered = numpy.zeros_like(values)
+    filtered_variance = numpy.zeros_like(values)
+    predicted_variance = numpy.zeros_like(values)
+    state = numpy.zeros(values.shape[1])
+    state_variance = numpy.full(values.shape[1], DIFFUSE_VARIANCE)
+    for row in range(n):
+        if row > 0:
+            state_variance = state_variance + drift * gaps[row - 1]
+        predicted_variance[row] = state_variance
+        gain = state_variance / (state_variance + noise[row])
+        state = state + gain * (values[row] - state)
+        state_variance = state_variance * noise[row] / (state_variance + noise[row])
+        filtered[row] = state
+        filtered_variance[row] = state_variance
+
+    #backward pass
+    smoothed = filtered.copy()
+    for row in range(n - 2, -1, -1):
+        smoothed[row] = filtered[row] + filtered_variance[row] / predicted_variance[row + 1] * \
+            (smoothed[row + 1] - filtered[row])
+    return numpy.where(numpy.isfinite(smoothed), smoothed, numpy.nan)
+
+#coefficients of every row of a series smoothed over time with a
+#SMOOTHING_METHODS method (columns a row's fit does not have stay NaN)
+def smoothCoefficients(series, smoothing):
+    if smoothing not in SMOOTHING_METHODS:
+        raise ValueError("unknown smoothing method: " + str(smoothing))
+    coefficients = series.coefficients.copy()
+    if smoothing == "none":
+        return coefficients
+    for rows in _groups(series):
+        if smoothing == "rolling":
+            smoothed = _rollingMean(series.hours[rows], series.coefficients[rows])
+        else:
+            smoothed = _kalmanSmooth(series.hours[rows], series.coefficients[rows], series.variances[rows])
+        coefficients[rows] = numpy.where(numpy.isfinite(series.coefficients[rows]), smoothed, numpy.nan)
+    return coefficients
+
+#smoothed models of the timesteps "date_times" (see smoothCoefficients):
+#{date_time: robustRegression.TrendModel} for the ones in the series
+def smoothedModels(series, date_times, smoothing):
+    coefficients = smoothCoefficients(series, smoothing)
+    models = {}
+    for date_time in date_times:
+        hour = seriesHour(date_time)
+        row = numpy.searchsorted(series.hours, hour)
+        if row < len(series.hours) and series.hours[row] == hour:
+            models[date_time] = rowModel(series, row, coefficients[row])
+    return models
+
+'''=======References======='''
+#Rauch, H. E., Tung, F., & Striebel, C. T. (1965). Maximum likelihood estimates
+#   of linear dynamic systems. AIAA Journal, 3, 1445-1450.
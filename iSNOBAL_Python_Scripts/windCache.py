@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: windCache
+# Purpose: Persistent cache of WindNinja velocity grids. For a fixed elevation
+#          grid and vegetation setting the solver's output only depends on the
+#          station winds and the diurnal (time of day and season) terms, so
+#          hours whose binned station speeds and directions, time-of-day bin
+#          and season bin match reuse a solved grid instead of running
+#          WindNinja again.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- windNinja
+#          2- forcingSeries
+#
+# Note: The cache is a folder of .npy files, one per key, kept to at most
+#       "max_entries" files by dropping the least recently used ones.
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import collections
+import hashlib
+import os
+import numpy
+
+'''======Define internal functions======'''
+#bin widths of the cache key: station wind speed (in the station file's units),
+#wind direction (degrees), time of day (hours) and season (days of the year)
+SPEED_BIN = 0.5
+DIRECTION_BIN = 10.0
+TIME_BIN_HOURS = 1
+SEASON_BIN_DAYS = 15
+
+#default number of velocity grids kept in a cache folder
+WIND_CACHE_SIZE = 500
+
+#Cache folder, its size bound and its {"hits": n, "misses": n} counters
+WindCache = collections.namedtuple("WindCache", ["directory", "max_entries", "stats"])
+
+#open (creating it if needed) the cache folder "directory"
+def openCache(directory, max_entries=WIND_CACHE_SIZE):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return WindCache(directory, max_entries, {"hits": 0, "misses": 0})
+
+#cache key of a WindNinja run: binned station speeds and directions (the
+#direction of a calm station is ignored), the names of the stations they belong
+#to if given, time-of-day and season bins of "date_time", and the elevation hash
+#(gridIO.rasterSignature of the elevation raster)
+def windKey(speed, direction, date_time, elevation_hash, stations=None):
+    speed_bins = numpy.rint(numpy.asarray(speed, dtype=numpy.float64) / SPEED_BIN).astype(numpy.int64)
+    direction_bins = numpy.rint(numpy.asarray(direction, dtype=numpy.float64) / DIRECTION_BIN).astype(numpy.int64)
+    direction_bins = numpy.where(speed_bins == 0, 0, direction_bins % int(round(360.0 / DIRECTION_BIN)))
+    time_bin = (date_time.hour * 60 + date_time.minute) // (TIME_BIN_HOURS * 60)
+    season_bin = (date_time.timetuple().tm_yday - 1) // SEASON_BIN_DAYS
+    digest = hashlib.sha1()
+    digest.update(speed_bins.tobytes())
+    digest.update(direction_bins.tobytes())
+    digest.update(repr((time_bin, season_bin, elevation_hash)).encode("utf-8"))
+    if stations is not None:
+        digest.update(repr([str(station) for station in stations]).encode("utf-8"))
+    return digest.hexdigest()
+
+#path of the file holding the velocity grid of a key
+def _entryPath(cache, key):
+    return os.path.join(cache.directory, key + ".npy")
+
+#return the cached velocity grid of a key (None if it is not cached) and count
+#the hit or miss
+def cachedVelocity(cache, key):
+    path = _entryPath(cache, key)
+    if not os.path.exists(path):
+        cache.stats["misses"] += 1
+        return None
+    cache.stats["hits"] += 1
+    #mark the entry as recently used
+    os.utime(path, None)
+    return numpy.load(path).astype(numpy.float64)
+
+#add a velocity grid to the cache, dropping the least recently used entries
+#beyond cache.max_entries. The file is written under a temporary name and then
+#renamed, so processes sharing the folder never read a partial grid.
+def storeVelocity(cache, key, velocity):
+    path = _entryPath(cache, key)
+    temporary_path = path + "." + str(os.getpid()) + ".tmp"
+    with open(temporary_path, "wb") as entry:
+        numpy.save(entry, numpy.asarray(velocity, dtype=numpy.float32))
+    try:
+        os.rename(temporary_path, path)
+    except OSError:
+        #another process stored the same key first
+        os.remove(temporary_path)
+    entries = [os.path.join(cache.directory, f) for f in os.listdir(cache.directory) if f.endswith(".npy")]
+    if len(entries) > cache.max_entries:
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - cache.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                #already dropped by another process
+                pass
+
+#"n hits, n misses (n% reused)" summary of the cache counters
+def cacheSummary(cache):
+    hits = cache.stats["hits"]
+    misses = cache.stats["misses"]
+    reused = 100.0 * hits / (hits + misses) if hits + misses else 0.0
+    return "%d hits, %d misses (%.0f%% reused)" % (hits, misses, reused)
+
+'''=======References======='''
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name: windNinja
+# Purpose: Helpers for running the WindNinja command line interface. Every run
+#          gets its own temporary directory, and the ASCII velocity grid it
+#          writes there is read straight into an array on the elevation grid,
+#          which then carries the elevation raster's spatial reference. The
+#          station file is a point initialization template: for a timestep
+#          with station winds (see StationWinds) a copy with that timestep's
+#          speeds and directions is written into the run's directory.
+# Input: none (imported by other modules)
+# Output: none
+# Used in: 1- createWindSpeedRaster
+#          2- forcingSeries
+#          3- forcingPipeline
+#          4- createForcingRasters
+#-------------------------------------------------------------------------------
+
+#Import necessary modules
+import arcpy
+import collections
+import csv
+import multiprocessing
+import multiprocessing.pool
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy
+
+import gridTools
+import windCache
+
+'''======Define internal functions======'''
+#WindNinja_cli locations, in order of preference
+NINJA_PATHS = ["C:/WindNinja/WindNinja-2.3.0/bin/WindNinja_cli.exe",
+               "C:/WindNinja/WindNinja-2.4.0/bin/WindNinja_cli.exe"]
+
+#solver threads per WindNinja run, retries of a failed run and seconds a run may
+#take before it is killed and retried (see solveVelocitySeries)
+THREADS_PER_JOB = 4
+RETRIES = 2
+TIMEOUT = 3600
+
+#environment variable that overrides NINJA_PATHS (e.g. with a stub solver for testing)
+NINJA_ENVIRONMENT_VARIABLE = "WINDNINJA_CLI"
+
+#data table fields with the wind speed (in the station file's speed units) and
+#direction (degrees) of each station and timestep
+WIND_FIELDS = ["wind_speed", "wind_direction"]
+
+#Winds of the stations at one timestep: site keys (the Station_Name of the
+#station file) and the speeds and directions aligned with them
+StationWinds = collections.namedtuple("StationWinds", ["site_keys", "speed", "direction"])
+
+#return the WindNinja_cli named by NINJA_ENVIRONMENT_VARIABLE, or else the first
+#one in NINJA_PATHS that exists (the last one if none are found)
+def findNinja():
+    if os.environ.get(NINJA_ENVIRONMENT_VARIABLE):
+        return os.environ[NINJA_ENVIRONMENT_VARIABLE]
+    for ninja_path in NINJA_PATHS:
+        if os.path.exists(ninja_path):
+            return ninja_path
+    return NINJA_PATHS[-1]
+
+#True if "data_table" has the WIND_FIELDS and a "date_time" field, so every
+#timestep's station winds can be read from it
+def hasStationWinds(data_table):
+    names = [field.name.lower() for field in arcpy.ListFields(data_table)]
+    return all(name in names for name in WIND_FIELDS + ["date_time"])
+
+#column names of the header line of a point initialization file (names such as
+#"Coord_Sys(PROJCS,GEOGCS)" hold commas inside parentheses, so the line is not
+#split there)
+def stationHeader(line):
+    return [name.strip() for name in re.split(r",(?![^(]*\))", line.strip())]
+
+#header line and station rows of the point initialization file WindNinja is
+#run with for a timestep, with the (Station_Name, Speed, Direction) columns of
+#the rows. With the timestep's "winds" (StationWinds) these are the rows of the
+#"station_file" template whose Station_Name is one of winds.site_keys, with
+#their Speed and Direction set to that station's winds (stations without a
+#speed or direction at the timestep are left out); without them, every row of
+#the station file as it is.
+def stationRows(station_file, winds=None):
+    with open(station_file) as template:
+        header_line = template.readline()
+        rows = list(csv.reader(template))
+    header = [name.lower() for name in stationHeader(header_line)]
+    columns = (header.index("station_name"),
+               [i for i, name in enumerate(header) if name.startswith("speed") and "unit" not in name][0],
+               [i for i, name in enumerate(header) if name.startswith("direction")][0])
+    rows = [row for row in rows if len(row) > max(columns)]
+    if winds is None:
+        return header_line, rows, columns
+    observed = dict((str(key), (float(speed), float(direction) % 360.0))
+                    for key, speed, direction in zip(winds.site_keys, winds.speed, winds.direction)
+                    if numpy.isfinite(speed) and numpy.isfinite(direction))
+    name_column, speed_column, direction_column = columns
+    station_rows = []
+    for row in rows:
+        if row[name_column].strip() in observed:
+            speed, direction = observed[row[name_column].strip()]
+            row[speed_column] = "%.2f" % speed
+            row[direction_column] = "%.1f" % direction
+            station_rows.append(row)
+    return header_line, station_rows, columns
+
+#write the point initialization file of one timestep (see stationRows) to
+#"path". Returns "path"; raises ValueError if no station is left.
+def writeStationFile(station_file, path, winds):
+    header_line, rows, columns = stationRows(station_file, winds)
+    if not rows:
+        raise ValueError("no station of " + station_file + " has a wind observation")
+    with open(path, "w") as station_csv:
+        station_csv.write(header_line.rstrip("\r\n") + "\n")
+        csv.writer(station_csv, lineterminator="\n").writerows(rows)
+    return path
+
+#wind cache key (see windCache.windKey) of the WindNinja run of a timestep,
+#built from the station names, speeds and directions of the point
+#initialization file the run is given (see stationRows)
+def velocityKey(station_file, winds, date_time, elevation_hash):
+    header_line, rows, (name_column, speed_column, direction_column) = stationRows(station_file, winds)
+    return windCache.windKey([float(row[speed_column]) for row in rows],
+                             [float(row[direction_column]) for row in rows], date_time, elevation_hash,
+                             [row[name_column].strip() for row in rows])
+
+#"args" lists the WindNinja parameters that are required for the program to run
+def ninjaArgs(ninja_path, elevation_raster, date_time, station_file, mesh_resolution, num_threads=8):
+    return [ninja_path,
+    "--initialization_method", "pointInitialization",
+    "--num_threads", str(num_threads), #number of threads to use in model run
+    "--elevation_file", elevation_raster, #elevation raster (cannot contain any "no-data" values)
+    "--match_points", "false", #match simulations to points (simulation fails if set to true)
+    "--year", str(date_time.year),
+    "--month", str(date_time.month),
+    "--day", str(date_time.day),
+    "--hour", str(date_time.hour),
+    "--minute", str(date_time.minute),
+    "--mesh_resolution", str(mesh_resolution), #Resolution of model calculations
+    "--vegetation", "brush", #Vegetation type (can be 'grass', 'brush', or 'trees')
+    "--time_zone", "America/Boise", #time zone of target simulation
+    "--diurnal_winds", "true", #consider diurnal cycles in calculations
+    "--write_goog_output", "false", #write kml output (boolean: true/false)
+    "--write_shapefile_output", "false", #write shapefile output (boolean: true/false)
+    "--write_farsite_atm", "false", #write fire behavior file (boolean: true/false)
+    "--write_ascii_output", "true", #write ascii file output (this should always be set to true)
+    "--units_mesh_resolution", "m", #units of resolution of model calculations (should be "m" for meters)
+    "--units_output_wind_height", "m", #units of output wind height
+    "--output_speed_units", "mps",
+    "--output_wind_height", "3",
+    "--wx_station_filename", station_file] #weather station csv file used in point initialization method
+
+#run WindNinja_cli (output is written next to the elevation file in args). The
+#solver's output is sent line by line to "log" (a function taking one line of
+#text; arcpy.AddMessage by default) while it runs, and the solver is killed
+#after "timeout" seconds if one is given. Raises RuntimeError if the solver
+#exits with an error or times out.
+def runWindNinja(args, log=None, timeout=None):
+    log = log or arcpy.AddMessage
+    runfile = subprocess.Popen(args, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+    timed_out = []
+    def kill():
+        timed_out.append(True)
+        runfile.kill()
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        for line in iter(runfile.stdout.readline, b""):
+            log(line.decode("utf-8", "replace").rstrip())
+        runfile.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        runfile.stdout.close()
+    if timed_out:
+        raise RuntimeError("WindNinja timed out after " + str(timeout) + " seconds")
+    if runfile.returncode != 0:
+        raise RuntimeError("WindNinja exited with code " + str(runfile.returncode))
+
+#export the elevation raster to a GeoTIFF in "directory" for WindNinja to read
+def ninjaElevation(elevation_raster, directory):
+    elevation_file = os.path.join(directory, "elevation.tif")
+    arcpy.CopyRaster_management(elevation_raster, elevation_file)
+    return elevation_file
+
+#put the elevation file and its side-car files into "run_dir" (hard links where
+#the platform supports them)
+def _linkElevation(elevation_file, run_dir):
+    directory, name = os.path.split(elevation_file)
+    for f in os.listdir(directory):
+        if f.startswith(name):
+            if hasattr(os, "link"):
+                os.link(os.path.join(directory, f), os.path.join(run_dir, f))
+            else:
+                shutil.copy2(os.path.join(directory, f), run_dir)
+    return os.path.join(run_dir, name)
+
+#read an ESRI ASCII grid into a float64 array ("no-data" cells become numpy.nan).
+#Returns the array and its GridSpec.
+def readAsciiGrid(ascii_file):
+    header = {}
+    with open(ascii_file) as grid_file:
+        for i in range(6):
+            position = grid_file.tell()
+            line = grid_file.readline().split()
+            if not line or not line[0][0].isalpha():
+                grid_file.seek(position)
+                break
+            header[line[0].lower()] = float(line[1])
+        array = numpy.fromstring(grid_file.read(), dtype=numpy.float64, sep=" ")
+    n_rows = int(header["nrows"])
+    n_cols = int(header["ncols"])
+    cell_size = header["cellsize"]
+    x_min = header["xllcorner"] if "xllcorner" in header else header["xllcenter"] - 0.5 * cell_size
+    y_min = header["yllcorner"] if "yllcorner" in header else header["yllcenter"] - 0.5 * cell_size
+    array = array.reshape(n_rows, n_cols)
+    if "nodata_value" in header:
+        array[array == header["nodata_value"]] = numpy.nan
+    return array, gridTools.GridSpec(x_min, y_min, cell_size, n_rows, n_cols)
+
+#run WindNinja for one timestep in its own temporary directory next to
+#"elevation_file" (see ninjaElevation) and return the velocity grid it wrote,
+#placed on "grid" (the elevation grid) cell for cell. With the timestep's
+#"winds" (StationWinds) the stations are initialized with them instead of the
+#station file's winds (see writeStationFile).
+def solveVelocity(ninja_path, elevation_file, date_time, station_file, grid, num_threads=8, log=None, timeout=None,
+                  winds=None):
+    run_dir = tempfile.mkdtemp(prefix="ninja_", dir=os.path.dirname(elevation_file))
+    try:
+        if winds is not None:
+            station_file = writeStationFile(station_file, os.path.join(run_dir, "stations.csv"), winds)
+        args = ninjaArgs(ninja_path, _linkElevation(elevation_file, run_dir), date_time, station_file,
+                         grid.cell_size, num_threads)
+        runWindNinja(args, log, timeout)
+        ascii_files = [f for f in os.listdir(run_dir) if f.endswith("_vel.asc")]
+        if len(ascii_files) != 1:
+            raise RuntimeError("WindNinja wrote " + str(len(ascii_files)) + " velocity grids for " + str(date_time))
+        velocity, velocity_grid = readAsciiGrid(os.path.join(run_dir, ascii_files[0]))
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return gridTools.regridNearest(velocity, velocity_grid, grid)
+
+#number of simultaneous WindNinja runs and solver threads per run for "cores"
+#cores (all of the machine's by default). The solver gains little from more than
+#THREADS_PER_JOB threads, so the cores are shared out between runs instead.
+def jobsAndThreads(cores=None):
+    cores = cores or multiprocessing.cpu_count()
+    threads = min(THREADS_PER_JOB, cores)
+    return max(1, cores // threads), threads
+
+#append lines to a log file from several threads, each line prefixed with the
+#timestep it came from
+def _fileLog(log_file, lock, date_time):
+    def log(line):
+        with lock:
+            log_file.write(str(date_time) + "  " + line + "\n")
+            log_file.flush()
+    return log
+
+#solve one timestep (see solveVelocity), retrying up to "retries" times if the run
+#fails or takes more than "timeout" seconds. Raises the last error if every
+#attempt fails.
+def retriedVelocity(ninja_path, elevation_file, date_time, station_file, grid, num_threads=8, log=None,
+                    timeout=TIMEOUT, retries=RETRIES, winds=None):
+    log = log or arcpy.AddMessage
+    for attempt in range(retries + 1):
+        try:
+            return solveVelocity(ninja_path, elevation_file, date_time, station_file, grid, num_threads, log,
+                                 timeout, winds)
+        except Exception as error:
+            log("attempt " + str(attempt + 1) + " failed: " + str(error))
+            if attempt == retries:
+                raise
+
+#solve one timestep with retries (see retriedVelocity). Returns (date_time,
+#velocity, None) or (date_time, None, error message).
+def _solveWithRetries(ninja_path, elevation_file, date_time, station_file, grid, threads, log, timeout, retries,
+                      winds):
+    try:
+        return date_time, retriedVelocity(ninja_path, elevation_file, date_time, station_file, grid, threads,
+                                          log, timeout, retries, winds), None
+    except Exception as error:
+        return date_time, None, str(error)
+
+#run WindNinja for every timestep in "time_steps", "jobs" runs at a time with
+#"threads" solver threads each (see jobsAndThreads), and yield (date_time,
+#velocity, error) in time order as the runs finish; velocity is None and error
+#the reason when a timestep still fails after "retries" retries (a run taking more
+#than "timeout" seconds is killed and counts as failed). At most "jobs"
+#finished grids wait to be consumed. Solver output goes to "log_path" (the
+#geoprocessing messages if not given). "winds" ({date_time: StationWinds})
+#holds the station winds of the timesteps that have them (see solveVelocity).
+#With a windCache.WindCache, timesteps whose key (see velocityKey) is
+#cached or already being solved reuse that grid, and solved grids are added to
+#the cache.
+def solveVelocitySeries(ninja_path, elevation_file, time_steps, station_file, grid, jobs=None, threads=None,
+                        retries=RETRIES, timeout=TIMEOUT, log_path=None, cache=None, elevation_hash=None, winds=None):
+    default_jobs, default_threads = jobsAndThreads()
+    jobs = jobs or default_jobs
+    threads = threads or default_threads
+    log_file = open(log_path, "a") if log_path else None
+    lock = threading.Lock()
+    pool = multiprocessing.pool.ThreadPool(jobs)
+    #(date_time, key, running job or (velocity, error)) in time order, and the
+    #running job of each key
+    pending = collections.deque()
+    running = {}
+
+    def finish():
+        date_time, key, result = pending.popleft()
+        if isinstance(result, tuple):
+            return (date_time,) + result
+        velocity, error = result.get()[1:]
+        if running.get(key) is result:
+            del running[key]
+            if cache is not None and error is None:
+                windCache.storeVelocity(cache, key, velocity)
+        return date_time, velocity, error
+
+    try:
+        for date_time in time_steps:
+            key = None
+            result = None
+            if cache is not None:
+                key = velocityKey(station_file, (winds or {}).get(date_time), date_time, elevation_hash)
+                if key in running:
+                    cache.stats["hits"] += 1
+                    result = running[key]
+                else:
+                    velocity = windCache.cachedVelocity(cache, key)
+                    if velocity is not None:
+                        result = (velocity, None)
+            if result is None:
+                log = _fileLog(log_file, lock, date_time) if log_file else arcpy.AddMessage
+                result = pool.apply_async(_solveWithRetries, (ninja_path, elevation_file, date_time, station_file,
+                                                              grid, threads, log, timeout, retries,
+                                                              (winds or {}).get(date_time)))
+                if cache is not None:
+                    running[key] = result
+            pending.append((date_time, key, result))
+            if len(pending) > jobs:
+                yield finish()
+        while pending:
+            yield finish()
+    finally:
+        pool.terminate()
+        pool.join()
+        if log_file:
+            log_file.close()
+
+'''=======References======='''